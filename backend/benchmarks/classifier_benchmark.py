@@ -0,0 +1,52 @@
+"""Compare the fast classifier against the original routing helpers.
+
+Run from backend/:
+
+    python -m benchmarks.classifier_benchmark [pdf ...]
+
+Defaults to every PDF in uploads/. Each helper gets a freshly parsed document so
+neither side benefits from tables the other already extracted. The legal check is
+unchanged (the classifier only caches it), so only the financial decision is compared.
+"""
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.document import ParsedDocument
+from services.extraction import contains_financial_tables
+from services import classifier
+
+
+def timed(fn, file_path):
+    with ParsedDocument(file_path) as document:
+        start = time.perf_counter()
+        result = fn(document)
+        return result, time.perf_counter() - start
+
+
+def main(paths):
+    rows = []
+    for path in paths:
+        old_financial, old_financial_s = timed(contains_financial_tables, path)
+        # Bypass the per-document cache so the measured time is the classification itself
+        new_financial, new_financial_s = timed(classifier._classify_financial, path)
+        rows.append((os.path.basename(path), old_financial, new_financial, old_financial_s, new_financial_s))
+
+    print(f"{'document':<40} {'financial old/new':<18} {'old s':>8} {'new s':>8} {'speedup':>8}")
+    for name, old_fin, new_fin, old_s, new_s in rows:
+        speedup = old_s / new_s if new_s else float("inf")
+        marker = "" if old_fin == new_fin else "  <-- differs"
+        print(f"{name[:40]:<40} {str(old_fin):>7}/{str(new_fin):<10} {old_s:8.3f} {new_s:8.3f} {speedup:7.1f}x{marker}")
+
+    agree = sum(1 for row in rows if row[1] == row[2])
+    old_total = sum(row[3] for row in rows)
+    new_total = sum(row[4] for row in rows)
+    print(f"\n{agree}/{len(rows)} financial decisions agree; "
+          f"total {old_total:.3f}s -> {new_total:.3f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob(os.path.join("uploads", "*.pdf"))))
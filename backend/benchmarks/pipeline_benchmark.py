@@ -0,0 +1,162 @@
+"""Offline throughput and latency benchmark of the document pipeline.
+
+Run from backend/:
+
+    python -m benchmarks.pipeline_benchmark [--concurrency 4] [--repeat 3] [--llm-delay 0.2]
+                                             [--all-branches] [--output results.json] [pdf ...]
+
+Defaults to every PDF in uploads/. Each document goes through process_pdf (metadata,
+scanned probe, index, classifiers, LangChainRouter.route and the chosen extractor) with
+deterministic stub backends in place of Gemini, Ollama and TinyLlama, so no network or
+model weights are needed. `--llm-delay` makes every stub call sleep, to approximate model
+latency. With `--all-branches` every branch's extractor is also run on every document.
+
+The result cache, chunk indexes and OCR text layers go to a temporary directory, and the
+result cache, classifier cache and text layers are cleared before every pass, so repeated passes do the full work.
+Per-stage p50/p95, documents/second and peak RSS are printed and written as JSON to
+`--output` for comparison between runs.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep benchmark state out of the real cache and index directories
+_scratch = tempfile.mkdtemp(prefix="pipeline-benchmark-")
+os.environ["RESULT_CACHE_PATH"] = os.path.join(_scratch, "result_cache.db")
+os.environ["INDEX_DIR"] = os.path.join(_scratch, "indexes")
+os.environ["OCR_DIR"] = os.path.join(_scratch, "ocr")
+
+from services import metrics, classifier
+from services.document import ParsedDocument
+from services.pipeline import process_pdf
+from llm_clients import gemini, langchain_router
+from llm_clients.backends import BACKENDS
+from llm_clients.fakes import FakeLLM, FakeTextPipeline, FakeGeminiClient
+
+
+def install_stubs(delay):
+    fake_gemini = FakeGeminiClient(delay=delay)
+    gemini.gemini_client = fake_gemini
+    BACKENDS["gemini"].set_client(fake_gemini)
+    BACKENDS["ollama"].set_client(FakeLLM(delay=delay))
+    BACKENDS["tinyllama"].set_client(FakeTextPipeline(delay=delay))
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_document(run_id, path, all_branches):
+    file_id = f"bench-{run_id}"
+    metrics.start_timeline(file_id)
+    start = time.perf_counter()
+    error = None
+    try:
+        process_pdf(file_id, path)
+    except Exception as e:
+        error = str(e)
+    timeline = metrics.get_timeline(file_id)
+    timeline.append({"stage": "total", "seconds": time.perf_counter() - start})
+
+    if all_branches:
+        with ParsedDocument(path) as document:
+            for branch, (_, extractor, _, _) in langchain_router.BRANCHES.items():
+                started = time.perf_counter()
+                extractor(document)
+                timeline.append({"stage": f"extractor:{branch}", "seconds": time.perf_counter() - started})
+    return {"document": os.path.basename(path), "error": error, "timeline": timeline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the document set")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds each stub LLM call sleeps")
+    parser.add_argument("--all-branches", action="store_true", help="also run every branch extractor on each document")
+    parser.add_argument("--output", default="pipeline_benchmark.json")
+    args = parser.parse_args()
+
+    paths = args.pdfs or sorted(glob.glob(os.path.join("uploads", "*.pdf")))
+    if not paths:
+        parser.error("no PDFs given and none found in uploads/")
+    install_stubs(args.llm_delay)
+
+    runs = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for pass_num in range(args.repeat):
+            # Each pass does the full work instead of reusing the previous pass's results
+            langchain_router.result_cache.clear()
+            classifier.clear_cache()
+            shutil.rmtree(os.environ["OCR_DIR"], ignore_errors=True)
+            jobs = [(pass_num * len(paths) + i, path) for i, path in enumerate(paths)]
+            runs.extend(pool.map(lambda job: run_document(job[0], job[1], args.all_branches), jobs))
+    wall_seconds = time.perf_counter() - start
+
+    samples = {}
+    for run in runs:
+        for entry in run["timeline"]:
+            samples.setdefault(entry["stage"], []).append(entry["seconds"])
+    stages = {
+        name: {
+            "count": len(values),
+            "p50": round(percentile(values, 0.50), 4),
+            "p95": round(percentile(values, 0.95), 4),
+            "total": round(sum(values), 4)
+        }
+        for name, values in sorted(samples.items())
+    }
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "concurrency": args.concurrency,
+            "repeat": args.repeat,
+            "llm_delay": args.llm_delay,
+            "all_branches": args.all_branches,
+            "documents": [os.path.basename(path) for path in paths]
+        },
+        "documents_processed": len(runs),
+        "errors": [{"document": run["document"], "error": run["error"]} for run in runs if run["error"]],
+        "wall_seconds": round(wall_seconds, 3),
+        "documents_per_second": round(len(runs) / wall_seconds, 3) if wall_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages
+    }
+
+    print(f"\n{'stage':<32} {'count':>6} {'p50 s':>9} {'p95 s':>9} {'total s':>9}")
+    for name, row in stages.items():
+        print(f"{name[:32]:<32} {row['count']:>6} {row['p50']:9.4f} {row['p95']:9.4f} {row['total']:9.3f}")
+    print(f"\n{len(runs)} documents in {wall_seconds:.2f}s "
+          f"({report['documents_per_second']} docs/s at concurrency {args.concurrency}); "
+          f"peak RSS {report['peak_rss_mb']} MB; {len(report['errors'])} errors")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from llm_clients.health import health
+
+# Load environment variables
+load_dotenv()
+
+# Comma-separated backend names; backends left out are never loaded and the router skips them
+ENABLED_BACKENDS = [name.strip() for name in os.getenv("ENABLED_BACKENDS", "gemini,ollama,tinyllama").split(",") if name.strip()]
+# Backends to load in the background right after startup instead of on first use
+WARMUP_BACKENDS = [name.strip() for name in os.getenv("WARMUP_BACKENDS", "").split(",") if name.strip()]
+
+_hf_login_lock = threading.Lock()
+_hf_logged_in = False
+
+
+def hf_login():
+    """Log in to the Hugging Face hub once, and only if a token is configured"""
+    global _hf_logged_in
+    with _hf_login_lock:
+        if _hf_logged_in:
+            return
+        token = os.getenv("HF_TOKEN")
+        if token:
+            from huggingface_hub import login
+            login(token=token)
+        _hf_logged_in = True
+
+
+class BackendDisabledError(Exception):
+    """Raised when a disabled backend is asked for its model"""
+
+
+class LazyBackend:
+    """A model client that is built on first use rather than at import time"""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._client = None
+        self._lock = threading.Lock()
+        self.error = None
+        self.load_seconds = None
+
+    @property
+    def enabled(self):
+        return self.name in ENABLED_BACKENDS
+
+    @property
+    def loaded(self):
+        return self._client is not None
+
+    def get(self):
+        """Return the client, loading it on the first call"""
+        if self._client is not None:
+            return self._client
+        if not self.enabled:
+            raise BackendDisabledError(f"Backend '{self.name}' is disabled")
+        with self._lock:
+            if self._client is None:
+                print(f"Loading {self.name} backend...")
+                start = time.perf_counter()
+                try:
+                    self._client = self._loader()
+                    self.error = None
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                print(f"{self.name} backend loaded in {self.load_seconds}s")
+        return self._client
+
+    def set_client(self, client):
+        """Swap in a ready-made client (e.g. a stand-in model for tests or benchmarks)"""
+        with self._lock:
+            self._client = client
+
+    def status(self):
+        return {
+            "enabled": self.enabled,
+            "loaded": self.loaded,
+            "load_seconds": self.load_seconds,
+            "error": self.error
+        }
+
+
+BACKENDS = {}
+
+
+def register(name, loader):
+    backend = LazyBackend(name, loader)
+    BACKENDS[name] = backend
+    return backend
+
+
+def is_enabled(name):
+    return name in ENABLED_BACKENDS
+
+
+def warm_up(names=None):
+    """Load backends in a background thread so startup does not wait on model weights"""
+    names = [name for name in (names if names is not None else WARMUP_BACKENDS) if is_enabled(name)]
+
+    def load_all():
+        for name in names:
+            try:
+                BACKENDS[name].get()
+            except Exception as e:
+                print(f"Warm-up of {name} backend failed: {str(e)}")
+
+    if names:
+        threading.Thread(target=load_all, name="backend-warmup", daemon=True).start()
+
+
+def readiness():
+    """Backend load states and call health; ready once every warm-up backend has loaded"""
+    backends = {name: dict(backend.status(), health=health(name).stats()) for name, backend in BACKENDS.items()}
+    ready = all(
+        BACKENDS[name].loaded for name in WARMUP_BACKENDS
+        if name in BACKENDS and is_enabled(name)
+    )
+    return {"ready": ready, "backends": backends}
@@ -0,0 +1,73 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Collects concurrent requests into batches for one batched model call.
+
+    A batch is sent once `max_batch_size` requests are waiting or `max_wait` seconds have
+    passed since the first one arrived. `run_batch` takes a list of items and returns a
+    list of results in the same order; each caller gets its own result back.
+    """
+
+    def __init__(self, run_batch, max_batch_size, max_wait):
+        self._run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """Queue an item and block until its batch has run"""
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _ensure_thread(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = list(self._run_batch([item for item, _ in batch]))
+                if len(results) != len(batch):
+                    # zip() would silently leave the unmatched callers waiting forever
+                    raise RuntimeError(f"Batch of {len(batch)} items returned {len(results)} results")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "queue_depth": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size
+        }
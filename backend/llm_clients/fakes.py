@@ -0,0 +1,192 @@
+import hashlib
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+
+# Part markers of multi-part map-reduce prompts (see llm_clients/map_reduce.py)
+PART_LINE = re.compile(r"^=== Part (\d+) ===$", re.MULTILINE)
+
+
+class FakeLLM:
+    """Deterministic stand-in for a LangChain LLM, for tests and offline runs.
+
+    Install it with e.g. `ollama_backend.set_client(FakeLLM(delay=0.5))`. Prompts with
+    map-reduce part markers are answered part by part, like a model that follows them,
+    unless `keep_parts` is False. With `error`, every call raises it after the delay, like
+    a failing backend. `prompts` records every prompt received.
+    """
+
+    def __init__(self, delay=0.0, response="# Fake Result\n\n- {chars} characters of prompt", keep_parts=True, error=None):
+        self.delay = delay
+        self.response = response
+        self.keep_parts = keep_parts
+        self.error = error
+        self.calls = 0
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.calls += 1
+        self.prompts.append(prompt)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        numbers = PART_LINE.findall(prompt) if self.keep_parts else []
+        if numbers:
+            sections = re.split(PART_LINE, prompt)[2::2]
+            return "\n\n".join(
+                f"=== Part {number} ===\n" + self.response.format(chars=len(section))
+                for number, section in zip(numbers, sections)
+            )
+        return self.response.format(chars=len(prompt))
+
+    def stream(self, prompt):
+        """The `invoke` response split into word-sized pieces, like a streaming LLM"""
+        text = self.invoke(prompt)
+        yield from re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeTokenizer:
+    """Word-piece tokenizer with the parts of the HF tokenizer API TinyLlama's client uses.
+
+    Token ids are the pieces themselves, so decoding is a plain join.
+    """
+
+    bos_token = "<s>"
+    eos_token = "</s>"
+
+    def __init__(self):
+        self.pad_token = None
+        self.padding_side = "right"
+
+    @property
+    def pad_token_id(self):
+        return self.pad_token
+
+    def __call__(self, text, add_special_tokens=True, **kwargs):
+        ids = re.findall(r"\S+\s*|\s+", text)
+        return {"input_ids": self.build_inputs_with_special_tokens(ids) if add_special_tokens else ids}
+
+    def num_special_tokens_to_add(self, pair=False):
+        return 1
+
+    def build_inputs_with_special_tokens(self, ids):
+        return [self.bos_token] + list(ids)
+
+    def pad(self, encoded, return_tensors=None):
+        rows = encoded["input_ids"]
+        longest = max(len(row) for row in rows)
+        batch = FakeBatch(input_ids=[], attention_mask=[])
+        for row in rows:
+            padding = [self.pad_token] * (longest - len(row))
+            mask = [0] * len(padding)
+            left = self.padding_side == "left"
+            batch["input_ids"].append(padding + list(row) if left else list(row) + padding)
+            batch["attention_mask"].append(mask + [1] * len(row) if left else [1] * len(row) + mask)
+        return batch
+
+    def decode(self, ids, skip_special_tokens=False):
+        special = {self.bos_token, self.eos_token, self.pad_token} if skip_special_tokens else set()
+        return "".join(token for token in ids if token not in special)
+
+    def batch_decode(self, sequences, skip_special_tokens=False):
+        return [self.decode(ids, skip_special_tokens) for ids in sequences]
+
+
+class FakeBatch(dict):
+    """What FakeTokenizer.pad returns, standing in for a BatchEncoding of tensors"""
+
+    def to(self, device):
+        return self
+
+
+class FakeGenerationModel:
+    """Stand-in for a causal LM's generate(): appends the response's tokens to each row"""
+
+    def __init__(self, tokenizer, delay, response, context_tokens):
+        self.tokenizer = tokenizer
+        self.delay = delay
+        self.response = response
+        self.config = SimpleNamespace(max_position_embeddings=context_tokens)
+        self.calls = 0
+
+    def generate(self, input_ids, attention_mask=None, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        outputs = []
+        for row in input_ids:
+            prompt = self.tokenizer.decode(row, skip_special_tokens=True)
+            response = self.tokenizer(self.response.format(chars=len(prompt)), add_special_tokens=False)
+            outputs.append(list(row) + response["input_ids"] + [self.tokenizer.eos_token])
+        return outputs
+
+
+class FakeTextPipeline:
+    """Stand-in for a transformers text-generation pipeline.
+
+    Install it with `tinyllama_backend.set_client(FakeTextPipeline())`. Each batched
+    generate sleeps `delay` seconds once, like a real one.
+    """
+
+    device = "cpu"
+
+    def __init__(self, delay=0.0, response="# Fake Result\n\n- {chars} characters of prompt", context_tokens=2048):
+        self.tokenizer = FakeTokenizer()
+        self.model = FakeGenerationModel(self.tokenizer, delay, response, context_tokens)
+
+    @property
+    def calls(self):
+        return self.model.calls
+
+
+class FakeGeminiClient:
+    """Stand-in for llm_clients.gemini_client.GeminiClient returning a fixed response"""
+
+    def __init__(self, delay=0.0, response="# Fake Result\n\n- {chars} characters of prompt"):
+        self.delay = delay
+        self.response = response
+        self.calls = 0
+
+    def _result(self, payload):
+        chars = sum(len(part.get("text", "")) for part in payload["contents"][0]["parts"])
+        return {"candidates": [{"content": {"parts": [{"text": self.response.format(chars=chars)}]}}]}
+
+    def generate(self, model, payload):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self._result(payload)
+
+    def stream(self, model, payload):
+        yield self.generate(model, payload)
+
+
+class FakeDocument:
+    """Text-only stand-in for services.document.ParsedDocument (no PDF, no fitz)"""
+
+    def __init__(self, page_texts, revision_of=None):
+        self.page_texts = list(page_texts)
+        self.page_count = len(self.page_texts)
+        self.revision_of = revision_of
+        self.lock = threading.RLock()
+        # No scanned pages, so there is never an OCR text layer to load
+        self.ocr_texts = {}
+        self.ocr_layer_loaded = True
+        self.content_hash = hashlib.sha256("\f".join(self.page_texts).encode("utf-8")).hexdigest()
+        # Same fingerprints as ParsedDocument.fingerprint
+        self.page_fingerprints = [
+            hashlib.sha256(re.sub(r"\s+", " ", text).strip().encode("utf-8")).hexdigest()
+            for text in self.page_texts
+        ]
+
+    def searchable_page_texts(self):
+        return list(self.page_texts)
+
+    def retain(self):
+        """Nothing to keep open; present because background extractions call it"""
+
+    def release(self):
+        pass
@@ -1,42 +1,36 @@
 import os
-import base64
-import requests
-from pdf2image import convert_from_path
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
+from services import metrics, token_stream
+from llm_clients.backends import register
+from llm_clients.gemini_client import gemini_client, GeminiError
+from services.ocr import ocr_text_layer
+from services.page_images import encode_pages, pack_pages
+from llm_clients.map_reduce import CHUNK_PREFIX, MAP_REDUCE_WORKERS, reduce_outputs
+from llm_clients.text_extraction import extract_text
+from llm_clients.prompt_builder import register_budget, build_prompt
 
 # Load environment variables
 load_dotenv()
 
-# Function to convert scanned PDF to image and extract with Gemini API (for scanned PDFs)
-def extract_from_scanned_pdf(pdf_path):
-    try:
-        # Convert PDF to image(s)
-        images = convert_from_path(pdf_path)
-        
-        # Convert the first page image to base64
-        def image_to_base64(img):
-            from io import BytesIO
-            buffered = BytesIO()
-            img.save(buffered, format="PNG")
-            return base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-        img_base64 = image_to_base64(images[0])
-
-        API_KEY = os.getenv("GEMINI_API_KEY")
-        url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={API_KEY}"
-
-        payload = {
-            "contents": [{
-                "parts": [
-                    {
-                        "inline_data": {
-                            "mime_type": "image/png",
-                            "data": img_base64
-                        }
-                    },
-                    {
-                        "text":"""Extract all possible tables, the document title, and any important information from this document.
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# Gemini is a remote API; its "model" is the shared pooled HTTP client
+gemini_backend = register("gemini", lambda: gemini_client)
+
+# Documents whose text is longer than this are extracted chunk by chunk (map-reduce)
+GEMINI_CHUNK_CHARS = int(os.getenv("GEMINI_CHUNK_CHARS", "60000"))
+
+register_budget(
+    GEMINI_MODEL,
+    context_tokens=int(os.getenv("GEMINI_CONTEXT_TOKENS", "1000000")),
+    output_tokens=8192,
+    chars_per_token=4.0
+)
+
+# --------------------- PROMPTS ---------------------
+SCANNED_DOCUMENT_PROMPT = """Extract all possible tables, the document title, and any important information from this document.
 
                             Format your response in **Markdown** using these rules:
 
@@ -59,42 +53,8 @@ def extract_from_scanned_pdf(pdf_path):
                             Text: {text}
                             """
 
-                    }
-                ]
-            }]
-        }
-
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            # Extract just the text content from Gemini's response
-            text_content = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-            return {
-                "success": True,
-                "model": "gemini-scanned",
-                "data": text_content  # Return just the text content
-            }
-        else:
-            return {
-                "success": False,
-                "model": "gemini-scanned",
-                "error": f"API Error: {response.status_code}"
-            }
-    except Exception as e:
-        return {
-            "success": False,
-            "model": "gemini-scanned",
-            "error": str(e)
-        }
-
-# Function to handle large documents and route them to the correct Gemini model
-def extract_from_large_document(pdf_path):
-    try:
-        # First extract text from PDF
-        text = extract_text_from_pdf(pdf_path)
-        
-        # Define prompt for large document extraction
-        large_document_prompt = """
+# Prompt for large document extraction
+LARGE_DOCUMENT_PROMPT = """
         Extract all possible tables, the document title, and any important information from this document.
 
             Format your response in **Markdown** using these rules:
@@ -126,35 +86,117 @@ def extract_from_large_document(pdf_path):
         Text: {text}
         """
 
-        API_KEY = os.getenv("GEMINI_API_KEY")
-        url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={API_KEY}"
-
-        payload = {
-            "contents": [{
-                "parts": [
-                    {
-                        "text": large_document_prompt.format(text=text)
-                    }
-                ]
-            }]
-        }
+def _payload(parts):
+    return {
+        "contents": [{
+            "parts": parts
+        }]
+    }
+
+def _response_text(result):
+    # Extract just the text content from Gemini's response
+    return result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
+
+def _prompt_of(parts):
+    return "".join(part.get("text", "") or part.get("inline_data", {}).get("data", "") for part in parts)
+
+def generate(parts, label):
+    """Send content parts to Gemini and return the text of the first candidate.
 
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            # Extract just the text content from Gemini's response
-            text_content = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-            return {
-                "success": True,
-                "model": "gemini-large",
-                "data": text_content  # Return just the text content
-            }
+    While a client is streaming the current job, the text is generated with
+    streamGenerateContent and forwarded token by token; the full text is still returned.
+    """
+    sink = token_stream.current_sink()
+    with metrics.llm_call(label, _prompt_of(parts)):
+        if sink is None:
+            return _response_text(gemini_client.generate(GEMINI_MODEL, _payload(parts)))
+        pieces = []
+        for chunk in gemini_client.stream(GEMINI_MODEL, _payload(parts)):
+            piece = _response_text(chunk)
+            token_stream.emit(sink, piece)
+            pieces.append(piece)
+        return "".join(pieces)
+
+async def agenerate(parts, label):
+    """Async variant of generate() for callers on the event loop"""
+    with metrics.llm_call(label, _prompt_of(parts)):
+        result = await gemini_client.agenerate(GEMINI_MODEL, _payload(parts))
+    return _response_text(result)
+
+async def astream_generate(parts, label):
+    """Yield the text of a Gemini response as it is generated"""
+    with metrics.llm_call(label, _prompt_of(parts)):
+        async for chunk in gemini_client.astream(GEMINI_MODEL, _payload(parts)):
+            piece = _response_text(chunk)
+            if piece:
+                yield piece
+
+
+def scanned_batch_parts(images, first_page, page_texts, prefix=""):
+    """Request parts for consecutive page images starting at `first_page` (1-based)"""
+    parts = []
+    for page_num, image in enumerate(images, first_page):
+        parts.append({"text": f"--- Page {page_num} ---"})
+        parts.append({"inline_data": image})
+    prompt = build_prompt(SCANNED_DOCUMENT_PROMPT, page_texts, GEMINI_MODEL, first_page=first_page)
+    parts.append({"text": prefix + prompt})
+    return parts
+
+# Function to convert scanned PDF pages to images and extract with Gemini API (for scanned PDFs)
+def extract_from_scanned_pdf(document):
+    try:
+        # Text of every page (OCR'd where there is no text layer) goes along with the page images
+        page_texts = ocr_text_layer(document)
+        # Compressed page images, packed into as few requests as the payload budget allows
+        with metrics.stage("encode_images"):
+            batches = pack_pages(encode_pages(document))
+        if not batches:
+            raise ValueError("Document has no pages")
+
+        def extract_batch(batch):
+            first, images = batch
+            last = first + len(images)
+            prefix = ""
+            if len(batches) > 1:
+                prefix = CHUNK_PREFIX.format(first_page=first + 1, last_page=last)
+            return generate(scanned_batch_parts(images, first + 1, page_texts[first:last], prefix), "gemini-scanned")
+
+        if len(batches) == 1:
+            text_content = extract_batch(batches[0])
         else:
-            return {
-                "success": False,
-                "model": "gemini-large",
-                "error": f"API Error: {response.status_code}"
-            }
+            # Several requests: run them concurrently and merge the outputs as map_reduce does
+            chunks = [{"first_page": first + 1, "last_page": first + len(images)} for first, images in batches]
+            with token_stream.muted():
+                with ThreadPoolExecutor(max_workers=MAP_REDUCE_WORKERS) as pool:
+                    futures = [pool.submit(contextvars.copy_context().run, extract_batch, batch) for batch in batches]
+                    outputs = [future.result() for future in futures]
+                text_content = reduce_outputs(
+                    chunks, outputs, lambda prompt: generate([{"text": prompt}], "gemini-scanned")
+                )
+        return {
+            "success": True,
+            "model": "gemini-scanned",
+            "data": text_content  # Return just the text content
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "model": "gemini-scanned",
+            "error": str(e)
+        }
+
+# Function to handle large documents and route them to the correct Gemini model
+def extract_from_large_document(document):
+    try:
+        invoke = lambda prompt: generate([{"text": prompt}], "gemini-large")
+        text_content = extract_text(
+            document, LARGE_DOCUMENT_PROMPT, invoke, GEMINI_CHUNK_CHARS, GEMINI_MODEL, table_fast_path=True
+        )
+        return {
+            "success": True,
+            "model": "gemini-large",
+            "data": text_content  # Return just the text content
+        }
     except Exception as e:
         return {
             "success": False,
@@ -162,30 +204,8 @@ def extract_from_large_document(pdf_path):
             "error": str(e)
         }
 
-# Main function to determine document type and extract content
-def process_document(pdf_path, document_type="scanned"):
-    if document_type == "scanned":
-        print("Processing as scanned PDF with Gemini...")
-        return extract_from_scanned_pdf(pdf_path)
-    elif document_type == "large":
-        print("Processing as large document with Gemini...")
-        return extract_from_large_document(pdf_path)
-
-# Function to extract text from PDF (for large documents)
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
-    return text
-
-def ask_gemini_question(document_text, user_question):
-    """
-    Given the document text and a user question, use Gemini to answer the question based on the document context.
-    """
-    API_KEY = os.getenv("GEMINI_API_KEY")
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={API_KEY}"
-    prompt = f"""
+def build_question_prompt(document_text, user_question):
+    return f"""
     You are an expert assistant. Use the following document to answer the user's question. Be concise and accurate.
     Instructions:
 - Answer ONLY if the information is present in the document.
@@ -199,18 +219,12 @@ def ask_gemini_question(document_text, user_question):
 
     Question: {user_question}
     """
-    payload = {
-        "contents": [{
-            "parts": [
-                {"text": prompt}
-            ]
-        }]
-    }
-    response = requests.post(url, json=payload)
-    if response.status_code == 200:
-        result = response.json()
-        text_content = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '')
-        return text_content
-    else:
-        return f"API Error: {response.status_code}"
 
+async def answer_question(document_text, user_question):
+    """Answer a question from the document text; raises GeminiError when the API fails"""
+    return await agenerate([{"text": build_question_prompt(document_text, user_question)}], "gemini-qa")
+
+async def stream_gemini_answer(document_text, user_question):
+    """Streaming variant of answer_question(), yielding the answer as it is generated"""
+    async for piece in astream_generate([{"text": build_question_prompt(document_text, user_question)}], "gemini-qa"):
+        yield piece
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import httpx
+from dotenv import load_dotenv
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+# Load environment variables
+load_dotenv()
+
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1")
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "10"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+GEMINI_MAX_BACKOFF = float(os.getenv("GEMINI_MAX_BACKOFF", "30"))
+# Requests per minute across the whole process; 0 disables the limiter
+GEMINI_RATE_PER_MINUTE = float(os.getenv("GEMINI_RATE_PER_MINUTE", "60"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeminiError(Exception):
+    """Raised when the Gemini API returns an error response"""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"API Error: {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _is_retryable(exc):
+    if isinstance(exc, GeminiError):
+        return exc.status_code in RETRYABLE_STATUSES
+    return isinstance(exc, httpx.TransportError)
+
+
+class RateLimiter:
+    """Token bucket allowing `rate_per_minute` requests with bursts up to `burst`"""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class GeminiClient:
+    """Shared Gemini HTTP client with a keep-alive connection pool.
+
+    All requests run on one background event loop that owns the pool, the concurrency
+    semaphore and the rate limiter. Worker threads call `generate`; coroutines on another
+    loop (e.g. FastAPI handlers) await `agenerate`. `base_url` can point at a local stub
+    server, or `transport` replace the network, for testing.
+    """
+
+    def __init__(self, base_url=GEMINI_BASE_URL, api_key=None, timeout=GEMINI_TIMEOUT,
+                 connect_timeout=GEMINI_CONNECT_TIMEOUT, max_connections=GEMINI_MAX_CONNECTIONS,
+                 max_concurrency=GEMINI_MAX_CONCURRENCY, max_retries=GEMINI_MAX_RETRIES,
+                 rate_per_minute=GEMINI_RATE_PER_MINUTE, transport=None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.rate_per_minute = rate_per_minute
+        # httpx transport override, e.g. httpx.MockTransport in tests
+        self.transport = transport
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._rate_limiter = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gemini-client", daemon=True).start()
+
+            async def setup():
+                self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, transport=self.transport)
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._rate_limiter = RateLimiter(self.rate_per_minute)
+
+            asyncio.run_coroutine_threadsafe(setup(), loop).result()
+            self._loop = loop
+            return loop
+
+    def url(self, model, method="generateContent"):
+        return f"{self.base_url}/models/{model}:{method}"
+
+    async def _post(self, model, payload):
+        api_key = self.api_key or os.getenv("GEMINI_API_KEY")
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries + 1),
+            wait=self._wait,
+            retry=retry_if_exception(_is_retryable),
+            reraise=True
+        ):
+            with attempt:
+                async with self._semaphore:
+                    await self._rate_limiter.acquire()
+                    response = await self._client.post(self.url(model), params={"key": api_key}, json=payload)
+                if response.status_code != 200:
+                    retry_after = response.headers.get("retry-after")
+                    raise GeminiError(
+                        response.status_code,
+                        float(retry_after) if retry_after and retry_after.isdigit() else None
+                    )
+                return response.json()
+
+    async def _stream_post(self, model, payload, emit):
+        """streamGenerateContent over SSE, calling `emit` with each response chunk's JSON.
+
+        Retries like `_post`, but only until the first chunk has been emitted.
+        """
+        api_key = self.api_key or os.getenv("GEMINI_API_KEY")
+        started = False
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries + 1),
+            wait=self._wait,
+            retry=retry_if_exception(lambda exc: not started and _is_retryable(exc)),
+            reraise=True
+        ):
+            with attempt:
+                async with self._semaphore:
+                    await self._rate_limiter.acquire()
+                    async with self._client.stream(
+                        "POST", self.url(model, "streamGenerateContent"),
+                        params={"key": api_key, "alt": "sse"}, json=payload
+                    ) as response:
+                        if response.status_code != 200:
+                            retry_after = response.headers.get("retry-after")
+                            raise GeminiError(
+                                response.status_code,
+                                float(retry_after) if retry_after and retry_after.isdigit() else None
+                            )
+                        async for line in response.aiter_lines():
+                            if line.startswith("data:"):
+                                started = True
+                                emit(json.loads(line[len("data:"):]))
+
+    @staticmethod
+    def _wait(retry_state):
+        exc = retry_state.outcome.exception()
+        if isinstance(exc, GeminiError) and exc.retry_after is not None:
+            return min(exc.retry_after, GEMINI_MAX_BACKOFF)
+        return wait_exponential_jitter(initial=1, max=GEMINI_MAX_BACKOFF)(retry_state)
+
+    def generate(self, model, payload):
+        """Blocking generateContent call for worker threads; returns the response JSON"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._post(model, payload), loop).result()
+
+    async def agenerate(self, model, payload):
+        """generateContent call awaitable from any event loop"""
+        loop = self._ensure_loop()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._post(model, payload), loop))
+
+    def stream(self, model, payload):
+        """Blocking generator over streamGenerateContent chunks for worker threads"""
+        loop = self._ensure_loop()
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._stream_post(model, payload, chunks.put), loop)
+        future.add_done_callback(lambda _: chunks.put(None))
+        while (chunk := chunks.get()) is not None:
+            yield chunk
+        future.result()
+
+    async def astream(self, model, payload):
+        """streamGenerateContent chunks as an async generator usable from any event loop"""
+        loop = self._ensure_loop()
+        caller_loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        emit = lambda chunk: caller_loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        future = asyncio.run_coroutine_threadsafe(self._stream_post(model, payload, emit), loop)
+        future.add_done_callback(lambda _: emit(None))
+        try:
+            while (chunk := await chunks.get()) is not None:
+                yield chunk
+            future.result()
+        finally:
+            # The client went away mid-stream: stop reading from Gemini
+            future.cancel()
+
+    def close(self):
+        with self._start_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+# Shared client used by llm_clients/gemini.py
+gemini_client = GeminiClient()
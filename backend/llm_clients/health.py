@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import deque
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Extractions per backend kept for the rolling latency and error rate
+HEALTH_WINDOW = int(os.getenv("HEALTH_WINDOW", "50"))
+# Consecutive failures that open a backend's circuit breaker
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+# Seconds an open breaker waits before letting one trial call through
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BackendHealth:
+    """Rolling latency/error statistics and a circuit breaker for one backend.
+
+    The breaker opens after `failures` consecutive failed calls. Once `cooldown` seconds
+    have passed, a single trial call is allowed (half-open): success closes the breaker,
+    failure opens it for another cooldown.
+    """
+
+    def __init__(self, name, window=HEALTH_WINDOW, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        # Latencies of successful calls and outcomes of all calls, newest last
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._state = CLOSED
+        self._opened_at = None
+        self._trial_running = False
+
+    def record(self, success, seconds):
+        with self._lock:
+            self._outcomes.append(success)
+            self._trial_running = False
+            if success:
+                self._latencies.append(seconds)
+                self._consecutive_failures = 0
+                self._state = CLOSED
+                return
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failures:
+                if self._state != OPEN:
+                    print(f"Circuit breaker for {self.name} backend opened")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """End a call whose outcome is not recorded, so a half-open breaker can try again"""
+        with self._lock:
+            self._trial_running = False
+
+    def allow(self):
+        """Whether a call may be sent to this backend now"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def percentile(self, fraction):
+        """Latency percentile of recent successful calls, or None without samples"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    @property
+    def samples(self):
+        return len(self._latencies)
+
+    def stats(self):
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                "state": self._state,
+                "calls": calls,
+                "error_rate": round(self._outcomes.count(False) / calls, 3) if calls else 0.0,
+                "p50_seconds": round(p50, 3) if p50 is not None else None,
+                "p95_seconds": round(p95, 3) if p95 is not None else None,
+                "consecutive_failures": self._consecutive_failures
+            }
+
+
+# backend name -> BackendHealth
+HEALTH = {}
+_health_lock = threading.Lock()
+
+
+def health(name):
+    with _health_lock:
+        if name not in HEALTH:
+            HEALTH[name] = BackendHealth(name)
+        return HEALTH[name]
+
+
+def snapshot():
+    """stats() of every backend that has been called, by name"""
+    with _health_lock:
+        backends = dict(HEALTH)
+    return {name: backend.stats() for name, backend in backends.items()}
@@ -1,26 +1,227 @@
+import contextvars
+import os
+import queue
+import threading
+import time
 from langchain_core.runnables import RunnableLambda, RunnableBranch
-from llm_clients.gemini import extract_from_scanned_pdf, extract_from_large_document
+from llm_clients.gemini import (
+    extract_from_scanned_pdf,
+    extract_from_large_document,
+    GEMINI_MODEL,
+    SCANNED_DOCUMENT_PROMPT,
+    LARGE_DOCUMENT_PROMPT
+)
 from llm_clients.ollama import (
     extract_financial_data_with_llama,
     extract_legal_data_with_llama,
-    extract_with_llama
+    extract_with_llama,
+    OLLAMA_MODEL,
+    financial_extraction_prompt,
+    legal_extraction_prompt,
+    extraction_prompt
 )
-from llm_clients.tinyllama import process_small_document
+from llm_clients.tinyllama import process_small_document, TINYLLAMA_MODEL, SMALL_DOCUMENT_PROMPT
+from llm_clients.backends import is_enabled
+from llm_clients.text_extraction import pipeline_signature
+from llm_clients.health import health
+from services.result_cache import result_cache
+from services import metrics, token_stream
+
+# branch name -> (processing type, extractor, model, prompt template)
+BRANCHES = {
+    "scanned": ("Scanned PDF processing", extract_from_scanned_pdf, GEMINI_MODEL, SCANNED_DOCUMENT_PROMPT),
+    "large": ("Large document processing", extract_from_large_document, GEMINI_MODEL, LARGE_DOCUMENT_PROMPT),
+    "financial": ("Financial data extraction", extract_financial_data_with_llama, OLLAMA_MODEL, financial_extraction_prompt),
+    "legal": ("Legal document processing", extract_legal_data_with_llama, OLLAMA_MODEL, legal_extraction_prompt),
+    "small": ("Small document processing", process_small_document, TINYLLAMA_MODEL, SMALL_DOCUMENT_PROMPT),
+    "default": ("General analysis", extract_with_llama, OLLAMA_MODEL, extraction_prompt)
+}
+
+# Branches whose extractors render text-layer tables locally (see llm_clients/text_extraction.py)
+TABLE_FAST_PATH_BRANCHES = {"large", "financial", "default"}
+
+# branch name -> backend that serves it (see llm_clients/backends.py)
+BRANCH_BACKENDS = {
+    "scanned": "gemini",
+    "large": "gemini",
+    "financial": "ollama",
+    "legal": "ollama",
+    "small": "tinyllama",
+    "default": "ollama"
+}
+
+# Branches tried in order when the chosen branch's backend is disabled, failing or slow
+FALLBACK_BRANCHES = ["default", "large", "small"]
+
+# Send a hedged request to a fallback backend when the primary outlasts its p95 latency
+LLM_HEDGING = os.getenv("LLM_HEDGING", "1") == "1"
+# Successful calls a backend needs before its own p95 is trusted as the hedge budget
+HEDGE_MIN_SAMPLES = 5
+HEDGE_DEFAULT_SECONDS = float(os.getenv("HEDGE_DEFAULT_SECONDS", "120"))
+HEDGE_MIN_SECONDS = float(os.getenv("HEDGE_MIN_SECONDS", "5"))
+# Longest a job waits for its extraction, hedged call included, before failing
+EXTRACTION_DEADLINE_SECONDS = float(os.getenv("EXTRACTION_DEADLINE_SECONDS", "600"))
+
+def resolve_branch(branch):
+    """The chosen branch if its backend is enabled, otherwise the first enabled fallback"""
+    if is_enabled(BRANCH_BACKENDS[branch]):
+        return branch
+    for fallback in FALLBACK_BRANCHES:
+        if is_enabled(BRANCH_BACKENDS[fallback]):
+            return fallback
+    raise RuntimeError("No LLM backends are enabled")
+
+def cache_key(document, branch):
+    _, _, model, prompt = BRANCHES[branch]
+    prompts = prompt + pipeline_signature(branch in TABLE_FAST_PATH_BRANCHES)
+    return result_cache.make_key(document.content_hash, branch, prompts, model)
+
+def hedge_budget(backend):
+    """Seconds to wait on `backend` before hedging: its recent p95, within configured bounds"""
+    stats = health(backend)
+    p95 = stats.percentile(0.95)
+    if p95 is None or stats.samples < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_SECONDS
+    return max(HEDGE_MIN_SECONDS, p95)
+
+def fallback_for(branch):
+    """First enabled fallback branch on another backend whose circuit breaker is closed"""
+    for fallback in FALLBACK_BRANCHES:
+        backend = BRANCH_BACKENDS[fallback]
+        if backend != BRANCH_BACKENDS[branch] and is_enabled(backend) and health(backend).allow():
+            return fallback
+    return None
+
+def succeeded(result):
+    return result is not None and result.get("success", False)
+
+def attempt(branch, document, abandoned):
+    """Run one branch's extractor, recording its backend's health and caching a success"""
+    _, extractor, _, _ = BRANCHES[branch]
+    start = time.perf_counter()
+    try:
+        with metrics.stage(f"extract:{branch}"):
+            result = extractor(document)
+    except Exception as e:
+        result = {"success": False, "model": BRANCH_BACKENDS[branch], "error": str(e)}
+    # A call that lost the race may fail only because its job moved on; that is not the
+    # backend's fault, but it still ends any half-open trial the call was carrying
+    if succeeded(result) or not abandoned.is_set():
+        health(BRANCH_BACKENDS[branch]).record(succeeded(result), time.perf_counter() - start)
+    else:
+        health(BRANCH_BACKENDS[branch]).release()
+    if succeeded(result):
+        result_cache.put(cache_key(document, branch), result)
+    return result
 
-# Wrap each LLM function as a RunnableLambda
-scanned_runnable = RunnableLambda(lambda inp: (extract_from_scanned_pdf(inp["file_path"]), "Scanned PDF processing"))
-large_runnable = RunnableLambda(lambda inp: (extract_from_large_document(inp["file_path"]), "Large document processing"))
-financial_runnable = RunnableLambda(lambda inp: (extract_financial_data_with_llama(inp["file_path"]), "Financial data extraction"))
-legal_runnable = RunnableLambda(lambda inp: (extract_legal_data_with_llama(inp["file_path"]), "Legal document processing"))
-small_runnable = RunnableLambda(lambda inp: (process_small_document(inp["file_path"]), "Small document processing"))
-default_runnable = RunnableLambda(lambda inp: (extract_with_llama(inp["file_path"]), "General analysis"))
+def launch(branch, document, finished, abandoned, mute):
+    """Run attempt() in a thread of its own; (branch, result) is put on `finished`"""
+    document.retain()
+
+    def run():
+        try:
+            if mute:
+                # Only the primary call streams tokens to the client
+                with token_stream.muted():
+                    result = attempt(branch, document, abandoned)
+            else:
+                result = attempt(branch, document, abandoned)
+        finally:
+            document.release()
+        finished.put((branch, result))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), name=f"extract-{branch}", daemon=True).start()
+
+def race(branch, document):
+    """Run `branch`, bringing in a fallback branch when it fails or outlasts its hedge budget.
+
+    Returns (branch that served, result): the first successful result, or the primary's
+    failure when no branch succeeds within EXTRACTION_DEADLINE_SECONDS. The losing call
+    keeps running in the background and still stores its result in the cache.
+    """
+    finished, abandoned = queue.Queue(), threading.Event()
+    start = time.monotonic()
+    deadline = start + EXTRACTION_DEADLINE_SECONDS
+    launch(branch, document, finished, abandoned, mute=False)
+    running, fallback, failure = {branch}, None, None
+    # Without hedging the fallback is only brought in when the primary fails
+    hedged = not LLM_HEDGING
+    hedge_at = start + hedge_budget(BRANCH_BACKENDS[branch])
+    try:
+        while running:
+            now = time.monotonic()
+            if now >= deadline:
+                print(f"{branch} extraction passed its {EXTRACTION_DEADLINE_SECONDS:.0f}s deadline")
+                for late in running:
+                    health(BRANCH_BACKENDS[late]).record(False, now - start)
+                return failure or (branch, {
+                    "success": False,
+                    "model": BRANCH_BACKENDS[branch],
+                    "error": f"Extraction timed out after {EXTRACTION_DEADLINE_SECONDS:.0f}s"
+                })
+            wait_until = deadline if hedged else min(hedge_at, deadline)
+            try:
+                served, result = finished.get(timeout=max(0.0, wait_until - now))
+            except queue.Empty:
+                if hedged or time.monotonic() >= deadline:
+                    continue
+                hedged = True
+                print(f"{branch} extraction passed its {hedge_at - start:.1f}s budget; hedging")
+            else:
+                running.discard(served)
+                if succeeded(result):
+                    return served, result
+                failure = failure or (served, result)
+            if fallback is None:
+                fallback = fallback_for(branch)
+                if fallback is not None:
+                    launch(fallback, document, finished, abandoned, mute=bool(running))
+                    running.add(fallback)
+        return failure
+    finally:
+        abandoned.set()
+
+def run_branch(branch, inp):
+    """Run one branch's extractor, serving and storing results through the result cache.
+
+    The branch's backend is skipped for a healthy fallback while its circuit breaker is
+    open, and backed up by one (see race) when it fails or is slow. The result records the
+    backend that served it.
+    """
+    branch = resolve_branch(branch)
+    document = inp["document"]
+    with metrics.stage("cache_lookup"):
+        cached = result_cache.get(cache_key(document, branch))
+    if cached is not None:
+        return cached, BRANCHES[branch][0]
+
+    primary = branch
+    if not health(BRANCH_BACKENDS[branch]).allow():
+        branch = fallback_for(branch) or branch
+        if branch != primary:
+            print(f"{BRANCH_BACKENDS[primary]} circuit breaker is open; using the {branch} branch")
+    served, result = race(branch, document)
+    if succeeded(result):
+        if served == primary:
+            result_cache.put_route(document.content_hash, served)
+        result = dict(result, backend=BRANCH_BACKENDS[served], fallback_from=primary if served != primary else None)
+    return result, BRANCHES[served][0]
+
+# Wrap each branch as a RunnableLambda
+scanned_runnable = RunnableLambda(lambda inp: run_branch("scanned", inp))
+large_runnable = RunnableLambda(lambda inp: run_branch("large", inp))
+financial_runnable = RunnableLambda(lambda inp: run_branch("financial", inp))
+legal_runnable = RunnableLambda(lambda inp: run_branch("legal", inp))
+small_runnable = RunnableLambda(lambda inp: run_branch("small", inp))
+default_runnable = RunnableLambda(lambda inp: run_branch("default", inp))
 
 # Conditions as standalone functions
 def is_scanned(inp):
     return inp["metadata"].get("is_scanned", False)
 
 def is_financial(inp):
-    return inp["helpers"]["contains_financial_tables"](inp["file_path"])
+    with metrics.stage("classify:financial"):
+        return inp["helpers"]["contains_financial_tables"](inp["document"])
 
 def is_large(inp):
     return inp["metadata"].get("pages", 0) > 10
@@ -29,19 +230,47 @@ def is_small(inp):
     return inp["metadata"].get("pages", 0) <= 3
 
 def is_legal(inp):
-    return inp["helpers"]["is_legal_document"](inp["file_path"])
+    with metrics.stage("classify:legal"):
+        return inp["helpers"]["is_legal_document"](inp["document"])
+
+# Conditions in the order they are checked; the first that holds picks the branch
+ROUTES = [
+    (is_scanned, "scanned", scanned_runnable),
+    (is_large, "large", large_runnable),
+    (is_financial, "financial", financial_runnable),
+    (is_legal, "legal", legal_runnable),
+    (is_small, "small", small_runnable)
+]
 
 class LangChainRouter:
     def __init__(self):
         self.router = RunnableBranch(
-            (is_scanned, scanned_runnable),
-            (is_large, large_runnable),
-            (is_financial, financial_runnable),
-            (is_legal, legal_runnable),
-            (is_small, small_runnable),
+            *[(condition, runnable) for condition, _, runnable in ROUTES],
             default_runnable  # fallback
         )
 
-    def route(self, file_path, metadata, helpers):
-        inp = {"file_path": file_path, "metadata": metadata, "helpers": helpers}
+    def choose_branch(self, document, metadata, helpers):
+        """Evaluate the routing conditions without extracting; returns the branch name.
+
+        The classifier helpers cache their answers per document, so a later route() on the
+        same document does not classify it again.
+        """
+        inp = {"document": document, "metadata": metadata, "helpers": helpers}
+        for condition, branch, _ in ROUTES:
+            if condition(inp):
+                return branch
+        return "default"
+
+    def route(self, document, metadata, helpers):
+        # A document seen before goes straight to its cached result, skipping classification
+        with metrics.stage("cache_lookup"):
+            branch = result_cache.get_route(document.content_hash)
+            known = branch in BRANCHES and is_enabled(BRANCH_BACKENDS[branch])
+            # Not counted as a miss here: run_branch looks the key up again and counts it
+            cached = result_cache.get(cache_key(document, branch), count=False) if known else None
+        if cached is not None:
+            result_cache.record_hit()
+            return cached, BRANCHES[branch][0]
+
+        inp = {"document": document, "metadata": metadata, "helpers": helpers}
         return self.router.invoke(inp)
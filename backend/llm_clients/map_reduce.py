@@ -0,0 +1,281 @@
+import contextvars
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from services import metrics, token_stream
+from llm_clients.prompt_builder import compact_pages
+from services.result_cache import result_cache
+from services.status_manager import update_status_details
+
+# Load environment variables
+load_dotenv()
+
+# Maximum number of chunk extraction calls in flight per document
+MAP_REDUCE_WORKERS = int(os.getenv("MAP_REDUCE_WORKERS", "4"))
+# Documents with at least this many pages are always extracted in chunks, so a later
+# revision only re-extracts the parts whose pages changed (0 disables)
+INCREMENTAL_MIN_PAGES = int(os.getenv("INCREMENTAL_MIN_PAGES", "10"))
+# Average pages per part, the unit whose output is reused across revisions; part
+# boundaries are content-defined (see is_anchor) (0 makes every chunk one part)
+CHUNK_ANCHOR_PAGES = int(os.getenv("CHUNK_ANCHOR_PAGES", "2"))
+
+CHUNK_PREFIX = """You are reading pages {first_page}-{last_page} of a longer document.
+Only report what appears in these pages. When you extract a table, give it a bold title on the line above it.
+
+"""
+
+# Added to calls covering several parts, so the answer can be split and stored per part
+PARTS_NOTE = """The text is divided into parts, each starting with a line such as `=== Part 1 ===`.
+Answer part by part: start the notes for each part with its `=== Part N ===` line, and only report that part's pages under it.
+
+"""
+
+PART_HEADER = "=== Part {number} ==="
+PART_LINE = re.compile(r"^\s*=== Part (\d+) ===\s*$", re.MULTILINE)
+
+REDUCE_PROMPT = """
+Below are notes extracted from consecutive parts of one document, each labelled with its page range.
+The tables have already been collected separately, so do not repeat them.
+
+1. Start with the document title as a `#` heading (use the most likely title from the notes).
+2. Under `## Key Insights`, list the most important points as bullet points, citing page numbers where given.
+3. Under `## Final Document Summary`, write a clear, concise summary of what the document reveals overall.
+
+Be precise and do **not invent data**. Only use what is present in the notes.
+
+Notes:
+{text}
+"""
+
+TABLE_LINE = re.compile(r"^\s*\|.*\|\s*$")
+
+
+def is_anchor(fingerprint, anchor_pages=CHUNK_ANCHOR_PAGES):
+    """Whether a part boundary falls after this page, decided by the page content alone"""
+    return anchor_pages > 0 and int(fingerprint[:8], 16) % anchor_pages == 0
+
+
+def split_parts(page_texts, max_chars, fingerprints=None):
+    """Group pages into parts of at most `max_chars`, keeping `--- Page N ---` markers.
+
+    A part ends after every anchor page (see is_anchor), so inserting, deleting or editing
+    a page only changes the part it falls in. Each part also has `content`, its page texts
+    without page numbers, which identifies its output across revisions. A single page
+    longer than the budget is split into several parts that all carry that page number.
+    """
+    parts = []
+    current, content, first_page = "", [], None
+
+    def close(last_page):
+        parts.append({"first_page": first_page, "last_page": last_page, "text": current, "content": "\f".join(content)})
+
+    for page_num, page_text in enumerate(page_texts, 1):
+        page_block = f"\n--- Page {page_num} ---\n{page_text}"
+        if current and len(current) + len(page_block) > max_chars:
+            close(page_num - 1)
+            current, content, first_page = "", [], None
+        piece = 0
+        while len(page_block) > max_chars:
+            parts.append({
+                "first_page": page_num, "last_page": page_num, "text": page_block[:max_chars],
+                "content": f"{page_text}\f{piece}"
+            })
+            page_block = page_block[max_chars:]
+            piece += 1
+        if first_page is None:
+            first_page = page_num
+        current += page_block
+        content.append(page_text if not piece else f"{page_text}\f{piece}")
+        if fingerprints is not None and is_anchor(fingerprints[page_num - 1]):
+            close(page_num)
+            current, content, first_page = "", [], None
+    if current:
+        close(len(page_texts))
+    return parts
+
+
+def pack_parts(indices, parts, max_chars):
+    """Group consecutive part indices into model calls of at most `max_chars` of text"""
+    calls, current, used = [], [], 0
+    for index in indices:
+        size = len(parts[index]["text"]) + len(PART_HEADER) + 8
+        if current and (index != current[-1] + 1 or used + size > max_chars):
+            calls.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += size
+    if current:
+        calls.append(current)
+    return calls
+
+
+def split_answer(output, count):
+    """Per-part sections of a multi-part answer, or None unless parts 1..count appear in order"""
+    matches = list(PART_LINE.finditer(output))
+    if [int(match.group(1)) for match in matches] != list(range(1, count + 1)):
+        return None
+    ends = [match.start() for match in matches[1:]] + [len(output)]
+    return [output[match.end():end].strip() for match, end in zip(matches, ends)]
+
+
+def needs_map_reduce(document, max_chars, page_texts=None):
+    if INCREMENTAL_MIN_PAGES and document.page_count >= INCREMENTAL_MIN_PAGES:
+        return True
+    return sum(len(text) for text in page_texts or document.page_texts) > max_chars
+
+
+def page_label(chunk):
+    if chunk["first_page"] == chunk["last_page"]:
+        return f"Page {chunk['first_page']}"
+    return f"Pages {chunk['first_page']}-{chunk['last_page']}"
+
+
+def split_tables(output):
+    """Separate Markdown tables (with the title line just above each) from the rest of a chunk output"""
+    lines = output.splitlines()
+    tables, rest = [], []
+    i = 0
+    while i < len(lines):
+        if TABLE_LINE.match(lines[i]):
+            table = []
+            # Pull a title line such as **"Pricing Table"** in with the table
+            if rest and rest[-1].strip() and not TABLE_LINE.match(rest[-1]):
+                table.append(rest.pop())
+            while i < len(lines) and TABLE_LINE.match(lines[i]):
+                table.append(lines[i])
+                i += 1
+            tables.append("\n".join(table))
+        else:
+            rest.append(lines[i])
+            i += 1
+    return tables, "\n".join(rest).strip()
+
+
+def call_prompt(parts, template):
+    """Prompt extracting `parts` (consecutive) with `template`"""
+    prefix = CHUNK_PREFIX.format(first_page=parts[0]["first_page"], last_page=parts[-1]["last_page"])
+    if len(parts) == 1:
+        return prefix + template.format(text=parts[0]["text"])
+    text = "\n\n".join(
+        f"{PART_HEADER.format(number=number)}{part['text']}" for number, part in enumerate(parts, 1)
+    )
+    return prefix + PARTS_NOTE + template.format(text=text)
+
+
+def map_calls(calls, parts, template, invoke, max_workers=MAP_REDUCE_WORKERS):
+    """Run every call (a list of part indices) concurrently; returns one output per call"""
+    def map_call(call):
+        return invoke(call_prompt([parts[index] for index in call], template))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Copy the context so metrics for each call land in the current job's timeline
+        futures = [
+            pool.submit(contextvars.copy_context().run, map_call, call)
+            for call in calls
+        ]
+        return [future.result() for future in futures]
+
+
+def reduce_outputs(chunks, outputs, invoke, tables=()):
+    """Merge chunk outputs: tables are kept verbatim under their page ranges, notes are summarized.
+
+    `tables` are Markdown sections extracted without the LLM, listed before the chunk tables.
+    """
+    table_sections, notes = list(tables), []
+    for chunk, output in zip(chunks, outputs):
+        tables, rest = split_tables(output)
+        if tables:
+            table_sections.append(f"### {page_label(chunk)}\n\n" + "\n\n".join(tables))
+        if rest:
+            notes.append(f"[{page_label(chunk)}]\n{rest}")
+
+    summary = invoke(REDUCE_PROMPT.format(text="\n\n".join(notes))) if notes else ""
+    tables_markdown = "\n\n".join(table_sections) if table_sections else "No tables were detected in this document."
+    return f"{summary.strip()}\n\n## Tables\n\n{tables_markdown}\n"
+
+
+def memoized(invoke, label):
+    """Wrap `invoke` so outputs are stored per prompt and identical prompts are answered
+    from the result cache. Returns the wrapper and a dict counting reused and model calls."""
+    counts = {"reused_calls": 0, "model_calls": 0}
+    lock = threading.Lock()
+
+    def call(prompt):
+        key = result_cache.make_chunk_key(label, prompt)
+        cached = result_cache.get(key, count=False)
+        if cached is None:
+            output = invoke(prompt)
+            result_cache.put(key, {"output": output})
+        with lock:
+            counts["reused_calls" if cached is not None else "model_calls"] += 1
+        return cached["output"] if cached is not None else output
+
+    return call, counts
+
+
+def part_key(label, template, part):
+    """Cache key of one part's output: model, prompts and page texts, but no page numbers"""
+    return result_cache.make_chunk_key(label, json.dumps(["part", CHUNK_PREFIX, PARTS_NOTE, template, part["content"]]))
+
+
+def map_parts(parts, template, invoke, max_chars, max_workers=MAP_REDUCE_WORKERS, label=None, reuse=False):
+    """Outputs for `parts` as (chunks, outputs) ready for reduce_outputs.
+
+    With a model `label`, each part's output is stored under part_key and, with `reuse`,
+    parts stored before are spliced in without calling the model. The remaining parts are
+    packed into calls of up to `max_chars`; an answer that does not keep the part markers
+    is used whole for the pages of its call and not stored per part.
+    """
+    keys = [part_key(label, template, part) for part in parts] if label is not None else None
+    stored = [None] * len(parts)
+    if keys is not None and reuse:
+        for index, key in enumerate(keys):
+            cached = result_cache.get(key, count=False)
+            stored[index] = cached["output"] if cached is not None else None
+    calls = pack_parts([index for index, output in enumerate(stored) if output is None], parts, max_chars)
+    call_outputs = map_calls(calls, parts, template, invoke, max_workers)
+
+    sections = {index: (parts[index], output) for index, output in enumerate(stored) if output is not None}
+    for call, output in zip(calls, call_outputs):
+        answers = [output] if len(call) == 1 else split_answer(output, len(call))
+        if answers is None:
+            first, last = parts[call[0]], parts[call[-1]]
+            sections[call[0]] = ({"first_page": first["first_page"], "last_page": last["last_page"]}, output)
+            continue
+        for index, answer in zip(call, answers):
+            sections[index] = (parts[index], answer)
+            if keys is not None:
+                result_cache.put(keys[index], {"output": answer})
+    ordered = [sections[index] for index in sorted(sections)]
+    reused = sum(output is not None for output in stored)
+    return [chunk for chunk, _ in ordered], [output for _, output in ordered], reused
+
+
+def map_reduce(document, template, invoke, max_chars, max_workers=MAP_REDUCE_WORKERS, label=None,
+               page_texts=None, tables=(), page_notes=None):
+    """Extract a document in page chunks of at most `max_chars` and merge the results.
+
+    With a model `label`, the output of every part (a few pages, see split_parts) is kept
+    in the result cache. When the document is a revision of an earlier upload
+    (`document.revision_of`), only the parts whose pages changed go to the model and the
+    stored outputs of the others are spliced in. `page_texts` replaces the document's text
+    (e.g. with its tables removed), `page_notes` are added to the pages after compaction
+    (see compact_pages) and `tables` are pre-rendered table sections for the merged output.
+    """
+    page_texts = compact_pages(page_texts or document.page_texts, page_notes)
+    parts = split_parts(page_texts, max_chars, document.page_fingerprints)
+    counts = None
+    if label is not None:
+        invoke, counts = memoized(invoke, label)
+    reuse = document.revision_of is not None
+    # Concurrent chunk outputs would interleave, so nothing is streamed to the client here
+    with token_stream.muted():
+        chunks, outputs, reused = map_parts(parts, template, invoke, max_chars, max_workers, label, reuse)
+        merged = reduce_outputs(chunks, outputs, invoke, tables)
+    file_id = metrics.current_job.get()
+    if counts is not None and file_id is not None:
+        update_status_details(file_id, chunks=len(parts), reused_parts=reused, **counts)
+    return merged
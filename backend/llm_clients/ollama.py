@@ -1,17 +1,37 @@
 import os
-import fitz  # PyMuPDF for PDF text extraction and metadata
-from langchain_ollama.llms import OllamaLLM
+import threading
 from dotenv import load_dotenv
-from huggingface_hub import login
+from services import metrics, token_stream
+from llm_clients.backends import register
+from llm_clients.scheduler import InvocationScheduler
+from llm_clients.prompt_builder import register_budget
+from llm_clients.text_extraction import extract_text
+from services.status_manager import update_status, update_status_details
 
 # Load environment variables
 load_dotenv()
-HF_TOKEN = os.getenv("HF_TOKEN")
-login(token=HF_TOKEN)
 
-# Initialize Ollama LLM (Llama 3.2 model)
-print("Loading Llama 3.2 model from Ollama...")
-llm = OllamaLLM(model="llama3.2")
+# Ollama LLM (Llama 3.2 model), created on first use
+OLLAMA_MODEL = "llama3.2"
+
+# Context window requested from Ollama; its own default (2048) silently cuts longer prompts
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+
+def load_llm():
+    from langchain_ollama.llms import OllamaLLM
+    return OllamaLLM(model=OLLAMA_MODEL, num_ctx=OLLAMA_NUM_CTX)
+
+ollama_backend = register("ollama", load_llm)
+
+def get_llm():
+    return ollama_backend.get()
+
+# Documents whose text is longer than this are extracted chunk by chunk (map-reduce)
+OLLAMA_CHUNK_CHARS = int(os.getenv("OLLAMA_CHUNK_CHARS", "12000"))
+# Calls allowed to run on the local Ollama server at once; the rest wait in FIFO order
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+
+register_budget(OLLAMA_MODEL, context_tokens=OLLAMA_NUM_CTX, output_tokens=1024, chars_per_token=4.0)
 
 # --------------------- PROMPTS ---------------------
 financial_extraction_prompt = """
@@ -79,44 +99,130 @@ Document Text:
 
 
 
-# --------------------- METADATA FUNCTIONS ---------------------
-
-def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page_num, page in enumerate(doc, 1):
-        text += f"\n--- Page {page_num} ---\n"
-        text += page.get_text()
-    return text
-
 # --------------------- MAIN EXTRACTORS ---------------------
 
-def extract_financial_data_with_llama(pdf_path):
-    text = extract_text_from_pdf(pdf_path)
-    prompt = financial_extraction_prompt.format(text=text)
-    response = llm.invoke(prompt)
+def _invoke(prompt):
+    sink = token_stream.current_sink()
+    with metrics.llm_call(OLLAMA_MODEL, prompt):
+        if sink is None:
+            return str(get_llm().invoke(prompt))
+        # A client is watching this job: forward tokens as Ollama produces them
+        pieces = []
+        for piece in get_llm().stream(prompt):
+            token_stream.emit(sink, piece)
+            pieces.append(piece)
+        return "".join(pieces)
+
+scheduler = InvocationScheduler(_invoke, OLLAMA_MAX_CONCURRENCY)
+
+class JobQueueState:
+    """Queue state per job across all of its scheduled calls (e.g. map-reduce chunks).
+
+    A job is "Queued" while none of its calls is running and at least one is waiting,
+    with the best queue position among its waiting calls; it goes back to "Processing"
+    when one of its calls starts, or when the last waiting call leaves without starting
+    (cancelled or failed in the queue). The status therefore changes once per job, not
+    per call.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _job(self, file_id):
+        return self._jobs.setdefault(file_id, {"waiting": {}, "running": 0, "queued": False})
+
+    def waiting(self, file_id, call, position):
+        with self._lock:
+            job = self._job(file_id)
+            job["waiting"][call] = position
+            if job["running"]:
+                return
+            best = min(job["waiting"].values())
+            newly_queued = not job["queued"]
+            job["queued"] = True
+        update_status_details(file_id, queue_position=best)
+        if newly_queued:
+            update_status(file_id, "Queued")
+
+    def started(self, file_id, call):
+        with self._lock:
+            job = self._job(file_id)
+            job["waiting"].pop(call, None)
+            job["running"] += 1
+            resumed = job["queued"]
+            job["queued"] = False
+        if resumed:
+            update_status_details(file_id, queue_position=None)
+            update_status(file_id, "Processing")
+
+    def finished(self, file_id, call, started):
+        with self._lock:
+            job = self._jobs.get(file_id)
+            if job is None:
+                return
+            job["waiting"].pop(call, None)
+            if started:
+                job["running"] -= 1
+            queued = job["queued"]
+            best = min(job["waiting"].values()) if queued and job["waiting"] else None
+            job["queued"] = best is not None
+            if not job["waiting"] and not job["running"]:
+                del self._jobs[file_id]
+        if best is not None:
+            update_status_details(file_id, queue_position=best)
+        elif queued:
+            # Nothing of this job is waiting any more; do not leave it "Queued"
+            update_status_details(file_id, queue_position=None)
+            update_status(file_id, "Processing")
+
+job_queue_state = JobQueueState()
+
+def invoke_llama(prompt):
+    """Run a prompt through the scheduler, reporting the current job's queue state"""
+    file_id = metrics.current_job.get()
+    call = object()
+    started = []
+
+    def on_wait(position):
+        if file_id is not None:
+            job_queue_state.waiting(file_id, call, position)
+
+    def on_start():
+        started.append(True)
+        if file_id is not None:
+            job_queue_state.started(file_id, call)
+
+    try:
+        with metrics.stage("ollama_queue"):
+            return scheduler.submit(prompt, on_wait, on_start)
+    finally:
+        if file_id is not None:
+            job_queue_state.finished(file_id, call, bool(started))
+
+def run_extraction(document, prompt_template, table_fast_path=False):
+    return extract_text(document, prompt_template, invoke_llama, OLLAMA_CHUNK_CHARS, OLLAMA_MODEL, table_fast_path)
+
+def extract_financial_data_with_llama(document):
+    response = run_extraction(document, financial_extraction_prompt, table_fast_path=True)
     return {
         "success": True,
         "model": "Llama 3.2",
-        "data": str(response)
+        "data": response
     }
 
-def extract_legal_data_with_llama(pdf_path):
-    text = extract_text_from_pdf(pdf_path)
-    prompt = legal_extraction_prompt.format(text=text)
-    response = llm.invoke(prompt)
+def extract_legal_data_with_llama(document):
+    response = run_extraction(document, legal_extraction_prompt)
     return {
         "success": True,
         "model": "Llama 3.2",
-        "data": str(response)
+        "data": response
     }
 
-def extract_with_llama(pdf_path):
-    text = extract_text_from_pdf(pdf_path)
-    prompt = extraction_prompt.format(text=text)
-    response = llm.invoke(prompt)
+def extract_with_llama(document):
+    response = run_extraction(document, extraction_prompt, table_fast_path=True)
     return {
         "success": True,
         "model": "Llama 3.2",
-        "data": str(response)
-    }
\ No newline at end of file
+        "data": response
+    }
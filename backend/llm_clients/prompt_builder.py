@@ -0,0 +1,157 @@
+import re
+from collections import Counter
+
+# model -> {"context_tokens", "output_tokens", "chars_per_token"}, filled in by each client
+BUDGETS = {}
+
+# Non-empty lines at the top and bottom of each page checked for running headers/footers
+EDGE_LINES = 3
+# A line (or page-number pattern) must appear on at least this share of pages (and 2 pages) to count as running
+RUNNING_MIN_SHARE = 0.5
+RUNNING_MIN_PAGES = 3
+# Headers and footers are short; longer lines are always kept
+RUNNING_MAX_CHARS = 120
+
+TRUNCATION_MARKER = "\n[Truncated to fit the model's context: the rest of the document from page {page} on was left out]\n"
+
+NUMBER = re.compile(r"\d+")
+LETTER = re.compile(r"[^\W\d_]")
+INLINE_SPACE = re.compile(r"[ \t\u00a0]+")
+
+
+def register_budget(model, context_tokens, output_tokens, chars_per_token):
+    """Declare a model's context window, the tokens reserved for its answer and the
+    average characters per token of its tokenizer"""
+    BUDGETS[model] = {
+        "context_tokens": context_tokens,
+        "output_tokens": output_tokens,
+        "chars_per_token": chars_per_token
+    }
+
+
+def estimate_tokens(text, model):
+    return int(len(text) / BUDGETS[model]["chars_per_token"]) + 1
+
+
+def normalize_whitespace(text):
+    """Collapse runs of spaces within lines and of blank lines between them"""
+    lines = [INLINE_SPACE.sub(" ", line).strip() for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def _shape(line):
+    # Lines that differ only in their numbers share a shape
+    return NUMBER.sub("#", line.lower())
+
+
+def _edge_indices(lines):
+    """Indices of the short lines at the top and bottom of a page"""
+    filled = [i for i, line in enumerate(lines) if line]
+    # On short pages only the very first and last lines can be a header or footer
+    edge = EDGE_LINES if len(filled) > 2 * EDGE_LINES else 1
+    return {i for i in filled[:edge] + filled[-edge:] if len(lines[i]) <= RUNNING_MAX_CHARS}
+
+
+def _page_number_keys(line, page_index):
+    """(shape, position, offset) for every number in a line, where offset is the number
+    minus the page index: constant across pages for a page number, varying for data"""
+    return {
+        (_shape(line), position, int(number) - page_index)
+        for position, number in enumerate(NUMBER.findall(line))
+    }
+
+
+def running_lines(pages):
+    """Header/footer lines that repeat at the edges of many pages.
+
+    Returns (lines, page_numbers): identical lines containing a letter (a bare number
+    repeated on many pages is more likely a table value, such as a year, than a footer),
+    and the (shape, position, offset) keys of numbers that grow with the page index,
+    i.e. page numbers such as "12" or "Page 12 of 40".
+    """
+    if len(pages) < RUNNING_MIN_PAGES:
+        return set(), set()
+    exact, numbered = Counter(), Counter()
+    for page_index, lines in enumerate(pages):
+        edges = {lines[i] for i in _edge_indices(lines)}
+        exact.update(line for line in edges if LETTER.search(line))
+        numbered.update(key for line in edges for key in _page_number_keys(line, page_index))
+    threshold = max(2, RUNNING_MIN_SHARE * len(pages))
+    return (
+        {line for line, count in exact.items() if count >= threshold},
+        {key for key, count in numbered.items() if count >= threshold}
+    )
+
+
+def compact_pages(page_texts, notes=None):
+    """Page texts with whitespace normalized and running headers, footers and page
+    numbers removed from the top and bottom of each page.
+
+    `notes` (one string per page, "" for none) are appended to the compacted pages, so
+    they are never mistaken for headers or footers.
+    """
+    pages = [normalize_whitespace(text).split("\n") for text in page_texts]
+    running, page_numbers = running_lines(pages)
+    compacted = []
+    for page_index, lines in enumerate(pages):
+        edges = _edge_indices(lines)
+
+        def is_running(i):
+            return i in edges and (lines[i] in running or bool(_page_number_keys(lines[i], page_index) & page_numbers))
+
+        filled = [i for i, line in enumerate(lines) if line]
+        dropped = set()
+        # Strip from each edge inwards, stopping at the first line that is not running, so a
+        # repeated label such as "Revenue" above a page's own figure is kept with it
+        for order in (filled, filled[::-1]):
+            for i in order:
+                if not is_running(i):
+                    break
+                dropped.add(i)
+        compacted.append("\n".join(line for i, line in enumerate(lines) if i not in dropped).strip())
+    if notes is not None:
+        compacted = [f"{text}\n{note}".strip() if note else text for text, note in zip(compacted, notes)]
+    return compacted
+
+
+def fit_pages(pages, budget_chars, page_markers=True, first_page=1):
+    """Join pages up to `budget_chars`.
+
+    Truncation policy: pages are kept in order from the start; the first page that does
+    not fit is cut at a line (or word) break and everything after the cut is replaced by
+    a marker naming that page, so the model knows the text is incomplete.
+    """
+    parts, used = [], 0
+    for page_num, text in enumerate(pages, first_page):
+        header = f"\n--- Page {page_num} ---\n" if page_markers else ""
+        block = header + text if page_markers else text + "\n\n"
+        if used + len(block) > budget_chars:
+            room = budget_chars - used - len(TRUNCATION_MARKER)
+            body_start = len(header)
+            if room > body_start:
+                # Prefer a line break, then a word break, over cutting a word in half
+                cut = block.rfind("\n", body_start, room)
+                if cut <= body_start:
+                    cut = block.rfind(" ", body_start, room)
+                parts.append(block[:cut if cut > body_start else room])
+            parts.append(TRUNCATION_MARKER.format(page=page_num))
+            break
+        parts.append(block)
+        used += len(block)
+    return "".join(parts)
+
+
+def build_prompt(template, page_texts, model, page_markers=True, first_page=1, page_notes=None):
+    """Fill `template`'s {text} with the compacted pages, fitted to the model's budget.
+
+    `first_page` is the page number of page_texts[0] in the page markers; `page_notes`
+    are passed on to compact_pages.
+    """
+    budget = BUDGETS[model]
+    available_tokens = (
+        budget["context_tokens"] - budget["output_tokens"] - estimate_tokens(template.format(text=""), model)
+    )
+    text = fit_pages(
+        compact_pages(page_texts, page_notes), int(available_tokens * budget["chars_per_token"]), page_markers, first_page
+    )
+    return template.format(text=text)
@@ -0,0 +1,105 @@
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+
+class InvocationScheduler:
+    """Runs model calls with a concurrency cap, a FIFO wait queue and request coalescing.
+
+    `invoke` is any callable taking a prompt and returning text, so a fake LLM can stand
+    in for the real backend. Callers submitting a prompt identical to one already queued or
+    running wait for that call's result instead of running the model again.
+    """
+
+    def __init__(self, invoke, max_concurrency):
+        self._invoke = invoke
+        self.max_concurrency = max_concurrency
+        self._waiting = deque()
+        self._running = 0
+        self._inflight = {}
+        self._cond = threading.Condition()
+        self.coalesced = 0
+        self.completed = 0
+
+    @staticmethod
+    def key_for(prompt):
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def submit(self, prompt, on_wait=None, on_start=None):
+        """Run `prompt` (or join an identical in-flight call) and return its result.
+
+        `on_wait(position)` is called whenever the caller's place in the queue changes
+        while it waits for a free slot; `on_start()` once it is admitted. Both run outside
+        the scheduler's lock, and a caller whose callback raises leaves the queue.
+        """
+        key = self.key_for(prompt)
+        ticket = None
+        with self._cond:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                future = self._inflight[key] = Future()
+                ticket = object()
+                self._waiting.append(ticket)
+        if ticket is None:
+            # Another caller is already running this exact prompt
+            return future.result()
+
+        try:
+            self._wait_for_slot(ticket, on_wait)
+        except BaseException as e:
+            with self._cond:
+                self._inflight.pop(key, None)
+            # Callers that joined this prompt get the same error instead of waiting forever
+            future.set_exception(e)
+            raise
+        try:
+            if on_start is not None:
+                on_start()
+            future.set_result(self._invoke(prompt))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._cond:
+                self._running -= 1
+                self.completed += 1
+                self._inflight.pop(key, None)
+                self._cond.notify_all()
+        return future.result()
+
+    def _wait_for_slot(self, ticket, on_wait):
+        """Block until `ticket` is first in line and a slot is free, then take the slot"""
+        last_position = None
+        try:
+            while True:
+                with self._cond:
+                    if self._waiting[0] is ticket and self._running < self.max_concurrency:
+                        self._waiting.popleft()
+                        self._running += 1
+                        self._cond.notify_all()
+                        return
+                    position = self._waiting.index(ticket)
+                    if on_wait is None or position == last_position:
+                        self._cond.wait()
+                        continue
+                # Report outside the lock, so a slow or failing callback cannot stall the queue
+                last_position = position
+                on_wait(position)
+        except BaseException:
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+            raise
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self._running,
+                "queue_depth": len(self._waiting),
+                "max_concurrency": self.max_concurrency,
+                "coalesced": self.coalesced,
+                "completed": self.completed
+            }
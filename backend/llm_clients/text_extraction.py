@@ -0,0 +1,71 @@
+from services import metrics
+from services.status_manager import update_status_details
+from services.tables import TABLE_FAST_PATH, extract_layout
+from llm_clients.map_reduce import map_reduce, needs_map_reduce, CHUNK_PREFIX, PARTS_NOTE, REDUCE_PROMPT
+from llm_clients.prompt_builder import build_prompt
+
+# Used instead of the branch prompt when the tables were rendered without the LLM
+TABLE_SUMMARY_PROMPT = """
+The tables of this document were extracted separately and will be appended to your answer, so do not reproduce them.
+Where a page had tables, its text ends with a short digest of them under "[Tables on this page, rendered separately]".
+
+Using the document text and the table digests below:
+1. Start with the document title as a `#` heading (use the most likely title).
+2. Under `## Key Insights`, list the most important points and figures as bullet points, citing page numbers where given.
+3. Under `## Final Document Summary`, write a clear, concise summary of what the document reveals overall, such as *profit/loss*, *trends* or *key performance figures*.
+
+Be precise and do **not invent data**. Only use what is present in the text and the digests.
+
+Text:
+{text}
+"""
+
+
+# Bump when extraction output changes for unchanged prompts (e.g. new compaction or table
+# rules), so results cached under the old pipeline are not served
+PIPELINE_VERSION = 4
+
+
+def pipeline_signature(table_fast_path):
+    """Everything besides the branch prompt that shapes an extraction result, for cache keys"""
+    prompts = [f"pipeline v{PIPELINE_VERSION}", CHUNK_PREFIX, PARTS_NOTE, REDUCE_PROMPT]
+    if table_fast_path and TABLE_FAST_PATH:
+        prompts.append(TABLE_SUMMARY_PROMPT)
+    return "\n".join(prompts)
+
+
+def with_tables(output, tables):
+    return f"{output.strip()}\n\n## Tables\n\n" + "\n\n".join(tables) + "\n"
+
+
+def extract_text(document, template, invoke, max_chars, model, table_fast_path=False):
+    """Run an extraction prompt over a document and return the model's Markdown.
+
+    Documents longer than `max_chars` (or long enough to re-extract incrementally) go
+    through map_reduce, the rest through one prompt fitted to the model's budget. With
+    `table_fast_path`, tables in the text layer are rendered to Markdown locally and the
+    model only summarizes the text around them plus a per-page digest of the tables.
+    """
+    layout = None
+    if table_fast_path and TABLE_FAST_PATH:
+        with metrics.stage("tables"):
+            layout = extract_layout(document)
+    if layout is None:
+        # OCR text stands in for scanned pages, e.g. when a scan falls back to a text-only backend
+        page_texts = document.searchable_page_texts()
+        if needs_map_reduce(document, max_chars, page_texts):
+            return map_reduce(document, template, invoke, max_chars, label=model, page_texts=page_texts)
+        return invoke(build_prompt(template, page_texts, model))
+
+    file_id = metrics.current_job.get()
+    if file_id is not None:
+        update_status_details(file_id, local_tables=len(layout.tables))
+    tables = layout.markdown_sections()
+    page_notes = layout.page_digests()
+    if needs_map_reduce(document, max_chars, layout.page_texts):
+        return map_reduce(
+            document, TABLE_SUMMARY_PROMPT, invoke, max_chars, label=model,
+            page_texts=layout.page_texts, tables=tables, page_notes=page_notes
+        )
+    prompt = build_prompt(TABLE_SUMMARY_PROMPT, layout.page_texts, model, page_notes=page_notes)
+    return with_tables(invoke(prompt), tables)
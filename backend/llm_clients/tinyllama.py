@@ -1,41 +1,49 @@
 import os
-import fitz  # PyMuPDF
-from transformers import pipeline
-from huggingface_hub import login
+import queue
+import threading
 from dotenv import load_dotenv
+from services import metrics, token_stream
+from llm_clients.backends import register, hf_login
+from llm_clients.batcher import MicroBatcher
+from llm_clients.prompt_builder import register_budget, build_prompt
 
 # Load environment variables
 load_dotenv()
-HF_TOKEN = os.getenv("HF_TOKEN")
-login(token=HF_TOKEN)
 
-# Load TinyLlama
-print("Loading TinyLlama model...")
-llm = pipeline("text-generation", model="TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+# TinyLlama pipeline, loaded on first use
+TINYLLAMA_MODEL = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
 
-def call_tinyllama(prompt):
-    result = llm(prompt, max_new_tokens=300, do_sample=True)
-    generated = result[0]["generated_text"]
-    
-    # Remove the prompt from the output
-    cleaned = generated.replace(prompt, "").strip()
-    return cleaned
-
-def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page_num, page in enumerate(doc, 1):
-        text += f"\n--- Page {page_num} ---\n"
-        text += page.get_text()
-    return text
-
-def process_small_document(pdf_path):
-    try:
-        # Extract text from PDF
-        text = extract_text_from_pdf(pdf_path)
-        
-        # Create a prompt for small document processing
-        prompt = f"""You are a document analyst. Your task is to:
+def load_pipeline():
+    from transformers import pipeline
+    hf_login()
+    pipe = pipeline("text-generation", model=TINYLLAMA_MODEL)
+    # Set once here rather than per batch, so concurrent calls never see the tokenizer change
+    if pipe.tokenizer.pad_token is None:
+        pipe.tokenizer.pad_token = pipe.tokenizer.eos_token
+    # Decoder-only models continue from the last position, so batches are padded on the left
+    pipe.tokenizer.padding_side = "left"
+    return pipe
+
+tinyllama_backend = register("tinyllama", load_pipeline)
+
+# Concurrent small documents are generated together in one padded batch
+TINYLLAMA_MAX_BATCH = int(os.getenv("TINYLLAMA_MAX_BATCH", "4"))
+TINYLLAMA_BATCH_WINDOW_MS = int(os.getenv("TINYLLAMA_BATCH_WINDOW_MS", "50"))
+TINYLLAMA_MAX_NEW_TOKENS = int(os.getenv("TINYLLAMA_MAX_NEW_TOKENS", "300"))
+# Longest wait for the next token of a streamed generation before giving up
+TINYLLAMA_STREAM_TIMEOUT = float(os.getenv("TINYLLAMA_STREAM_TIMEOUT", "120"))
+# Fallback when the model config does not say how long its context is
+TINYLLAMA_CONTEXT_TOKENS = 2048
+
+register_budget(
+    TINYLLAMA_MODEL,
+    context_tokens=TINYLLAMA_CONTEXT_TOKENS,
+    output_tokens=TINYLLAMA_MAX_NEW_TOKENS,
+    chars_per_token=3.3
+)
+
+# Prompt for small document processing
+SMALL_DOCUMENT_PROMPT = """You are a document analyst. Your task is to:
 
 1. Provide a **brief summary** of the document.
 2. Identify and extract the **sections** in the document (e.g., "Introduction", "Text Formatting Examples", "Lists").
@@ -46,6 +54,95 @@ Document text:
 {text}
 """
 
+def context_window(pipe):
+    return getattr(pipe.model.config, "max_position_embeddings", None) or TINYLLAMA_CONTEXT_TOKENS
+
+def prompt_ids(pipe, prompt):
+    """Token ids of the prompt, cut so prompt plus generated tokens fit the context window.
+
+    The instructions come first in every prompt, so the end of the document text is dropped.
+    The ids go to generate as they are; decoding and re-tokenizing the cut text could come
+    out longer than the budget.
+    """
+    tokenizer = pipe.tokenizer
+    budget = context_window(pipe) - TINYLLAMA_MAX_NEW_TOKENS - tokenizer.num_special_tokens_to_add()
+    input_ids = tokenizer(prompt, add_special_tokens=False)["input_ids"][:budget]
+    return tokenizer.build_inputs_with_special_tokens(input_ids)
+
+def generate_batch(prompts):
+    """Run one batched generate over `prompts` and return the generated text of each"""
+    pipe = tinyllama_backend.get()
+    tokenizer = pipe.tokenizer
+    inputs = tokenizer.pad({"input_ids": [prompt_ids(pipe, prompt) for prompt in prompts]}, return_tensors="pt")
+    outputs = pipe.model.generate(
+        **inputs.to(pipe.device),
+        max_new_tokens=TINYLLAMA_MAX_NEW_TOKENS,
+        do_sample=True,
+        pad_token_id=tokenizer.pad_token_id
+    )
+    # Left padding makes every prompt end at the same position, where the generated text starts
+    prompt_length = len(inputs["input_ids"][0])
+    generated = [output[prompt_length:] for output in outputs]
+    return [text.strip() for text in tokenizer.batch_decode(generated, skip_special_tokens=True)]
+
+batcher = MicroBatcher(generate_batch, TINYLLAMA_MAX_BATCH, TINYLLAMA_BATCH_WINDOW_MS / 1000)
+
+def stream_generate(prompt, sink):
+    """Generate one prompt outside the batcher, forwarding tokens to `sink` as they are produced.
+
+    Errors raised by generate in its thread are re-raised here; a generation that produces
+    no token for TINYLLAMA_STREAM_TIMEOUT seconds raises TimeoutError.
+    """
+    import torch
+    from transformers import TextIteratorStreamer
+    pipe = tinyllama_backend.get()
+    streamer = TextIteratorStreamer(
+        pipe.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=TINYLLAMA_STREAM_TIMEOUT
+    )
+    input_ids = torch.tensor([prompt_ids(pipe, prompt)], device=pipe.device)
+    errors = []
+
+    def generate():
+        try:
+            pipe.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                streamer=streamer,
+                max_new_tokens=TINYLLAMA_MAX_NEW_TOKENS,
+                do_sample=True
+            )
+        except Exception as e:
+            errors.append(e)
+            # Wake the reader below, which would otherwise wait for tokens that never come
+            streamer.end()
+
+    generation = threading.Thread(target=generate, name="tinyllama-stream", daemon=True)
+    generation.start()
+    pieces = []
+    try:
+        for piece in streamer:
+            token_stream.emit(sink, piece)
+            pieces.append(piece)
+    except queue.Empty:
+        raise TimeoutError(f"TinyLlama produced no tokens for {TINYLLAMA_STREAM_TIMEOUT:g}s")
+    generation.join()
+    if errors:
+        raise errors[0]
+    return "".join(pieces).strip()
+
+def call_tinyllama(prompt):
+    sink = token_stream.current_sink()
+    # Timed per caller, so the time spent waiting for the batch to fill is included
+    with metrics.llm_call("TinyLlama", prompt):
+        if sink is not None:
+            return stream_generate(prompt, sink)
+        return batcher.submit(prompt)
+
+def process_small_document(document):
+    try:
+        # Compacted page text, fitted to TinyLlama's context window
+        prompt = build_prompt(SMALL_DOCUMENT_PROMPT, document.searchable_page_texts(), TINYLLAMA_MODEL)
+
         print("Processing small document with TinyLlama...")
         result = call_tinyllama(prompt)
         
@@ -1,15 +1,30 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
-from upload import router as upload_router
-from services.status_manager import get_status
-from services.websocket_manager import add_connection, remove_connection
 import asyncio
+import json
+from fastapi import FastAPI, WebSocket, Request, HTTPException
+from upload import router as upload_router
+from services.status_manager import get_status, get_status_details, get_status_history
+from services.websocket_manager import stream_status, stream_batch, is_terminal
 from fastapi.middleware.cors import CORSMiddleware
-from llm_clients.gemini import ask_gemini_question
-import os
-from PyPDF2 import PdfReader
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from llm_clients.gemini import answer_question, stream_gemini_answer, GeminiError
+from llm_clients.backends import warm_up, readiness, is_enabled
+from llm_clients.health import snapshot as health_snapshot, CLOSED
+from llm_clients.ollama import scheduler as ollama_scheduler
+from llm_clients.tinyllama import batcher as tinyllama_batcher
+from services.document import ParsedDocument
+from services.result_cache import result_cache
+from services.answer_cache import answer_cache
+from services.retrieval import build_index, get_index, format_chunks
+from services import metrics, token_stream
+from services.storage import resolve_document_path
 
 app = FastAPI()
 
+# How often an extraction stream re-checks the job status while no tokens arrive; a job run by
+# another worker never sends this process its tokens, only its final status
+STREAM_STATUS_CHECK_SECONDS = 5
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +37,17 @@ app.add_middleware(
 # Include upload router
 app.include_router(upload_router, prefix="/api", tags=["Upload"])
 
+@app.on_event("startup")
+async def start_backend_warm_up():
+    # Models load lazily on first use; WARMUP_BACKENDS are loaded in the background right away
+    warm_up()
+
+@app.get("/health/ready")
+async def health_ready():
+    """Which LLM backends are enabled and loaded; 503 until the warm-up backends are ready"""
+    state = readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
 # Test endpoints
 @app.get("/test/status/{file_id}")
 async def test_get_status(file_id: str):
@@ -35,62 +61,176 @@ async def test_set_status(file_id: str, status: str):
     update_status(file_id, status)
     return {"message": f"Status for {file_id} set to {status}"}
 
+@app.get("/api/status/{file_id}")
+async def get_status_timeline(file_id: str):
+    """Current status of a file plus the timing of each pipeline stage it went through"""
+    return {
+        "file_id": file_id,
+        "status": get_status(file_id),
+        "details": get_status_details(file_id),
+        "history": get_status_history(file_id),
+        "timeline": metrics.get_timeline(file_id)
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage, LLM and payload-size histograms in Prometheus text format"""
+    cache = result_cache.stats()
+    ollama = ollama_scheduler.stats()
+    tinyllama = tinyllama_batcher.stats()
+    answers = answer_cache.stats()
+    backends = {}
+    for name, stats in health_snapshot().items():
+        backends[f"{name}_breaker_open"] = (f"1 while the {name} circuit breaker is open or half-open", int(stats["state"] != CLOSED))
+        backends[f"{name}_error_rate"] = (f"Share of recent {name} extractions that failed", stats["error_rate"])
+    return metrics.render_prometheus({
+        "ollama_queue_depth": ("Ollama calls waiting for a free slot", ollama["queue_depth"]),
+        "ollama_running": ("Ollama calls currently running", ollama["running"]),
+        "ollama_coalesced_total": ("Ollama calls answered by an identical in-flight call", ollama["coalesced"]),
+        "tinyllama_batches_total": ("Batched TinyLlama generate calls", tinyllama["batches"]),
+        "tinyllama_batched_prompts_total": ("Prompts generated through TinyLlama batches", tinyllama["items"]),
+        "answer_cache_hits": ("Follow-up answers served from the answer cache", answers["hits"]),
+        "answer_cache_misses": ("Follow-up questions sent to the model", answers["misses"]),
+        "result_cache_hits": ("Result cache hits since startup", cache["hits"]),
+        "result_cache_misses": ("Result cache misses since startup", cache["misses"]),
+        "result_cache_entries": ("Entries in the result cache", cache["entries"]),
+        "result_cache_bytes": ("Bytes stored in the result cache", cache["bytes"]),
+        **backends
+    })
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and size of the extraction result cache"""
+    return result_cache.stats()
+
 @app.websocket("/ws/status/{file_id}")
-async def websocket_status(websocket: WebSocket, file_id: str):
-    print(f"New WebSocket connection request for file: {file_id}")
+async def websocket_status(websocket: WebSocket, file_id: str, follow: bool = False):
     await websocket.accept()
-    print(f"WebSocket connection accepted for file: {file_id}")
-    add_connection(file_id, websocket)
-    
     try:
-        # Send initial status
-        initial_status = get_status(file_id)
-        print(f"Sending initial status for {file_id}: {initial_status}")
-        await websocket.send_text(initial_status)
-        
-        last_status = initial_status
-        while True:
-            # Fetch the current status from the status manager
-            current_status = get_status(file_id)
-            if current_status != "Unknown" and current_status != last_status:
-                print(f"Sending status update for {file_id}: {current_status}")
-                await websocket.send_text(current_status)
-                last_status = current_status
-                
-                # Stop sending updates if processing is complete
-                if current_status in ['Completed', 'Failed', 'Stopped']:
-                    print(f"Processing complete for {file_id}, closing connection")
-                    break
-                    
-            await asyncio.sleep(0.1)  # Check status very frequently
-    except WebSocketDisconnect:
-        print(f"Client disconnected: {file_id}")
+        await stream_status(file_id, websocket, follow)
     except Exception as e:
         print(f"Error in WebSocket connection: {str(e)}")
-    finally:
-        remove_connection(file_id)
 
-@app.post("/api/ask")
-async def ask_question(request: Request):
-    data = await request.json()
+@app.websocket("/ws/batch/{batch_id}")
+async def websocket_batch(websocket: WebSocket, batch_id: str):
+    await websocket.accept()
+    try:
+        await stream_batch(batch_id, websocket)
+    except Exception as e:
+        print(f"Error in WebSocket connection: {str(e)}")
+
+def resolve_index(data):
+    """Validate an /api/ask request and return (question, chunk index, error).
+
+    Blocking (it may parse the PDF and build the index), so handlers run it in the threadpool.
+    """
     document_id = data.get("document_id")
     question = data.get("question")
     if not document_id or not question:
-        return {"error": "document_id and question are required"}
-    # Assume file is stored in uploads/ with its filename as document_id
-    file_path = os.path.join("uploads", document_id)
-    if not os.path.exists(file_path):
-        return {"error": "Document not found"}
-    # Extract text from PDF
-    reader = PdfReader(file_path)
-    document_text = ""
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            document_text += page_text
-    if not document_text.strip():
+        return question, None, "document_id and question are required"
+    if not is_enabled("gemini"):
+        return question, None, "Question answering requires the gemini backend, which is disabled"
+    # document_id is the content id returned by the upload (or the filename of older uploads)
+    file_path = resolve_document_path(document_id)
+    if file_path is None:
+        return question, None, "Document not found"
+    index = get_index(document_id)
+    if index is None:
+        with ParsedDocument(file_path) as document:
+            index = build_index(document_id, document)
+    return question, index, None
+
+def sse_event(data):
+    return f"data: {json.dumps(data)}\n\n"
+
+@app.post("/api/ask")
+async def ask_question(request: Request):
+    question, index, error = await run_in_threadpool(resolve_index, await request.json())
+    if error:
+        return {"error": error}
+    # The same (or a near-identical) question about this document was answered before
+    cached = answer_cache.get(index.content_hash, question)
+    if cached is not None:
+        return {"answer": cached, "cached": True}
+    # Retrieve only the chunks relevant to the question from the document's index
+    chunks = index.search(question)
+    if not chunks:
         return {"error": "No text found in document"}
     # Use Gemini to answer the question
-    answer = ask_gemini_question(document_text, question)
+    try:
+        answer = await answer_question(format_chunks(chunks), question)
+    except GeminiError as e:
+        return {"answer": str(e)}
+    if answer.strip():
+        answer_cache.put(index.content_hash, question, answer)
     return {"answer": answer}
 
+@app.post("/api/ask/stream")
+async def ask_question_stream(request: Request):
+    """Same as /api/ask, but the answer arrives as server-sent events while Gemini writes it"""
+    question, index, error = await run_in_threadpool(resolve_index, await request.json())
+
+    async def events():
+        if error:
+            yield sse_event({"error": error})
+            return
+        cached = answer_cache.get(index.content_hash, question)
+        if cached is not None:
+            yield sse_event({"token": cached})
+            yield sse_event({"done": True, "cached": True})
+            return
+        chunks = index.search(question)
+        if not chunks:
+            yield sse_event({"error": "No text found in document"})
+            return
+        pieces = []
+        try:
+            async for piece in stream_gemini_answer(format_chunks(chunks), question):
+                pieces.append(piece)
+                yield sse_event({"token": piece})
+        except GeminiError as e:
+            yield sse_event({"error": str(e)})
+            return
+        answer = "".join(pieces)
+        # An empty answer (e.g. a blocked response) is not worth serving again
+        if answer.strip():
+            answer_cache.put(index.content_hash, question, answer)
+        yield sse_event({"done": True})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/api/answers/stats")
+async def answer_cache_stats():
+    """Hit rate and size of the follow-up answer cache"""
+    return answer_cache.stats()
+
+@app.get("/api/stream/{file_id}")
+async def stream_extraction(file_id: str):
+    """Server-sent events carrying the extraction text of `file_id` as the model generates it.
+
+    Subscribe once the job has a status (text generated before that is sent first); the final
+    result still comes from the upload response. Map-reduced documents only send the closing
+    event. Unknown ids get a 404.
+    """
+    if get_status(file_id) == "Unknown":
+        raise HTTPException(status_code=404, detail="Job not found")
+    queue = token_stream.subscribe(file_id)
+
+    async def events():
+        try:
+            if not is_terminal(get_status(file_id)) or not queue.empty():
+                while True:
+                    try:
+                        piece = await asyncio.wait_for(queue.get(), STREAM_STATUS_CHECK_SECONDS)
+                    except asyncio.TimeoutError:
+                        if is_terminal(get_status(file_id)):
+                            break
+                        continue
+                    if piece is token_stream.DONE:
+                        break
+                    yield sse_event({"token": piece})
+            yield sse_event({"done": True, "status": get_status(file_id)})
+        finally:
+            token_stream.unsubscribe(file_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
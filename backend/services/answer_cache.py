@@ -0,0 +1,127 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+# Minimum similarity (0-1) between two normalized questions for one to reuse the other's answer
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.8"))
+# Questions with fewer content words than this are too vague to match, and always go to the model
+ANSWER_CACHE_MIN_TERMS = int(os.getenv("ANSWER_CACHE_MIN_TERMS", "2"))
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "what", "whats", "which", "who", "how",
+    "does", "do", "did", "of", "in", "on", "for", "to", "this", "that", "document", "please",
+    "tell", "me", "can", "you", "give", "show", "there", "it", "its", "about"
+}
+WORD = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def normalize_question(question):
+    """Content words of a question, lowercased, with stopwords and plural 's' removed"""
+    terms = []
+    for word in WORD.findall(question.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return frozenset(terms)
+
+
+def similarity(a, b):
+    """Jaccard similarity of two normalized questions"""
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    return len(a & b) / len(a | b)
+
+
+def covers(cached, terms):
+    """Whether a cached question asked about every term of `terms`.
+
+    Similarity alone would let "total revenue 2023" reuse the answer to "total revenue";
+    the extra qualifier has to have been part of the cached question.
+    """
+    return terms <= cached
+
+
+class AnswerCache:
+    """In-memory cache of follow-up answers per document content hash.
+
+    A question is answered from the cache when an earlier question about the same
+    document covers all of its content words with similarity of at least `threshold`, so
+    "What is the total revenue?" and "total revenue?" share one answer. Questions with
+    fewer than `min_terms` content words are never cached. The least recently used
+    answers are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries, threshold, min_terms=ANSWER_CACHE_MIN_TERMS):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.min_terms = min_terms
+        # (content_hash, normalized question) -> answer, in LRU order
+        self._entries = OrderedDict()
+        # content_hash -> normalized questions cached for that document
+        self._questions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, content_hash, question):
+        terms = normalize_question(question)
+        with self._lock:
+            best = self._match(content_hash, terms) if len(terms) >= self.min_terms else None
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end((content_hash, best))
+            return self._entries[(content_hash, best)]
+
+    def _match(self, content_hash, terms):
+        """Cached question (normalized) whose answer fits `terms`, or None; needs the lock"""
+        if (content_hash, terms) in self._entries:
+            return terms
+        best, best_score = None, 0.0
+        for candidate in self._questions.get(content_hash, ()):
+            if not covers(candidate, terms):
+                continue
+            score = similarity(terms, candidate)
+            if score > best_score:
+                best, best_score = candidate, score
+        return best if best_score >= self.threshold else None
+
+    def put(self, content_hash, question, answer):
+        terms = normalize_question(question)
+        if len(terms) < self.min_terms:
+            return
+        with self._lock:
+            self._entries[(content_hash, terms)] = answer
+            self._entries.move_to_end((content_hash, terms))
+            self._questions.setdefault(content_hash, set()).add(terms)
+            while len(self._entries) > self.max_entries:
+                (old_hash, old_terms), _ = self._entries.popitem(last=False)
+                questions = self._questions.get(old_hash)
+                questions.discard(old_terms)
+                if not questions:
+                    del self._questions[old_hash]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "threshold": self.threshold,
+                "min_terms": self.min_terms
+            }
+
+
+# Shared cache used by /api/ask
+answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_THRESHOLD)
@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from services.status_manager import get_status, publish_shared, save_record, get_record
+from services.pipeline import prepare_document, extract_document, claim_run, finish_run, report_pending
+
+# Load environment variables
+load_dotenv()
+
+# Threads parsing, probing and classifying documents (CPU-bound)
+BATCH_PREPARE_WORKERS = int(os.getenv("BATCH_PREPARE_WORKERS", "2"))
+# Threads waiting on LLM extraction; prepared documents queue up between the two stages
+BATCH_EXTRACT_WORKERS = int(os.getenv("BATCH_EXTRACT_WORKERS", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_HISTORY = int(os.getenv("BATCH_HISTORY", "100"))
+
+FILE_STATES = ("queued", "preparing", "waiting", "extracting", "completed", "failed")
+FINISHED_STATES = ("completed", "failed")
+
+
+def batch_channel(batch_id):
+    """status_manager key that batch progress is published under"""
+    return f"batch:{batch_id}"
+
+
+def file_record_id(batch_id, index):
+    """Status store key of one file's entry in a batch"""
+    return f"{batch_id}/{index}"
+
+
+class BatchProcessor:
+    """Processes batches of saved PDFs as a two-stage pipeline.
+
+    Parsing and classification of one document run in the prepare pool while others wait
+    on the model in the extract pool, so CPU work overlaps LLM latency. Prepared documents
+    keep their PDF open until extracted, so at most `max_prepared` of them are in flight.
+
+    The batch and each file's entry are also saved to the status store (one record per
+    file, rewritten on every state change), so with a shared store any worker can report
+    a batch running on another.
+    """
+
+    def __init__(self, prepare_workers, extract_workers, history):
+        self.history = history
+        self._prepare = ThreadPoolExecutor(max_workers=prepare_workers, thread_name_prefix="batch-prepare")
+        self._extract = ThreadPoolExecutor(max_workers=extract_workers, thread_name_prefix="batch-extract")
+        self._slots = threading.Semaphore(prepare_workers + 2 * extract_workers)
+        self._batches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, files):
+        """Start a batch of saved files and return its id.
+
+        `files` is a list of dicts with filename, file_id and file_path; an entry with an
+        `error` instead (e.g. a rejected upload) is recorded as failed straight away.
+        """
+        batch_id = uuid.uuid4().hex
+        entries = []
+        for index, item in enumerate(files):
+            entries.append({
+                "index": index,
+                "filename": item.get("filename"),
+                "file_id": item.get("file_id"),
+                "state": "failed" if item.get("error") else "queued",
+                "error": item.get("error"),
+                "result": None,
+                "finished_at": None
+            })
+        created_at = time.time()
+        with self._lock:
+            self._batches[batch_id] = {"batch_id": batch_id, "created_at": created_at, "files": entries}
+            self._trim()
+        for entry in entries:
+            save_record("batch_file", file_record_id(batch_id, entry["index"]), entry)
+        save_record("batch", batch_id, {"batch_id": batch_id, "created_at": created_at, "total": len(entries)})
+
+        for entry, item in zip(entries, files):
+            if entry["state"] == "queued":
+                report_pending(entry["file_id"], "Queued")
+                self._prepare.submit(self._prepare_one, batch_id, entry, item["file_path"])
+        publish_shared(batch_channel(batch_id), "queued")
+        return batch_id
+
+    def _prepare_one(self, batch_id, entry, file_path):
+        run, owner = claim_run(entry["file_id"])
+        if not owner:
+            # The same file is already being processed (in this batch or elsewhere)
+            self._set_state(batch_id, entry, "waiting")
+            run.add_done_callback(lambda run: self._join_run(batch_id, entry, run))
+            return
+        # Wait for room before opening another document
+        self._slots.acquire()
+        self._set_state(batch_id, entry, "preparing")
+        try:
+            document, metadata = prepare_document(entry["file_id"], file_path, entry["file_id"], classify=True)
+        except Exception as e:
+            self._slots.release()
+            finish_run(entry["file_id"], run, error=e)
+            self._set_state(batch_id, entry, "failed", error=str(e))
+            return
+        self._set_state(batch_id, entry, "waiting")
+        self._extract.submit(self._extract_one, batch_id, entry, file_path, document, metadata, run)
+
+    def _extract_one(self, batch_id, entry, file_path, document, metadata, run):
+        self._set_state(batch_id, entry, "extracting")
+        try:
+            result = extract_document(entry["file_id"], file_path, document, metadata)
+            finish_run(entry["file_id"], run, result=dict(result))
+            result["filename"] = entry["filename"]
+            self._set_state(batch_id, entry, "completed", result=result)
+        except Exception as e:
+            finish_run(entry["file_id"], run, error=e)
+            self._set_state(batch_id, entry, "failed", error=str(e))
+        finally:
+            document.close()
+            self._slots.release()
+
+    def _join_run(self, batch_id, entry, run):
+        """Finish a file with the outcome of the run it waited on"""
+        error = run.exception()
+        if error is not None:
+            self._set_state(batch_id, entry, "failed", error=str(error))
+            return
+        result = dict(run.result(), filename=entry["filename"])
+        self._set_state(batch_id, entry, "completed", result=result)
+
+    def _set_state(self, batch_id, entry, state, **fields):
+        with self._lock:
+            entry["state"] = state
+            entry.update(fields)
+            if state in FINISHED_STATES:
+                entry["finished_at"] = time.time()
+            record = dict(entry)
+        save_record("batch_file", file_record_id(batch_id, entry["index"]), record)
+        publish_shared(batch_channel(batch_id), state)
+
+    def _load(self, batch_id):
+        """(created_at, file entries) of a batch, from this process or the status store"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is not None:
+                return batch["created_at"], [dict(entry) for entry in batch["files"]]
+        # Submitted to another worker (or forgotten here after BATCH_HISTORY)
+        header = get_record("batch", batch_id)
+        if header is None:
+            return None
+        files = [get_record("batch_file", file_record_id(batch_id, index)) for index in range(header["total"])]
+        if None in files:
+            # Some entries have expired from the store
+            return None
+        return header["created_at"], files
+
+    def get(self, batch_id, include_results=True):
+        """Aggregate progress and per-file state of a batch, or None if unknown"""
+        loaded = self._load(batch_id)
+        if loaded is None:
+            return None
+        created_at, files = loaded
+
+        counts = {state: 0 for state in FILE_STATES}
+        for entry in files:
+            counts[entry["state"]] += 1
+            entry["status"] = get_status(entry["file_id"]) if entry["file_id"] else "Failed"
+            if not include_results:
+                entry.pop("result")
+        finished = counts["completed"] + counts["failed"]
+        total = len(files)
+        return {
+            "batch_id": batch_id,
+            "created_at": created_at,
+            "total": total,
+            "counts": counts,
+            "progress": round(100 * finished / total) if total else 100,
+            "done": finished == total,
+            "files": files
+        }
+
+    def _trim(self):
+        # Forget the oldest finished batches once the history limit is reached
+        finished = [
+            batch_id for batch_id, batch in self._batches.items()
+            if all(entry["state"] in FINISHED_STATES for entry in batch["files"])
+        ]
+        for batch_id in finished[:max(0, len(self._batches) - self.history)]:
+            del self._batches[batch_id]
+
+
+# Shared processor used by the batch upload endpoint
+batch_processor = BatchProcessor(BATCH_PREPARE_WORKERS, BATCH_EXTRACT_WORKERS, BATCH_HISTORY)
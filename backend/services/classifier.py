@@ -0,0 +1,83 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from services.extraction import FINANCIAL_KEYWORDS, is_financial_table, is_legal_document
+
+# Load environment variables
+load_dotenv()
+
+# Number of highest-scoring pages that get (slow) table detection
+CLASSIFIER_SAMPLE_PAGES = int(os.getenv("CLASSIFIER_SAMPLE_PAGES", "3"))
+# A page with this many distinct financial keywords and this share of numeric tokens is
+# treated as financial without looking for tables
+CONFIDENT_KEYWORDS = 4
+CONFIDENT_NUMERIC_DENSITY = 0.2
+CACHE_SIZE = 1024
+
+TOKEN_PATTERN = re.compile(r"\S+")
+NUMBER_PATTERN = re.compile(r"^[(\-$€£]*\d[\d,.]*%?\)?$")
+
+# (content hash, classification kind) -> result
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def page_signal(text):
+    """(distinct financial keywords, numeric token density) for one page"""
+    lowered = text.lower()
+    keywords = sum(1 for keyword in FINANCIAL_KEYWORDS if keyword in lowered)
+    tokens = TOKEN_PATTERN.findall(text)
+    numeric = sum(1 for token in tokens if NUMBER_PATTERN.match(token))
+    return keywords, numeric / len(tokens) if tokens else 0.0
+
+
+def _classify_financial(document):
+    signals = [page_signal(text) for text in document.page_texts]
+
+    # Tier 1: table cells come from the text layer, so no keyword anywhere means no financial table
+    candidates = [index for index, (keywords, _) in enumerate(signals) if keywords]
+    if not candidates:
+        return False
+
+    # Tier 2: keyword-heavy, number-dense pages are confidently financial
+    for keywords, density in signals:
+        if keywords >= CONFIDENT_KEYWORDS and density >= CONFIDENT_NUMERIC_DENSITY:
+            return True
+
+    # Tier 3: table detection on the most promising pages only, stopping at the first hit
+    candidates.sort(key=lambda index: signals[index][0] * (1 + signals[index][1]), reverse=True)
+    for index in candidates[:CLASSIFIER_SAMPLE_PAGES]:
+        if any(is_financial_table(table) for table in document.tables(index)):
+            return True
+    return False
+
+
+def _cached(kind, document, classify):
+    key = (document.content_hash, kind)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    result = classify(document)
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def classify_financial(document):
+    """Fast stand-in for contains_financial_tables, cached per document content"""
+    return _cached("financial", document, _classify_financial)
+
+
+def classify_legal(document):
+    """is_legal_document, cached per document content"""
+    return _cached("legal", document, is_legal_document)
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
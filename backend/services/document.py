@@ -0,0 +1,180 @@
+import hashlib
+import re
+import threading
+import fitz  # PyMuPDF for page text, metadata and page renders
+from PIL import Image
+
+DEFAULT_RENDER_DPI = 200
+
+
+class ParsedDocument:
+    """A PDF parsed once on upload and shared by every stage of the pipeline.
+
+    Page texts and metadata are read eagerly in a single pass. Tables and page
+    renders are only computed when a stage asks for them, then kept for reuse.
+    The object may be shared by threads (e.g. a hedged extraction): `lock` guards the
+    PDF handles and the caches filled on demand.
+    """
+
+    def __init__(self, file_path, content_hash=None):
+        self.file_path = file_path
+        self._content_hash = content_hash
+        self._doc = fitz.open(file_path)
+        self._plumber = None
+        self._tables = {}
+        self._renders = {}
+        self._page_fingerprints = None
+        self.lock = threading.RLock()
+        # Users that must finish before close() takes effect (see retain)
+        self._holds = 0
+        self._close_pending = False
+        self._hold_lock = threading.Lock()
+        # OCR text by page index, filled in by services/ocr.py while holding `lock`
+        self.ocr_texts = {}
+        self.ocr_layer_loaded = False
+        # Earlier upload this document is a revision of, set by the pipeline (see
+        # record_fingerprints); map-reduce then reuses that upload's part outputs
+        self.revision_of = None
+
+        self.page_texts = [page.get_text() for page in self._doc]
+        raw_metadata = self._doc.metadata or {}
+        self.metadata = {
+            "title": raw_metadata.get("title") or "Unknown Title",
+            "author": raw_metadata.get("author") or "Unknown Author",
+            "subject": raw_metadata.get("subject") or "Unknown Subject",
+            "pages": len(self.page_texts)
+        }
+
+    @property
+    def page_count(self):
+        return len(self.page_texts)
+
+    @property
+    def content_hash(self):
+        """SHA-256 of the file bytes, computed on first use"""
+        if self._content_hash is None:
+            digest = hashlib.sha256()
+            with open(self.file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            self._content_hash = digest.hexdigest()
+        return self._content_hash
+
+    @staticmethod
+    def fingerprint(page_text):
+        """Hash of a page's text that ignores differences in whitespace"""
+        normalized = re.sub(r"\s+", " ", page_text).strip()
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    @property
+    def page_fingerprints(self):
+        """Per-page content fingerprints, used to recognise revisions of a document"""
+        if self._page_fingerprints is None:
+            self._page_fingerprints = [self.fingerprint(text) for text in self.page_texts]
+        return self._page_fingerprints
+
+    def searchable_page_texts(self):
+        """Page texts, with OCR text (where known) standing in for pages without a text layer"""
+        return [
+            text if text.strip() else self.ocr_texts.get(index, text)
+            for index, text in enumerate(self.page_texts)
+        ]
+
+    def text(self):
+        """Full document text with pages concatenated as-is"""
+        return "".join(self.page_texts)
+
+    def _plumber_page(self, page_index):
+        # Callers hold self.lock
+        if self._plumber is None:
+            import pdfplumber
+            self._plumber = pdfplumber.open(self.file_path)
+        return self._plumber.pages[page_index]
+
+    def ruling_counts(self, page_index):
+        """(horizontal, vertical) ruling lines drawn on a page, rectangle sides included.
+
+        Read from PyMuPDF's vector drawings, which is far cheaper than pdfplumber's table
+        search; pdfplumber only finds tables along such lines.
+        """
+        horizontal = vertical = 0
+        with self.lock:
+            drawings = self._doc[page_index].get_drawings()
+        for drawing in drawings:
+            for item in drawing["items"]:
+                if item[0] == "l":
+                    start, end = item[1], item[2]
+                    horizontal += abs(start.y - end.y) < 1
+                    vertical += abs(start.x - end.x) < 1
+                elif item[0] in ("re", "qu"):
+                    horizontal += 2
+                    vertical += 2
+        return horizontal, vertical
+
+    def table_regions(self, page_index):
+        """(bbox, rows) of every table pdfplumber finds on a page, computed on first use"""
+        with self.lock:
+            if page_index not in self._tables:
+                found = self._plumber_page(page_index).find_tables()
+                self._tables[page_index] = [(table.bbox, table.extract()) for table in found]
+            return self._tables[page_index]
+
+    def tables(self, page_index):
+        """Rows of every table on a page (see table_regions)"""
+        return [rows for _, rows in self.table_regions(page_index)]
+
+    def text_outside(self, page_index, bboxes):
+        """Text of a page read by pdfplumber, leaving out everything inside `bboxes`"""
+        def outside(obj):
+            if "x0" not in obj or "top" not in obj:
+                return True
+            x = (obj["x0"] + obj["x1"]) / 2
+            y = (obj["top"] + obj["bottom"]) / 2
+            return not any(x0 <= x <= x1 and top <= y <= bottom for x0, top, x1, bottom in bboxes)
+
+        with self.lock:
+            return self._plumber_page(page_index).filter(outside).extract_text() or ""
+
+    def render_page(self, page_index, dpi=DEFAULT_RENDER_DPI, keep=True):
+        """PIL image of a page, rendered on first use (and only kept for reuse with `keep`)"""
+        key = (page_index, dpi)
+        with self.lock:
+            if key in self._renders:
+                return self._renders[key]
+            pixmap = self._doc[page_index].get_pixmap(dpi=dpi)
+            image = Image.frombytes("RGB", [pixmap.width, pixmap.height], pixmap.samples)
+            if keep:
+                self._renders[key] = image
+            return image
+
+    def retain(self):
+        """Keep the document open for a background user until it calls release()"""
+        with self._hold_lock:
+            self._holds += 1
+
+    def release(self):
+        with self._hold_lock:
+            self._holds -= 1
+            close = self._holds == 0 and self._close_pending
+        if close:
+            self.close()
+
+    def close(self):
+        """Close the PDF, or once the last retain() is released if it is still in use"""
+        with self._hold_lock:
+            self._close_pending = self._holds > 0
+            if self._close_pending:
+                return
+        with self.lock:
+            self._doc.close()
+            if self._plumber is not None:
+                self._plumber.close()
+                self._plumber = None
+            self._renders.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from services.status_manager import save_record, get_record
+from services import metrics
+from services.pipeline import process_pdf, report_pending
+
+# Load environment variables
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "1000"))
+
+
+class QueueFullError(Exception):
+    """Raised when more jobs are waiting than JOB_QUEUE_MAX allows"""
+
+
+class JobQueue:
+    """Runs the document pipeline for submitted uploads on a bounded pool of worker threads.
+
+    Every change to a job is also saved to the status store, so with a shared store any
+    worker can answer `get` for jobs running on another.
+    """
+
+    def __init__(self, max_workers, max_pending, history):
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, file_id, file_path, filename=None, content_hash=None):
+        """Queue a saved PDF for processing and return its job id"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Job queue is full ({self.max_pending} pending)")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "file_id": file_id,
+                "filename": filename,
+                "state": "queued",
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+            self._pending += 1
+            self._trim()
+            record = dict(self._jobs[job_id])
+        save_record("job", job_id, record)
+        report_pending(file_id, "Queued")
+        self._executor.submit(self._run, job_id, file_id, file_path, content_hash)
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        # Submitted to another worker (or forgotten here after JOB_HISTORY)
+        return get_record("job", job_id)
+
+    def _run(self, job_id, file_id, file_path, content_hash):
+        self._update(job_id, state="running", started_at=time.time())
+        with self._lock:
+            self._pending -= 1
+        try:
+            result = process_pdf(file_id, file_path, content_hash)
+            fields = {"state": "completed", "result": result}
+        except Exception as e:
+            # process_pdf has already reported the failure through status_manager
+            fields = {"state": "failed", "error": str(e)}
+        # Timelines are per process, so the finished record carries its own copy
+        self._update(job_id, finished_at=time.time(), timeline=metrics.get_timeline(file_id), **fields)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            record = dict(job)
+        save_record("job", job_id, record)
+
+    def _trim(self):
+        # Forget the oldest finished jobs once the history limit is reached
+        finished = [job_id for job_id, job in self._jobs.items() if job["state"] in ("completed", "failed")]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+
+# Shared queue used by the upload endpoints
+job_queue = JobQueue(JOB_WORKERS, JOB_QUEUE_MAX, JOB_HISTORY)
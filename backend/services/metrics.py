@@ -0,0 +1,140 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB .. 256 MiB
+
+# Number of per-job timelines kept for the status API
+TIMELINE_HISTORY = 1000
+
+# File id of the job the current thread is working on, so nested stages land in its timeline
+current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per label set"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key)]
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{_labels(labels, bound)} {count}")
+                lines.append(f"{self.name}_bucket{_labels(labels, '+Inf')} {series['count']}")
+                lines.append(f"{self.name}_sum{_labels(labels)} {series['sum']}")
+                lines.append(f"{self.name}_count{_labels(labels)} {series['count']}")
+        return "\n".join(lines)
+
+
+def _labels(labels, le=None):
+    if le is not None:
+        labels = labels + [f'le="{le}"']
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+stage_seconds = Histogram(
+    "pipeline_stage_seconds", "Wall time of each document pipeline stage", ("stage",), SECONDS_BUCKETS)
+llm_call_seconds = Histogram(
+    "llm_call_seconds", "Wall time of each LLM backend call", ("model",), SECONDS_BUCKETS)
+document_text_bytes = Histogram(
+    "document_text_bytes", "Size of the extracted text of each processed document", (), BYTES_BUCKETS)
+llm_prompt_bytes = Histogram(
+    "llm_prompt_bytes", "Size of each prompt sent to an LLM backend", ("model",), BYTES_BUCKETS)
+
+HISTOGRAMS = [stage_seconds, llm_call_seconds, document_text_bytes, llm_prompt_bytes]
+
+# file_id -> [{"stage", "started_at", "seconds"}, ...]
+_timelines = OrderedDict()
+_timelines_lock = threading.Lock()
+
+
+def start_timeline(file_id):
+    """Begin a fresh timeline for a job, dropping the oldest once TIMELINE_HISTORY is reached"""
+    with _timelines_lock:
+        _timelines.pop(file_id, None)
+        _timelines[file_id] = []
+        while len(_timelines) > TIMELINE_HISTORY:
+            _timelines.popitem(last=False)
+
+
+def get_timeline(file_id):
+    with _timelines_lock:
+        return list(_timelines.get(file_id, []))
+
+
+def _record(file_id, name, started_at, seconds):
+    if file_id is None:
+        return
+    with _timelines_lock:
+        timeline = _timelines.get(file_id)
+        if timeline is not None:
+            timeline.append({"stage": name, "started_at": started_at, "seconds": round(seconds, 4)})
+
+
+def record_stage(name, file_id, started_at, seconds):
+    """Record a stage that was timed by the caller"""
+    stage_seconds.observe(seconds, stage=name)
+    _record(file_id, name, started_at, seconds)
+
+
+@contextmanager
+def stage(name, file_id=None):
+    """Time a pipeline stage into pipeline_stage_seconds and the job's timeline"""
+    file_id = file_id or current_job.get()
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, file_id, started_at, time.perf_counter() - start)
+
+
+@contextmanager
+def llm_call(model, prompt=None):
+    """Time one LLM backend call and record the prompt size"""
+    if prompt is not None:
+        llm_prompt_bytes.observe(len(prompt.encode("utf-8")), model=model)
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        llm_call_seconds.observe(seconds, model=model)
+        _record(current_job.get(), f"llm:{model}", started_at, seconds)
+
+
+def render_prometheus(extra_gauges=None):
+    """All histograms, plus optional {name: (help, value)} gauges, in Prometheus text format"""
+    sections = [histogram.render() for histogram in HISTOGRAMS]
+    for name, (help_text, value) in (extra_gauges or {}).items():
+        sections.append(f"# HELP {name} {help_text}\n# TYPE {name} gauge\n{name} {value}")
+    return "\n".join(sections) + "\n"
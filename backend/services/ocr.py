@@ -0,0 +1,123 @@
+import gzip
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Per-document OCR text layers (<content hash>.json.gz), so a document is only OCR'd once
+OCR_DIR = os.getenv("OCR_DIR", "ocr")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: the server process runs threads and holds open PDFs
+            _pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def ocr_page(pdf_path, page_number, dpi, tmp_dir):
+    """Render one page (1-based) to a temp PNG and OCR it; runs inside a pool worker"""
+    from pdf2image import convert_from_path
+    import pytesseract
+
+    paths = convert_from_path(
+        pdf_path, dpi=dpi, first_page=page_number, last_page=page_number,
+        output_folder=tmp_dir, fmt="png", paths_only=True
+    )
+    try:
+        return pytesseract.image_to_string(paths[0]) if paths else ""
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+def ocr_pages(pdf_path, page_numbers, dpi=OCR_DPI):
+    """OCR the given 1-based pages and return their texts in the same order.
+
+    Each page is rendered straight to a temp file by the worker that OCRs it, so at most
+    OCR_WORKERS page images exist at once no matter how long the document is.
+    """
+    page_numbers = list(page_numbers)
+    with tempfile.TemporaryDirectory(prefix="ocr-") as tmp_dir:
+        if len(page_numbers) == 1:
+            return [ocr_page(pdf_path, page_numbers[0], dpi, tmp_dir)]
+        pool = _get_pool()
+        futures = [pool.submit(ocr_page, pdf_path, page_number, dpi, tmp_dir) for page_number in page_numbers]
+        return [future.result() for future in futures]
+
+
+def text_layer_path(content_hash):
+    return os.path.join(OCR_DIR, f"{content_hash}.json.gz")
+
+
+def load_text_layer(document):
+    """Fill document.ocr_texts from the document's stored text layer, if there is one"""
+    with document.lock:
+        if document.ocr_layer_loaded:
+            return
+        document.ocr_layer_loaded = True
+        path = text_layer_path(document.content_hash)
+        if not os.path.exists(path):
+            return
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                pages = json.load(f)["pages"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable OCR text layer {path}: {str(e)}")
+            return
+        for index, text in pages.items():
+            document.ocr_texts.setdefault(int(index), text)
+
+
+def save_text_layer(document):
+    """Write every OCR'd page of the document to its text layer file; callers hold document.lock"""
+    os.makedirs(OCR_DIR, exist_ok=True)
+    path = text_layer_path(document.content_hash)
+    fd, tmp_path = tempfile.mkstemp(dir=OCR_DIR, suffix=".part")
+    try:
+        with gzip.open(os.fdopen(fd, "wb"), "wt", encoding="utf-8") as f:
+            json.dump({"pages": {str(index): text for index, text in document.ocr_texts.items()}}, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def ocr_document(document, page_indices=None, dpi=OCR_DPI):
+    """OCR text for 0-based pages of a ParsedDocument (all pages by default).
+
+    Results are kept on the document and in its text layer file under OCR_DIR, so pages
+    OCR'd once (e.g. by the scanned-PDF probe or an earlier upload of the same file) are
+    not rendered again by later stages or requests.
+    """
+    if page_indices is None:
+        page_indices = range(document.page_count)
+    # Held through the OCR itself, so a concurrent caller waits for these pages instead of OCRing them too
+    with document.lock:
+        load_text_layer(document)
+        missing = [index for index in page_indices if index not in document.ocr_texts]
+        if missing:
+            texts = ocr_pages(document.file_path, [index + 1 for index in missing], dpi)
+            document.ocr_texts.update(zip(missing, texts))
+            save_text_layer(document)
+        return [document.ocr_texts[index] for index in page_indices]
+
+
+def ocr_text_layer(document):
+    """Page texts of a document with every page that has no text layer OCR'd"""
+    ocr_document(document, [index for index, text in enumerate(document.page_texts) if not text.strip()])
+    return document.searchable_page_texts()
@@ -0,0 +1,99 @@
+import base64
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+
+# Load environment variables
+load_dotenv()
+
+# Page images sent to Gemini for scanned documents
+SCAN_IMAGE_DPI = int(os.getenv("SCAN_IMAGE_DPI", "150"))
+# Longest side in pixels after cropping; larger pages are downscaled
+SCAN_IMAGE_MAX_SIDE = int(os.getenv("SCAN_IMAGE_MAX_SIDE", "1600"))
+SCAN_IMAGE_GRAYSCALE = os.getenv("SCAN_IMAGE_GRAYSCALE", "1") == "1"
+# JPEG or WEBP
+SCAN_IMAGE_FORMAT = os.getenv("SCAN_IMAGE_FORMAT", "JPEG").upper()
+SCAN_IMAGE_QUALITY = int(os.getenv("SCAN_IMAGE_QUALITY", "70"))
+SCAN_IMAGE_CROP = os.getenv("SCAN_IMAGE_CROP", "1") == "1"
+# Base64 image bytes and pages packed into one Gemini request
+SCAN_PAYLOAD_MB = float(os.getenv("SCAN_PAYLOAD_MB", "4"))
+SCAN_MAX_PAGES_PER_REQUEST = int(os.getenv("SCAN_MAX_PAGES_PER_REQUEST", "8"))
+SCAN_IMAGE_WORKERS = int(os.getenv("SCAN_IMAGE_WORKERS", "4"))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# Pixels lighter than this count as paper when cropping
+WHITE_LEVEL = 245
+# Border in pixels left around the cropped content
+CROP_MARGIN = 12
+
+
+def crop_whitespace(image):
+    """Crop the blank margins around a page's content; blank pages are returned unchanged"""
+    mask = ImageOps.invert(image.convert("L")).point(lambda value: 255 if value > 255 - WHITE_LEVEL else 0)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(0, left - CROP_MARGIN), max(0, top - CROP_MARGIN),
+        min(image.width, right + CROP_MARGIN), min(image.height, bottom + CROP_MARGIN)
+    ))
+
+
+def compress_page(image):
+    """Crop, downscale and encode a page image; returns a Gemini inline_data dict"""
+    if SCAN_IMAGE_CROP:
+        image = crop_whitespace(image)
+    if SCAN_IMAGE_GRAYSCALE:
+        image = image.convert("L")
+    scale = SCAN_IMAGE_MAX_SIDE / max(image.size)
+    if scale < 1:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+    buffered = BytesIO()
+    image.save(buffered, format=SCAN_IMAGE_FORMAT, quality=SCAN_IMAGE_QUALITY)
+    return {
+        "mime_type": MIME_TYPES[SCAN_IMAGE_FORMAT],
+        "data": base64.b64encode(buffered.getvalue()).decode("utf-8")
+    }
+
+
+def encode_pages(document, page_indices=None):
+    """Compressed inline_data for 0-based pages of a ParsedDocument, in page order.
+
+    Pages are rendered one after another (the PDF handle is not thread-safe) and
+    compressed in SCAN_IMAGE_WORKERS threads while the next page renders. At most twice
+    that many full-size renders are held in memory at once.
+    """
+    if page_indices is None:
+        page_indices = range(document.page_count)
+    window = 2 * SCAN_IMAGE_WORKERS
+    futures = []
+    with ThreadPoolExecutor(max_workers=SCAN_IMAGE_WORKERS) as pool:
+        for index in page_indices:
+            if len(futures) >= window:
+                futures[-window].result()
+            futures.append(pool.submit(compress_page, document.render_page(index, SCAN_IMAGE_DPI, keep=False)))
+        return [future.result() for future in futures]
+
+
+def pack_pages(images, budget_bytes=SCAN_PAYLOAD_MB * 1024 * 1024, max_pages=SCAN_MAX_PAGES_PER_REQUEST):
+    """Group consecutive page images into requests of at most `budget_bytes` and `max_pages`.
+
+    Returns [(first page index, [inline_data, ...])]. A page larger than the budget on
+    its own still gets a request of its own.
+    """
+    batches, current, first, used = [], [], 0, 0
+    for index, image in enumerate(images):
+        size = len(image["data"])
+        if current and (used + size > budget_bytes or len(current) >= max_pages):
+            batches.append((first, current))
+            current, used = [], 0
+        if not current:
+            first = index
+        current.append(image)
+        used += size
+    if current:
+        batches.append((first, current))
+    return batches
@@ -0,0 +1,199 @@
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from services.status_manager import update_status
+from services.extraction import extract_pdf_metadata, is_scanned_pdf, has_embedded_text
+from services.ocr import ocr_text_layer
+from services.classifier import classify_financial, classify_legal
+from services.document import ParsedDocument
+from services.retrieval import build_index
+from services.result_cache import result_cache
+from llm_clients.langchain_router import LangChainRouter
+from services import metrics, token_stream
+
+# Share of pages a document must have in common with an earlier one to count as its revision
+REVISION_MIN_SIMILARITY = 0.5
+
+# Classification helpers handed to the router's conditions
+ROUTER_HELPERS = {
+    "contains_financial_tables": classify_financial,
+    "is_legal_document": classify_legal
+}
+
+# Runs in progress by content id: uploads of the same file while it is processed join that run
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+class ProcessingError(Exception):
+    """Raised when a document goes through the pipeline but yields no usable result"""
+
+
+@contextmanager
+def job_context(file_id):
+    """Attribute metrics to `file_id` and report a failure through status_manager"""
+    job_token = metrics.current_job.set(file_id)
+    try:
+        yield
+    except Exception as e:
+        update_status(file_id, f"Failed: {str(e)}")
+        token_stream.finish(file_id)
+        raise
+    finally:
+        metrics.current_job.reset(job_token)
+
+
+def record_fingerprints(document):
+    """Store the document's page fingerprints and return the earlier revision it matches.
+
+    Pages without text (e.g. scanned pages) are left out, since they all look alike.
+    Returns {"content_hash", "similarity"} or None.
+    """
+    fingerprints = [
+        fingerprint for fingerprint, text in zip(document.page_fingerprints, document.page_texts) if text.strip()
+    ]
+    match = result_cache.find_revision(document.content_hash, fingerprints)
+    result_cache.put_fingerprints(document.content_hash, fingerprints)
+    if match is None or match[1] < REVISION_MIN_SIMILARITY:
+        return None
+    return {"content_hash": match[0], "similarity": round(match[1], 3)}
+
+
+def prepare_document(file_id, file_path, content_hash=None, classify=False):
+    """Parse, probe and index a saved PDF; returns (document, metadata).
+
+    This is the CPU-bound half of the pipeline. With `classify`, the routing decision is
+    also made here so extract_document() only waits on the model. The caller closes the
+    returned document.
+    """
+    with job_context(file_id):
+        # Extract metadata
+        update_status(file_id, "Extracting")
+        # Parse once; every helper and extractor below reuses this object
+        with metrics.stage("parse"):
+            document = ParsedDocument(file_path, content_hash=content_hash)
+        try:
+            metrics.document_text_bytes.observe(len(document.text().encode("utf-8")))
+            with metrics.stage("metadata"):
+                metadata = extract_pdf_metadata(document)
+            with metrics.stage("ocr_probe"):
+                metadata["is_scanned"] = is_scanned_pdf(document)
+            if not has_embedded_text(document):
+                # OCR every page without a text layer once; the text is stored with the
+                # document so Q&A and re-processing never OCR it again
+                with metrics.stage("ocr"):
+                    ocr_text_layer(document)
+            # Chunk index used by /api/ask follow-up questions
+            with metrics.stage("index"):
+                build_index(file_id, document)
+            with metrics.stage("fingerprint"):
+                revision = record_fingerprints(document)
+            if revision is not None:
+                metadata["revision_of"] = revision
+                document.revision_of = revision
+            if classify:
+                LangChainRouter().choose_branch(document, metadata, ROUTER_HELPERS)
+        except Exception:
+            document.close()
+            raise
+        return document, metadata
+
+
+def extract_document(file_id, file_path, document, metadata):
+    """Route a prepared document to its extractor and return the response payload"""
+    try:
+        with job_context(file_id):
+            # Route to appropriate LLM using LangChainRouter
+            update_status(file_id, "Processing")
+            router = LangChainRouter()
+            with metrics.stage("route"):
+                result, processing_type = router.route(document, metadata, ROUTER_HELPERS)
+
+            # Handle None result
+            if result is None:
+                raise ProcessingError("No result received from processing")
+
+            # Ensure data is a string
+            if result.get("data") is None:
+                result["data"] = "No data extracted from document"
+
+            if not result.get("success", False):
+                error_message = result.get("error", "Unknown error")
+                data_message = result.get("data", "No additional information")
+                raise ProcessingError(f"Processing failed: {error_message}. {data_message}")
+
+            update_status(file_id, "Extracted")
+            update_status(file_id, "Completed")
+
+            return {
+                "message": "File uploaded and processed successfully",
+                "file_id": file_id,
+                "file_path": file_path,
+                "metadata": metadata,
+                "processing_type": processing_type,
+                "model": result.get("model", "Unknown"),
+                # Backend that actually served the extraction, and the branch it stood in for
+                "backend": result.get("backend"),
+                "fallback_from": result.get("fallback_from"),
+                "results": str(result.get("data", ""))
+            }
+    finally:
+        token_stream.finish(file_id)
+
+
+def claim_run(file_id):
+    """(future, owner) for processing `file_id`.
+
+    The first caller owns the run and must hand its outcome to finish_run(); callers that
+    arrive while it is in progress get the same future and should wait on it instead.
+    """
+    with _runs_lock:
+        future = _runs.get(file_id)
+        if future is not None:
+            return future, False
+        future = _runs[file_id] = Future()
+        return future, True
+
+
+def report_pending(file_id, status):
+    """Set a pre-processing status (Uploading, Queued) unless `file_id` is already being
+    processed, whose subscribers would otherwise see it move backwards"""
+    with _runs_lock:
+        running = file_id in _runs
+    if not running:
+        update_status(file_id, status)
+
+
+def finish_run(file_id, future, result=None, error=None):
+    """Publish the outcome of a run claimed with claim_run()"""
+    with _runs_lock:
+        _runs.pop(file_id, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def process_pdf(file_id, file_path, content_hash=None):
+    """Run the blocking extraction pipeline for a saved PDF and return the response payload.
+
+    Status updates go through status_manager under `file_id`. Runs in a worker thread,
+    never directly on the event loop. Pass `content_hash` when it is already known from
+    the upload so the file is not hashed again. A file already being processed is not
+    processed twice; the caller gets (a copy of) that run's payload.
+    """
+    future, owner = claim_run(file_id)
+    if not owner:
+        return dict(future.result())
+    try:
+        document, metadata = prepare_document(file_id, file_path, content_hash)
+        try:
+            result = extract_document(file_id, file_path, document, metadata)
+        finally:
+            document.close()
+    except BaseException as e:
+        # Joined callers get the same error instead of waiting forever
+        finish_run(file_id, future, error=e)
+        raise
+    finish_run(file_id, future, result=dict(result))
+    return result
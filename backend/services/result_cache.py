@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "result_cache.db")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024
+RESULT_CACHE_MAX_AGE = float(os.getenv("RESULT_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600
+
+
+class ResultCache:
+    """On-disk cache of extraction results, keyed by document content and routing choice.
+
+    Entries older than `max_age` seconds are dropped on read and on write. When the cache
+    holds more than `max_entries` rows or `max_bytes` of results, the least recently used
+    entries are evicted first. Remembered routes and page fingerprints are trimmed the same
+    way, by age and to at most `max_entries` documents each.
+    """
+
+    def __init__(self, path, max_entries, max_bytes, max_age):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS routes ("
+            "content_hash TEXT PRIMARY KEY, branch TEXT NOT NULL, updated_at REAL NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "content_hash TEXT NOT NULL, page INTEGER NOT NULL, fingerprint TEXT NOT NULL, "
+            "updated_at REAL NOT NULL DEFAULT 0, PRIMARY KEY (content_hash, page))"
+        )
+        # Caches created before routes and pages were trimmed; their old rows age out first
+        for table in ("routes", "pages"):
+            columns = [row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")]
+            if "updated_at" not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN updated_at REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_fingerprint ON pages (fingerprint)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS routes_updated ON routes (updated_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_updated ON pages (updated_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(content_hash, branch, prompt_template, model):
+        """Cache key for one document processed by one branch, prompt and model"""
+        parts = json.dumps([content_hash, branch, prompt_template, model])
+        return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_chunk_key(label, prompt):
+        """Key of one chunk-level model call, so unchanged chunks of a revision are reused"""
+        parts = json.dumps(["chunk", label, prompt])
+        return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+    def get(self, key, count=True):
+        """Cached result for `key`; `count=False` leaves the hit/miss counters alone"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                if row is not None:
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += count
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += count
+        return json.loads(row[0])
+
+    def record_hit(self):
+        """Count a hit served from a `get(count=False)` lookup"""
+        with self._lock:
+            self.hits += 1
+
+    def put(self, key, result):
+        payload = json.dumps(result)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, result, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def get_route(self, content_hash):
+        """Branch a document was routed to last time, if known"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT branch, updated_at FROM routes WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                return None
+            self._conn.execute("UPDATE routes SET updated_at = ? WHERE content_hash = ?", (now, content_hash))
+            self._conn.commit()
+        return row[0]
+
+    def put_route(self, content_hash, branch):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO routes (content_hash, branch, updated_at) VALUES (?, ?, ?)",
+                (content_hash, branch, now)
+            )
+            self._evict_routes(now)
+            self._conn.commit()
+
+    def put_fingerprints(self, content_hash, fingerprints):
+        """Remember the page fingerprints of a processed document"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE content_hash = ?", (content_hash,))
+            self._conn.executemany(
+                "INSERT INTO pages (content_hash, page, fingerprint, updated_at) VALUES (?, ?, ?, ?)",
+                [(content_hash, page, fingerprint, now) for page, fingerprint in enumerate(fingerprints)]
+            )
+            self._evict_pages(now)
+            self._conn.commit()
+
+    def find_revision(self, content_hash, fingerprints):
+        """Earlier document sharing the most pages with these fingerprints.
+
+        Returns (content_hash, similarity) where similarity is the share of distinct pages
+        the two documents have in common, or None if no page matches.
+        """
+        distinct = list(set(fingerprints))
+        if not distinct:
+            return None
+        with self._lock:
+            # Parameters are bound in slices to stay under SQLite's variable limit
+            matches = {}
+            for start in range(0, len(distinct), 500):
+                batch = distinct[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT content_hash, COUNT(DISTINCT fingerprint) FROM pages "
+                    f"WHERE fingerprint IN ({','.join('?' * len(batch))}) AND content_hash != ? "
+                    "GROUP BY content_hash",
+                    (*batch, content_hash)
+                ).fetchall()
+                for other, count in rows:
+                    matches[other] = matches.get(other, 0) + count
+            if not matches:
+                return None
+            best, shared = max(matches.items(), key=lambda item: item[1])
+            other_pages = self._conn.execute(
+                "SELECT COUNT(DISTINCT fingerprint) FROM pages WHERE content_hash = ?", (best,)
+            ).fetchone()[0]
+        return best, shared / max(len(distinct), other_pages)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.max_age,))
+        entries, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            entries -= 1
+            total_bytes -= size
+
+    def _evict_routes(self, now):
+        self._conn.execute("DELETE FROM routes WHERE updated_at < ?", (now - self.max_age,))
+        # Keep the `max_entries` most recently used routes
+        self._conn.execute(
+            "DELETE FROM routes WHERE content_hash IN ("
+            "SELECT content_hash FROM routes ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def _evict_pages(self, now):
+        self._conn.execute("DELETE FROM pages WHERE updated_at < ?", (now - self.max_age,))
+        # Keep the fingerprints of the `max_entries` most recently processed documents
+        self._conn.execute(
+            "DELETE FROM pages WHERE content_hash IN ("
+            "SELECT content_hash FROM pages GROUP BY content_hash "
+            "ORDER BY MAX(updated_at) DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.execute("DELETE FROM routes")
+            self._conn.execute("DELETE FROM pages")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes
+        }
+
+
+# Shared cache used by the router
+result_cache = ResultCache(
+    RESULT_CACHE_PATH,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_MAX_AGE
+)
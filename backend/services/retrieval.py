@@ -0,0 +1,162 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from dotenv import load_dotenv
+from services.ocr import load_text_layer
+
+# Load environment variables
+load_dotenv()
+
+INDEX_DIR = os.getenv("INDEX_DIR", "indexes")
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1200"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+# Indexes kept in memory; the least recently used are dropped and reloaded from disk when needed
+RETRIEVAL_MAX_INDEXES = int(os.getenv("RETRIEVAL_MAX_INDEXES", "100"))
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which",
+    "who", "why", "with", "does", "do", "did", "document"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def chunk_pages(page_texts, max_chars=CHUNK_MAX_CHARS):
+    """Split page texts into paragraph chunks of at most `max_chars`, never crossing a page"""
+    chunks = []
+    for page_num, page_text in enumerate(page_texts, 1):
+        current = ""
+        for paragraph in re.split(r"\n\s*\n", page_text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if current and len(current) + len(paragraph) + 1 > max_chars:
+                chunks.append({"page": page_num, "text": current})
+                current = ""
+            # Hard-split paragraphs that are longer than a chunk on their own
+            while len(paragraph) > max_chars:
+                chunks.append({"page": page_num, "text": paragraph[:max_chars]})
+                paragraph = paragraph[max_chars:]
+            current = f"{current}\n{paragraph}" if current else paragraph
+        if current:
+            chunks.append({"page": page_num, "text": current})
+    return chunks
+
+
+class ChunkIndex:
+    """BM25 inverted index over the page/paragraph chunks of one document"""
+
+    def __init__(self, content_hash, chunks, postings, doc_lengths):
+        self.content_hash = content_hash
+        self.chunks = chunks
+        self.postings = postings  # term -> [[chunk index, term frequency], ...]
+        self.doc_lengths = doc_lengths
+        self.avg_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, content_hash, page_texts):
+        chunks = chunk_pages(page_texts)
+        postings = {}
+        doc_lengths = []
+        for chunk_idx, chunk in enumerate(chunks):
+            tokens = tokenize(chunk["text"])
+            doc_lengths.append(len(tokens))
+            for term, freq in Counter(tokens).items():
+                postings.setdefault(term, []).append([chunk_idx, freq])
+        return cls(content_hash, chunks, postings, doc_lengths)
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """Top-k chunks for a query, returned in document order"""
+        n = len(self.chunks)
+        scores = Counter()
+        for term in set(tokenize(query)):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            idf = math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            for chunk_idx, freq in entries:
+                norm = K1 * (1 - B + B * self.doc_lengths[chunk_idx] / (self.avg_length or 1))
+                scores[chunk_idx] += idf * freq * (K1 + 1) / (freq + norm)
+        top = [chunk_idx for chunk_idx, _ in scores.most_common(k)]
+        if not top:
+            # No term overlap: fall back to the start of the document
+            top = list(range(min(k, n)))
+        return [self.chunks[chunk_idx] for chunk_idx in sorted(top)]
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "content_hash": self.content_hash,
+                "chunks": self.chunks,
+                "postings": self.postings,
+                "doc_lengths": self.doc_lengths
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["content_hash"], data["chunks"], data["postings"], data["doc_lengths"])
+
+
+# Loaded indexes by document id, least recently used first
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def index_path(document_id):
+    return os.path.join(INDEX_DIR, f"{document_id}.json")
+
+
+def build_index(document_id, document):
+    """Build and persist the chunk index for a parsed document.
+
+    Scanned pages are indexed from the document's OCR text layer, when it has one.
+    """
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    load_text_layer(document)
+    index = ChunkIndex.build(document.content_hash, document.searchable_page_texts())
+    index.save(index_path(document_id))
+    _remember(document_id, index)
+    return index
+
+
+def _remember(document_id, index):
+    with _indexes_lock:
+        _indexes[document_id] = index
+        _indexes.move_to_end(document_id)
+        while len(_indexes) > RETRIEVAL_MAX_INDEXES:
+            _indexes.popitem(last=False)
+
+
+def get_index(document_id):
+    """Load a document's chunk index from memory or disk, or None if it was never built"""
+    with _indexes_lock:
+        index = _indexes.get(document_id)
+        if index is not None:
+            _indexes.move_to_end(document_id)
+            return index
+    if not os.path.exists(index_path(document_id)):
+        return None
+    index = ChunkIndex.load(index_path(document_id))
+    _remember(document_id, index)
+    return index
+
+
+def format_chunks(chunks):
+    """Join retrieved chunks into prompt context, labelled with their page numbers"""
+    return "\n\n".join(f"[Page {chunk['page']}]\n{chunk['text']}" for chunk in chunks)
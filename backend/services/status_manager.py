@@ -1,16 +1,103 @@
-from fastapi import FastAPI
 import asyncio
+import threading
+import time
+from services.status_store import create_store
 
-# Store status updates
-status_updates = {}
+# Status and details of every job (see STATUS_STORE in services/status_store.py)
+store = create_store()
+
+# Subscribers waiting for status changes: file_id -> {queue: event loop that owns it}
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+_watcher = None
+_watcher_lock = threading.Lock()
 
 def update_status(file_id: str, status: str):
-    """Update the status of a file processing task"""
+    """Update the status of a file processing task and push it to every subscriber"""
     print(f"Updating status for {file_id} to: {status}")
-    status_updates[file_id] = status
+    store.set_status(file_id, status)
+    publish(file_id, status)
+
+def update_status_details(file_id: str, **details):
+    """Attach details to the current status; a None value removes that detail"""
+    store.update_details(file_id, details)
+
+def get_status_details(file_id: str) -> dict:
+    return store.get_details(file_id)
 
 def get_status(file_id: str) -> str:
     """Get the current status of a file processing task"""
-    status = status_updates.get(file_id, "Unknown")
-    print(f"Getting status for {file_id}: {status}")
-    return status
+    return store.get_status(file_id) or "Unknown"
+
+def get_status_history(file_id: str) -> list:
+    """Timestamped statuses the job went through, oldest first"""
+    return store.history(file_id)
+
+def save_record(kind: str, record_id: str, record: dict):
+    """Keep a job/batch record where every worker can read it (see status_store)"""
+    store.put_record(kind, record_id, record)
+
+def get_record(kind: str, record_id: str):
+    """A record saved with save_record by any worker, or None if unknown or expired"""
+    return store.get_record(kind, record_id)
+
+def publish_shared(channel: str, status: str):
+    """publish() to this process, and with a shared store also to other workers' subscribers"""
+    if store.shared:
+        # Written to the status history, where the other workers' watchers pick it up
+        store.set_status(channel, status)
+    publish(channel, status)
+
+def publish(file_id: str, status: str):
+    """Wake every subscriber of `file_id`; safe to call from worker threads"""
+    with _subscribers_lock:
+        subscribers = list(_subscribers.get(file_id, {}).items())
+    for queue, loop in subscribers:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, status)
+        except RuntimeError:
+            # The subscriber's event loop has shut down
+            unsubscribe(file_id, queue)
+
+def subscribe(file_id: str) -> asyncio.Queue:
+    """Register a subscriber for `file_id`; must be called from a running event loop"""
+    queue = asyncio.Queue()
+    with _subscribers_lock:
+        _subscribers.setdefault(file_id, {})[queue] = asyncio.get_running_loop()
+    if store.shared:
+        _start_watcher()
+    return queue
+
+def unsubscribe(file_id: str, queue: asyncio.Queue):
+    with _subscribers_lock:
+        queues = _subscribers.get(file_id)
+        if queues is not None:
+            queues.pop(queue, None)
+            if not queues:
+                del _subscribers[file_id]
+
+def subscriber_count(file_id: str) -> int:
+    with _subscribers_lock:
+        return len(_subscribers.get(file_id, {}))
+
+def _start_watcher():
+    """Forward status changes written by other worker processes to local subscribers"""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            return
+        _watcher = threading.Thread(target=_watch, name="status-watcher", daemon=True)
+        _watcher.start()
+
+def _watch():
+    last_id = store.last_change_id()
+    while True:
+        try:
+            for change_id, file_id, status, pid in store.changes_since(last_id):
+                last_id = change_id
+                # Changes made in this process were already published by update_status
+                if pid != store.pid and subscriber_count(file_id):
+                    publish(file_id, status)
+        except Exception as e:
+            print(f"Status watcher error: {str(e)}")
+        time.sleep(store.poll_interval)
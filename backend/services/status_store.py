@@ -0,0 +1,261 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# "memory" (one process) or "sqlite" (shared by every worker using the same file)
+STATUS_STORE = os.getenv("STATUS_STORE", "memory")
+STATUS_DB_PATH = os.getenv("STATUS_DB_PATH", "status.db")
+STATUS_TTL = float(os.getenv("STATUS_TTL_HOURS", "24")) * 3600
+STATUS_MAX_JOBS = int(os.getenv("STATUS_MAX_JOBS", "10000"))
+# How often a shared store is polled for status changes made by other worker processes
+STATUS_POLL_SECONDS = int(os.getenv("STATUS_POLL_MS", "200")) / 1000
+# Statuses kept per job in the in-memory history
+MEMORY_HISTORY = 50
+
+
+class MemoryStatusStore:
+    """Per-process status store; jobs expire after `ttl` seconds and the least recently
+    updated are evicted beyond `max_jobs`. Records (see `put_record`) are bounded the same way.
+    """
+
+    shared = False
+
+    def __init__(self, max_jobs, ttl):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        # (kind, record_id) -> (JSON, updated_at)
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _job(self, file_id):
+        job = self._jobs.get(file_id)
+        if job is None:
+            job = self._jobs[file_id] = {"status": None, "details": {}, "history": [], "updated_at": time.time()}
+        self._jobs.move_to_end(file_id)
+        return job
+
+    def _evict(self, now):
+        while self._jobs:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if len(self._jobs) <= self.max_jobs and now - oldest["updated_at"] <= self.ttl:
+                break
+            del self._jobs[oldest_id]
+
+    def set_status(self, file_id, status):
+        now = time.time()
+        with self._lock:
+            job = self._job(file_id)
+            job["status"] = status
+            job["updated_at"] = now
+            job["history"] = (job["history"] + [{"status": status, "at": now}])[-MEMORY_HISTORY:]
+            self._evict(now)
+
+    def update_details(self, file_id, details):
+        with self._lock:
+            current = self._job(file_id)["details"]
+            for key, value in details.items():
+                if value is None:
+                    current.pop(key, None)
+                else:
+                    current[key] = value
+
+    def _live(self, file_id):
+        job = self._jobs.get(file_id)
+        if job is None or time.time() - job["updated_at"] > self.ttl:
+            return None
+        return job
+
+    def get_status(self, file_id):
+        with self._lock:
+            job = self._live(file_id)
+            return job["status"] if job else None
+
+    def get_details(self, file_id):
+        with self._lock:
+            job = self._live(file_id)
+            return dict(job["details"]) if job else {}
+
+    def history(self, file_id):
+        with self._lock:
+            job = self._live(file_id)
+            return list(job["history"]) if job else []
+
+    def put_record(self, kind, record_id, record):
+        """Store a JSON-serializable record (e.g. a job or batch) under `kind`/`record_id`"""
+        now = time.time()
+        data = json.dumps(record, default=str)
+        with self._lock:
+            self._records.pop((kind, record_id), None)
+            self._records[(kind, record_id)] = (data, now)
+            while self._records:
+                oldest, (_, updated_at) = next(iter(self._records.items()))
+                if len(self._records) <= self.max_jobs and now - updated_at <= self.ttl:
+                    break
+                del self._records[oldest]
+
+    def get_record(self, kind, record_id):
+        with self._lock:
+            entry = self._records.get((kind, record_id))
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return json.loads(entry[0])
+
+
+class SQLiteStatusStore:
+    """Status store in a SQLite database (WAL mode) shared by every worker process.
+
+    Every status change is appended to `status_history` with its time and the writing
+    process id, so each process can pick up changes made by the others (`changes_since`).
+    Job and batch records live in `records`, so any worker can answer for them. Rows older
+    than `ttl` seconds are purged periodically, and are not returned in the meantime.
+    Watchers poll `changes_since` every `poll_interval` seconds.
+    """
+
+    shared = True
+    PURGE_EVERY = 1000
+
+    def __init__(self, path, ttl, poll_interval=STATUS_POLL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.pid = os.getpid()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS status ("
+            "file_id TEXT PRIMARY KEY, status TEXT, details TEXT NOT NULL DEFAULT '{}', "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS status_history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, file_id TEXT NOT NULL, status TEXT NOT NULL, "
+            "at REAL NOT NULL, pid INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS status_history_file ON status_history (file_id, id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "kind TEXT NOT NULL, record_id TEXT NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, record_id))"
+        )
+        self._conn.commit()
+
+    def set_status(self, file_id, status):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO status (file_id, status, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(file_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                (file_id, status, now)
+            )
+            self._conn.execute(
+                "INSERT INTO status_history (file_id, status, at, pid) VALUES (?, ?, ?, ?)",
+                (file_id, status, now, self.pid)
+            )
+            self._count_write(now)
+            self._conn.commit()
+
+    def _count_write(self, now):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge(now)
+
+    def _purge(self, now):
+        cutoff = now - self.ttl
+        self._conn.execute("DELETE FROM status WHERE updated_at < ?", (cutoff,))
+        self._conn.execute("DELETE FROM status_history WHERE at < ?", (cutoff,))
+        self._conn.execute("DELETE FROM records WHERE updated_at < ?", (cutoff,))
+
+    def update_details(self, file_id, details):
+        with self._lock:
+            row = self._conn.execute("SELECT details FROM status WHERE file_id = ?", (file_id,)).fetchone()
+            current = json.loads(row[0]) if row else {}
+            for key, value in details.items():
+                if value is None:
+                    current.pop(key, None)
+                else:
+                    current[key] = value
+            self._conn.execute(
+                "INSERT INTO status (file_id, details, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(file_id) DO UPDATE SET details = excluded.details",
+                (file_id, json.dumps(current), time.time())
+            )
+            self._conn.commit()
+
+    def _row(self, file_id):
+        row = self._conn.execute(
+            "SELECT status, details, updated_at FROM status WHERE file_id = ?", (file_id,)
+        ).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            return None
+        return row
+
+    def get_status(self, file_id):
+        with self._lock:
+            row = self._row(file_id)
+            return row[0] if row else None
+
+    def get_details(self, file_id):
+        with self._lock:
+            row = self._row(file_id)
+            return json.loads(row[1]) if row else {}
+
+    def history(self, file_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, at FROM status_history WHERE file_id = ? AND at >= ? ORDER BY id",
+                (file_id, time.time() - self.ttl)
+            ).fetchall()
+        return [{"status": status, "at": at} for status, at in rows]
+
+    def put_record(self, kind, record_id, record):
+        """Store a JSON-serializable record (e.g. a job or batch) under `kind`/`record_id`"""
+        now = time.time()
+        data = json.dumps(record, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO records (kind, record_id, data, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(kind, record_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (kind, record_id, data, now)
+            )
+            self._count_write(now)
+            self._conn.commit()
+
+    def get_record(self, kind, record_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM records WHERE kind = ? AND record_id = ?", (kind, record_id)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def last_change_id(self):
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(id) FROM status_history").fetchone()
+        return row[0] or 0
+
+    def changes_since(self, last_id):
+        """Status changes after `last_id`, oldest first: [(id, file_id, status, pid)]"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, file_id, status, pid FROM status_history WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+
+
+def create_store():
+    if STATUS_STORE == "sqlite":
+        return SQLiteStatusStore(STATUS_DB_PATH, STATUS_TTL, STATUS_POLL_SECONDS)
+    if STATUS_STORE != "memory":
+        raise ValueError(f"Unknown STATUS_STORE '{STATUS_STORE}' (expected 'memory' or 'sqlite')")
+    return MemoryStatusStore(STATUS_MAX_JOBS, STATUS_TTL)
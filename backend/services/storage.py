@@ -0,0 +1,58 @@
+import hashlib
+import os
+import tempfile
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_MB"""
+
+
+def upload_path(file_id):
+    return os.path.join(UPLOAD_DIR, f"{file_id}.pdf")
+
+
+def resolve_document_path(document_id):
+    """Path of a stored PDF by content id, falling back to files saved under their original name"""
+    if os.path.basename(document_id) != document_id:
+        return None
+    for path in (upload_path(document_id), os.path.join(UPLOAD_DIR, document_id)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def save_stream(stream, max_bytes=MAX_UPLOAD_BYTES):
+    """Stream a file object to uploads/ in chunks, hashing as it goes.
+
+    The data lands in a temp file that is atomically renamed to `<sha256>.pdf`, so memory
+    stays bounded by the chunk size and concurrent uploads never see a partial file.
+    Returns (file_id, file_path, size) where file_id is the SHA-256 of the content.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"File exceeds the {max_bytes // (1024 * 1024)} MB upload limit")
+                digest.update(chunk)
+                out.write(chunk)
+        file_id = digest.hexdigest()
+        file_path = upload_path(file_id)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return file_id, file_path, size
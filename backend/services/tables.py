@@ -0,0 +1,134 @@
+import os
+import re
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Render tables found in the text layer directly instead of asking the LLM to redraw them
+TABLE_FAST_PATH = os.getenv("TABLE_FAST_PATH", "1") == "1"
+# Smaller detections are usually ruled boxes or layout grids, and their text is left in the body
+TABLE_MIN_ROWS = 2
+TABLE_MIN_COLUMNS = 2
+# Row labels listed per table in the digest sent to the LLM
+DIGEST_ROW_LABELS = 8
+
+# Starts the table digest appended to the text of a page with tables
+TABLE_DIGEST_HEADER = "[Tables on this page, rendered separately]"
+
+TOTAL_ROW = re.compile(r"\b(total|net|gross|profit|loss|balance)\b", re.IGNORECASE)
+
+
+def clean_cell(cell):
+    """One-line cell text that is safe inside a Markdown table"""
+    return re.sub(r"\s+", " ", cell or "").strip().replace("|", "\\|")
+
+
+def clean_rows(rows):
+    """Rows with cleaned cells, dropping rows and columns that are empty throughout"""
+    rows = [[clean_cell(cell) for cell in row] for row in rows if row and any(cell for cell in row)]
+    if not rows:
+        return []
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    filled = [i for i in range(width) if any(row[i] for row in rows)]
+    return [[row[i] for i in filled] for row in rows]
+
+
+def to_markdown(rows):
+    """Markdown table with the first row as header"""
+    header = [cell or f"Column {i}" for i, cell in enumerate(rows[0], 1)]
+    lines = [
+        "| " + " | ".join(header) + " |",
+        "|" + "|".join("---" for _ in header) + "|"
+    ]
+    lines += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+    return "\n".join(lines)
+
+
+class TableLayout:
+    """A digital PDF split into the tables of its text layer and the text around them.
+
+    `tables` holds {"page", "rows"} per usable table, in page order. `page_texts` are the
+    document's page texts with the table regions removed (pages without tables are kept
+    exactly as parsed), so only prose has to go through the LLM.
+    """
+
+    def __init__(self, tables, page_texts):
+        self.tables = tables
+        self.page_texts = page_texts
+
+    def _by_page(self):
+        """[(page, [rows, ...])] in page order; tables are numbered per page"""
+        pages = []
+        for table in self.tables:
+            if pages and pages[-1][0] == table["page"]:
+                pages[-1][1].append(table["rows"])
+            else:
+                pages.append((table["page"], [table["rows"]]))
+        return pages
+
+    def markdown_sections(self):
+        """One `### Page N` section per page with tables, as used under `## Tables`"""
+        return [
+            f"### Page {page}\n\n" + "\n\n".join(
+                f"**Table {number}**\n{to_markdown(rows)}" for number, rows in enumerate(tables, 1)
+            )
+            for page, tables in self._by_page()
+        ]
+
+    def page_digests(self):
+        """Per page, a compact description of its tables (size, columns, row labels and
+        total rows), or "" for pages without tables.
+
+        Each digest only depends on its own page, so editing one table leaves the prompts
+        of chunks covering other pages unchanged.
+        """
+        digests = [""] * len(self.page_texts)
+        for page, tables in self._by_page():
+            lines = [TABLE_DIGEST_HEADER]
+            for number, rows in enumerate(tables, 1):
+                header, body = rows[0], rows[1:]
+                lines.append(
+                    f"Table {number}: {len(body)} rows x {len(header)} columns; "
+                    f"columns: {', '.join(cell or '-' for cell in header)}"
+                )
+                labels = [row[0] for row in body if row[0]]
+                if labels:
+                    more = f" (+{len(labels) - DIGEST_ROW_LABELS} more)" if len(labels) > DIGEST_ROW_LABELS else ""
+                    lines.append(f"  rows: {', '.join(labels[:DIGEST_ROW_LABELS])}{more}")
+                for row in body:
+                    if TOTAL_ROW.search(row[0]):
+                        lines.append(f"  {row[0]}: {' | '.join(row[1:])}")
+            digests[page - 1] = "\n".join(lines)
+        return digests
+
+
+def may_have_table(document, page_index):
+    """Whether a page has enough ruling lines to hold a usable table.
+
+    A table of TABLE_MIN_ROWS x TABLE_MIN_COLUMNS cells needs one more horizontal and
+    vertical rule than that; other pages skip pdfplumber's (slow) table search.
+    """
+    horizontal, vertical = document.ruling_counts(page_index)
+    return horizontal > TABLE_MIN_ROWS and vertical > TABLE_MIN_COLUMNS
+
+
+def extract_layout(document):
+    """TableLayout of a document, or None when it has no usable tables"""
+    tables, page_texts = [], list(document.page_texts)
+    for page_index in range(document.page_count):
+        if not document.page_texts[page_index].strip() or not may_have_table(document, page_index):
+            continue
+        bboxes = []
+        for bbox, rows in document.table_regions(page_index):
+            rows = clean_rows(rows)
+            if len(rows) < TABLE_MIN_ROWS or len(rows[0]) < TABLE_MIN_COLUMNS:
+                continue
+            tables.append({"page": page_index + 1, "rows": rows})
+            bboxes.append(bbox)
+        if bboxes:
+            page_texts[page_index] = document.text_outside(page_index, bboxes)
+    if not tables:
+        return None
+    return TableLayout(tables, page_texts)
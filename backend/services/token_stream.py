@@ -0,0 +1,89 @@
+import asyncio
+import contextlib
+import contextvars
+import threading
+from services import metrics
+
+# Set while generating text that should not be streamed (e.g. concurrent map-reduce chunks)
+_muted = contextvars.ContextVar("token_stream_muted", default=False)
+
+# file_id -> text generated so far for the extraction in progress
+_buffers = {}
+# file_id -> {queue: event loop that owns it}
+_subscribers = {}
+_lock = threading.Lock()
+
+# Pushed to subscribers once the extraction has finished
+DONE = None
+
+
+@contextlib.contextmanager
+def muted():
+    """Generate without forwarding tokens inside this block"""
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+
+def current_sink():
+    """file_id whose subscribers should receive tokens generated right now, or None.
+
+    Backends only switch to their streaming APIs when this returns an id, so jobs nobody
+    is watching keep using the plain (and for TinyLlama, batched) calls.
+    """
+    file_id = metrics.current_job.get()
+    if file_id is None or _muted.get():
+        return None
+    with _lock:
+        return file_id if _subscribers.get(file_id) else None
+
+
+def emit(file_id, text):
+    """Forward a piece of generated text; safe to call from worker threads"""
+    if not text:
+        return
+    with _lock:
+        # Nobody is listening any more, e.g. a hedged call still generating after its job ended
+        if not _subscribers.get(file_id):
+            return
+        _buffers[file_id] = _buffers.get(file_id, "") + text
+        subscribers = list(_subscribers.get(file_id, {}).items())
+    _push(file_id, subscribers, text)
+
+
+def finish(file_id):
+    """Tell subscribers the extraction is over and drop the buffered text"""
+    with _lock:
+        _buffers.pop(file_id, None)
+        subscribers = list(_subscribers.get(file_id, {}).items())
+    _push(file_id, subscribers, DONE)
+
+
+def _push(file_id, subscribers, item):
+    for queue, loop in subscribers:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # The subscriber's event loop has shut down
+            unsubscribe(file_id, queue)
+
+
+def subscribe(file_id):
+    """Register a subscriber for `file_id`; text generated before it joined comes first"""
+    queue = asyncio.Queue()
+    with _lock:
+        _subscribers.setdefault(file_id, {})[queue] = asyncio.get_running_loop()
+        if _buffers.get(file_id):
+            queue.put_nowait(_buffers[file_id])
+    return queue
+
+
+def unsubscribe(file_id, queue):
+    with _lock:
+        queues = _subscribers.get(file_id)
+        if queues is not None:
+            queues.pop(queue, None)
+            if not queues:
+                del _subscribers[file_id]
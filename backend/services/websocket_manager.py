@@ -1,23 +1,95 @@
-from typing import Dict
+from typing import Dict, Set
 import asyncio
-from fastapi import WebSocket
-
-# Store active WebSocket connections
-active_connections: Dict[str, WebSocket] = {}
-
-def broadcast_status(file_id: str, status: str):
-    """Broadcast status update to all connected clients for a file"""
-    if file_id in active_connections:
-        try:
-            asyncio.create_task(active_connections[file_id].send_text(status))
-        except Exception as e:
-            print(f"Error broadcasting status: {str(e)}")
-            active_connections.pop(file_id, None)
+from fastapi import WebSocket, WebSocketDisconnect
+from services.status_manager import get_status, subscribe, unsubscribe
+from services.batches import batch_processor, batch_channel
+
+# Store active WebSocket connections, any number per file
+active_connections: Dict[str, Set[WebSocket]] = {}
+
+TERMINAL_STATUSES = ['Completed', 'Failed', 'Stopped']
+
+def is_terminal(status: str) -> bool:
+    return status in TERMINAL_STATUSES or status.startswith("Failed:")
 
 def add_connection(file_id: str, websocket: WebSocket):
     """Add a new WebSocket connection"""
-    active_connections[file_id] = websocket
+    active_connections.setdefault(file_id, set()).add(websocket)
 
-def remove_connection(file_id: str):
+def remove_connection(file_id: str, websocket: WebSocket):
     """Remove a WebSocket connection"""
-    active_connections.pop(file_id, None) 
\ No newline at end of file
+    connections = active_connections.get(file_id)
+    if connections is not None:
+        connections.discard(websocket)
+        if not connections:
+            active_connections.pop(file_id, None)
+
+async def stream_status(file_id: str, websocket: WebSocket, follow: bool = False):
+    """Push status changes for `file_id` to the socket until processing ends or the client leaves.
+
+    The socket sleeps on its subscriber queue and only wakes when update_status publishes.
+    With `follow`, the client is about to upload the file: ids are content hashes, so a
+    terminal status left by an earlier upload of the same file is not sent and the socket
+    waits for the new run instead.
+    """
+    # Subscribe before reading the current status so no update can slip in between
+    queue = subscribe(file_id)
+    add_connection(file_id, websocket)
+    # Watch for the client going away while we wait for the next update
+    receiver = asyncio.ensure_future(websocket.receive_text())
+    try:
+        last_status = get_status(file_id)
+        stale = follow and is_terminal(last_status)
+        if not stale:
+            await websocket.send_text(last_status)
+        while stale or not is_terminal(last_status):
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                receiver.result()  # raises WebSocketDisconnect once the client closes
+                receiver = asyncio.ensure_future(websocket.receive_text())
+                continue
+            status = getter.result()
+            stale = False
+            if status != last_status:
+                await websocket.send_text(status)
+                last_status = status
+    except WebSocketDisconnect:
+        print(f"Client disconnected: {file_id}")
+    finally:
+        receiver.cancel()
+        unsubscribe(file_id, queue)
+        remove_connection(file_id, websocket)
+
+async def stream_batch(batch_id: str, websocket: WebSocket):
+    """Push a batch progress snapshot (JSON) on every file state change until the batch is done"""
+    channel = batch_channel(batch_id)
+    queue = subscribe(channel)
+    add_connection(channel, websocket)
+    receiver = asyncio.ensure_future(websocket.receive_text())
+    try:
+        snapshot = batch_processor.get(batch_id, include_results=False)
+        if snapshot is None:
+            await websocket.send_json({"error": "Batch not found"})
+            return
+        await websocket.send_json(snapshot)
+        while not snapshot["done"]:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                receiver.result()  # raises WebSocketDisconnect once the client closes
+                receiver = asyncio.ensure_future(websocket.receive_text())
+                continue
+            # Several files may have moved on since the last wake-up; one snapshot covers them all
+            while not queue.empty():
+                queue.get_nowait()
+            snapshot = batch_processor.get(batch_id, include_results=False)
+            await websocket.send_json(snapshot)
+    except WebSocketDisconnect:
+        print(f"Client disconnected: batch {batch_id}")
+    finally:
+        receiver.cancel()
+        unsubscribe(channel, queue)
+        remove_connection(channel, websocket)
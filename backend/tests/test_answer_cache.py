@@ -0,0 +1,62 @@
+import unittest
+
+try:
+    from services.answer_cache import AnswerCache, normalize_question
+except ImportError as e:  # python-dotenv is only installed with the backend requirements
+    raise unittest.SkipTest(f"answer cache dependencies missing: {e}")
+
+
+class NormalizeQuestionTest(unittest.TestCase):
+    def test_drops_stop_words_case_and_plurals(self):
+        self.assertEqual(normalize_question("What are the Payments due?"), frozenset({"payment", "due"}))
+        self.assertEqual(normalize_question("the business address"), frozenset({"business", "address"}))
+
+    def test_keeps_decimal_numbers(self):
+        self.assertEqual(normalize_question("rate 4.5 percent"), frozenset({"rate", "4.5", "percent"}))
+
+
+class AnswerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = AnswerCache(max_entries=3, threshold=0.8, min_terms=2)
+        self.cache.put("doc", "What is the total revenue?", "4.2 billion")
+
+    def test_rephrased_question_reuses_the_answer(self):
+        self.assertEqual(self.cache.get("doc", "total revenues?"), "4.2 billion")
+        self.assertEqual(self.cache.get("doc", "Tell me the total revenue"), "4.2 billion")
+
+    def test_answers_are_per_document(self):
+        self.assertIsNone(self.cache.get("other", "What is the total revenue?"))
+
+    def test_extra_qualifier_is_a_miss(self):
+        # {total, revenue} vs {total, revenue, 2023} is still similar, but asks for more
+        self.cache.threshold = 0.6
+        self.assertIsNone(self.cache.get("doc", "total revenue in 2023?"))
+
+    def test_subset_of_a_cached_question_needs_the_threshold(self):
+        self.cache.put("doc", "total revenue by segment region", "table")
+        self.assertIsNone(self.cache.get("doc", "revenue by region?"))
+
+    def test_short_and_empty_questions_are_never_cached(self):
+        self.cache.put("doc", "revenue?", "short")
+        self.cache.put("doc", "what is it?", "empty")
+        self.assertIsNone(self.cache.get("doc", "revenue?"))
+        self.assertIsNone(self.cache.get("doc", "what is this?"))
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_least_recently_used_answers_are_evicted(self):
+        self.cache.put("doc", "contract end date", "2025")
+        self.cache.put("doc", "notice period length", "90 days")
+        self.cache.get("doc", "total revenue")
+        self.cache.put("doc", "governing law clause", "Delaware")
+        self.assertIsNone(self.cache.get("doc", "contract end date"))
+        self.assertEqual(self.cache.get("doc", "total revenue"), "4.2 billion")
+
+    def test_stats_count_hits_and_misses(self):
+        self.cache.get("doc", "total revenue")
+        self.cache.get("doc", "net income")
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
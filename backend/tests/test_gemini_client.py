@@ -0,0 +1,125 @@
+import asyncio
+import time
+import unittest
+
+try:
+    import httpx
+    from llm_clients import gemini_client as gemini_module
+    from llm_clients.gemini_client import GeminiClient, GeminiError, RateLimiter
+except ImportError as e:  # httpx/tenacity are only installed with the backend requirements
+    raise unittest.SkipTest(f"Gemini client dependencies missing: {e}")
+
+OK_BODY = {"candidates": [{"content": {"parts": [{"text": "ok"}]}}]}
+
+
+def make_client(handler, **kwargs):
+    kwargs.setdefault("rate_per_minute", 0)
+    return GeminiClient(base_url="http://gemini.test/v1", api_key="test", transport=httpx.MockTransport(handler), **kwargs)
+
+
+async def acquire_all(limiter, count):
+    """Seconds taken to acquire `count` tokens one after another"""
+    start = time.monotonic()
+    for _ in range(count):
+        await limiter.acquire()
+    return time.monotonic() - start
+
+
+class GeminiClientRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+
+    def client(self, handler, **kwargs):
+        client = make_client(handler, **kwargs)
+        self.clients.append(client)
+        return client
+
+    def test_retries_retryable_statuses_until_success(self):
+        statuses = [429, 503, 200]
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            status = statuses[len(requests) - 1]
+            if status != 200:
+                return httpx.Response(status, headers={"retry-after": "0"})
+            return httpx.Response(200, json=OK_BODY)
+
+        result = self.client(handler).generate("gemini-test", {"contents": []})
+        self.assertEqual(result, OK_BODY)
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(requests[0].url.path, "/v1/models/gemini-test:generateContent")
+
+    def test_gives_up_after_max_retries(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(500, headers={"retry-after": "0"})
+
+        with self.assertRaises(GeminiError) as raised:
+            self.client(handler, max_retries=2).generate("gemini-test", {"contents": []})
+        self.assertEqual(raised.exception.status_code, 500)
+        self.assertEqual(len(requests), 3)
+
+    def test_does_not_retry_client_errors(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(400)
+
+        with self.assertRaises(GeminiError):
+            self.client(handler).generate("gemini-test", {"contents": []})
+        self.assertEqual(len(requests), 1)
+
+    def test_backoff_honours_retry_after_up_to_the_cap(self):
+        original = gemini_module.GEMINI_MAX_BACKOFF
+        gemini_module.GEMINI_MAX_BACKOFF = 0.3
+        try:
+            statuses = [429, 200]
+            calls = []
+
+            def handler(request):
+                calls.append(time.monotonic())
+                if statuses[len(calls) - 1] == 429:
+                    return httpx.Response(429, headers={"retry-after": "60"})
+                return httpx.Response(200, json=OK_BODY)
+
+            self.client(handler).generate("gemini-test", {"contents": []})
+            waited = calls[1] - calls[0]
+            self.assertGreaterEqual(waited, 0.25)
+            self.assertLess(waited, 5)
+        finally:
+            gemini_module.GEMINI_MAX_BACKOFF = original
+
+    def test_stream_yields_sse_chunks(self):
+        def handler(request):
+            self.assertEqual(request.url.params["alt"], "sse")
+            body = "".join(f"data: {chunk}\n\n" for chunk in ('{"n": 1}', '{"n": 2}'))
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+        chunks = list(self.client(handler).stream("gemini-test", {"contents": []}))
+        self.assertEqual(chunks, [{"n": 1}, {"n": 2}])
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_spaces_requests_beyond_the_burst(self):
+        # 600 per minute = one every 0.1s once the single-request burst is used
+        elapsed = asyncio.run(acquire_all(RateLimiter(600, burst=1), 4))
+        self.assertGreaterEqual(elapsed, 0.28)
+        self.assertLess(elapsed, 1.0)
+
+    def test_burst_is_not_delayed(self):
+        self.assertLess(asyncio.run(acquire_all(RateLimiter(60, burst=5), 5)), 0.05)
+
+    def test_zero_rate_disables_the_limiter(self):
+        self.assertLess(asyncio.run(acquire_all(RateLimiter(0), 100)), 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from llm_clients.fakes import FakeDocument, FakeLLM
+
+try:
+    from llm_clients import health as health_module
+    from llm_clients.health import BackendHealth, CLOSED, OPEN, HALF_OPEN
+except ImportError as e:  # python-dotenv is only installed with the backend requirements
+    raise unittest.SkipTest(f"backend requirements missing: {e}")
+
+try:
+    from llm_clients import langchain_router as router
+    from services.result_cache import ResultCache
+except ImportError:  # langchain and the model clients
+    router = None
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        backend = BackendHealth("fake", failures=3, cooldown=60)
+        backend.record(False, 1.0)
+        backend.record(False, 1.0)
+        backend.record(True, 1.0)
+        # A success in between resets the count
+        backend.record(False, 1.0)
+        backend.record(False, 1.0)
+        self.assertEqual(backend.stats()["state"], CLOSED)
+        backend.record(False, 1.0)
+        self.assertEqual(backend.stats()["state"], OPEN)
+        self.assertFalse(backend.allow())
+
+    def test_half_open_lets_one_trial_through(self):
+        backend = BackendHealth("fake", failures=1, cooldown=0.05)
+        backend.record(False, 1.0)
+        self.assertFalse(backend.allow())
+        time.sleep(0.06)
+        self.assertTrue(backend.allow())
+        self.assertEqual(backend.stats()["state"], HALF_OPEN)
+        # Only one trial at a time
+        self.assertFalse(backend.allow())
+        backend.record(True, 0.5)
+        self.assertEqual(backend.stats()["state"], CLOSED)
+        self.assertTrue(backend.allow())
+
+    def test_failed_trial_reopens_for_another_cooldown(self):
+        backend = BackendHealth("fake", failures=5, cooldown=0.05)
+        for _ in range(5):
+            backend.record(False, 1.0)
+        time.sleep(0.06)
+        self.assertTrue(backend.allow())
+        backend.record(False, 1.0)
+        self.assertEqual(backend.stats()["state"], OPEN)
+        self.assertFalse(backend.allow())
+
+    def test_released_trial_can_be_retried(self):
+        backend = BackendHealth("fake", failures=1, cooldown=0)
+        backend.record(False, 1.0)
+        self.assertTrue(backend.allow())
+        self.assertFalse(backend.allow())
+        backend.release()
+        self.assertTrue(backend.allow())
+
+    def test_stats_report_latency_and_error_rate(self):
+        backend = BackendHealth("fake", window=4, failures=10, cooldown=60)
+        for seconds in (1.0, 2.0, 3.0):
+            backend.record(True, seconds)
+        backend.record(False, 9.0)
+        stats = backend.stats()
+        self.assertEqual(stats["calls"], 4)
+        self.assertEqual(stats["error_rate"], 0.25)
+        self.assertEqual(stats["p50_seconds"], 2.0)
+        self.assertEqual(stats["p95_seconds"], 3.0)
+
+
+def extractor(llm):
+    """Branch extractor answering through a fake model, like the real ones (errors included)"""
+    def extract(document):
+        try:
+            return {"success": True, "model": "fake", "data": llm.invoke("\n".join(document.page_texts))}
+        except Exception as e:
+            return {"success": False, "model": "fake", "error": str(e)}
+    return extract
+
+
+@unittest.skipIf(router is None, "backend requirements not installed")
+class HedgedRaceTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = ResultCache(os.path.join(directory.name, "cache.db"), 1000, 1 << 30, 3600)
+        patchers = [
+            mock.patch.object(router, "result_cache", cache),
+            mock.patch.dict(health_module.HEALTH, clear=True),
+            mock.patch.object(router, "FALLBACK_BRANCHES", ["large"]),
+            mock.patch.object(router, "HEDGE_DEFAULT_SECONDS", 0.1),
+            mock.patch.object(router, "EXTRACTION_DEADLINE_SECONDS", 5),
+            mock.patch.object(router, "LLM_HEDGING", True)
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.document = FakeDocument(["page one", "page two"])
+        # Runs first: losing calls finish in the background and must still see the patches
+        self.addCleanup(self.join_extractions)
+
+    def join_extractions(self):
+        for thread in threading.enumerate():
+            if thread.name.startswith("extract-"):
+                thread.join(5)
+
+    def use(self, primary, fallback):
+        """Serve the "default" branch (ollama) with `primary` and "large" (gemini) with `fallback`"""
+        branches = dict(router.BRANCHES)
+        for branch, llm in (("default", primary), ("large", fallback)):
+            processing_type, _, model, prompt = branches[branch]
+            branches[branch] = (processing_type, extractor(llm), model, prompt)
+        patcher = mock.patch.object(router, "BRANCHES", branches)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fast_primary_is_not_hedged(self):
+        primary, fallback = FakeLLM(response="primary"), FakeLLM(response="fallback")
+        self.use(primary, fallback)
+        served, result = router.race("default", self.document)
+        self.assertEqual((served, result["data"]), ("default", "primary"))
+        self.assertEqual(fallback.calls, 0)
+
+    def test_slow_primary_is_hedged_and_the_faster_call_wins(self):
+        primary, fallback = FakeLLM(delay=1.0, response="primary"), FakeLLM(response="fallback")
+        self.use(primary, fallback)
+        start = time.monotonic()
+        served, result = router.race("default", self.document)
+        self.assertEqual((served, result["data"]), ("large", "fallback"))
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertEqual(primary.calls, 1)
+
+    def test_failing_primary_falls_back_without_hedging(self):
+        primary = FakeLLM(error=RuntimeError("model down"))
+        fallback = FakeLLM(response="fallback")
+        self.use(primary, fallback)
+        with mock.patch.object(router, "LLM_HEDGING", False):
+            served, result = router.race("default", self.document)
+        self.assertEqual((served, result["data"]), ("large", "fallback"))
+        self.assertEqual(health_module.health("ollama").stats()["consecutive_failures"], 1)
+
+    def test_deadline_bounds_the_wait_and_counts_as_failure(self):
+        self.use(FakeLLM(delay=2.0), FakeLLM(delay=2.0))
+        start = time.monotonic()
+        with mock.patch.object(router, "EXTRACTION_DEADLINE_SECONDS", 0.3):
+            served, result = router.race("default", self.document)
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(served, "default")
+        self.assertFalse(result["success"])
+        self.assertIn("timed out", result["error"])
+        for backend in ("ollama", "gemini"):
+            self.assertEqual(health_module.health(backend).stats()["consecutive_failures"], 1)
+
+    def test_open_breaker_skips_the_fallback(self):
+        primary = FakeLLM(error=RuntimeError("model down"))
+        fallback = FakeLLM(response="fallback")
+        self.use(primary, fallback)
+        gemini = health_module.health("gemini")
+        for _ in range(gemini.failures):
+            gemini.record(False, 1.0)
+        served, result = router.race("default", self.document)
+        self.assertEqual(served, "default")
+        self.assertFalse(result["success"])
+        self.assertEqual(fallback.calls, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import random
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+from llm_clients.fakes import FakeDocument, FakeLLM
+
+try:
+    from llm_clients import map_reduce
+    from services.result_cache import ResultCache
+except ImportError as e:  # python-dotenv is only installed with the backend requirements
+    raise unittest.SkipTest(f"backend requirements missing: {e}")
+
+WORDS = "revenue margin contract party clause notice term payment asset liability cash audit".split()
+PAGE_MARKER = re.compile(r"^--- Page (\d+) ---$", re.MULTILINE)
+
+
+def make_pages(count, seed=7, chars=1000):
+    rng = random.Random(seed)
+    pages = []
+    for number in range(count):
+        words = [f"section{number}"]
+        while sum(len(word) + 1 for word in words) < chars:
+            words.append(rng.choice(WORDS) + str(rng.randrange(1000)))
+        pages.append(" ".join(words))
+    return pages
+
+
+def map_prompts(llm):
+    """Chunk prompts the fake model received (the reduce prompt has no page markers)"""
+    return [prompt for prompt in llm.prompts if PAGE_MARKER.search(prompt)]
+
+
+def pages_in(prompt):
+    return [int(number) for number in PAGE_MARKER.findall(prompt)]
+
+
+class IncrementalMapReduceTest(unittest.TestCase):
+    MAX_CHARS = 60000
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = ResultCache(os.path.join(directory.name, "cache.db"), 10000, 1 << 30, 3600)
+        patcher = mock.patch.object(map_reduce, "result_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def extract(self, pages, revision_of=None, llm=None):
+        llm = llm or FakeLLM(response="notes ({chars} chars)")
+        document = FakeDocument(pages, revision_of=revision_of)
+        output = map_reduce.map_reduce(document, "Extract:\n{text}", llm.invoke, self.MAX_CHARS, label="fake")
+        return llm, output
+
+    def test_first_upload_packs_parts_into_budget_sized_calls(self):
+        llm, output = self.extract(make_pages(50))
+        # 50 pages of ~1k chars fit one 60k call, plus the reduce call
+        self.assertEqual(len(map_prompts(llm)), 1)
+        self.assertEqual(llm.calls, 2)
+        self.assertIn("## Tables", output)
+
+    def test_one_page_edit_reextracts_only_its_part(self):
+        pages = make_pages(50)
+        self.extract(pages)
+        pages[19] = pages[19].replace("section19", "section19 amended")
+        llm, _ = self.extract(pages, revision_of={"content_hash": "earlier"})
+
+        prompts = map_prompts(llm)
+        self.assertEqual(len(prompts), 1)
+        self.assertIn(20, pages_in(prompts[0]))
+        # Only the edited page's part (about CHUNK_ANCHOR_PAGES pages) goes back to the model
+        self.assertLessEqual(len(pages_in(prompts[0])), 4 * map_reduce.CHUNK_ANCHOR_PAGES)
+        self.assertEqual(llm.calls, 2)
+
+    def test_inserted_page_does_not_invalidate_later_parts(self):
+        pages = make_pages(50)
+        self.extract(pages)
+        revised = pages[:10] + ["section new inserted page " * 30] + pages[10:]
+        llm, _ = self.extract(revised, revision_of={"content_hash": "earlier"})
+
+        prompts = map_prompts(llm)
+        self.assertEqual(len(prompts), 1)
+        self.assertIn(11, pages_in(prompts[0]))
+        self.assertLessEqual(len(pages_in(prompts[0])), 4 * map_reduce.CHUNK_ANCHOR_PAGES + 1)
+
+    def test_unrelated_upload_does_not_reuse_parts(self):
+        pages = make_pages(50)
+        self.extract(pages)
+        pages[19] += " amended"
+        llm, _ = self.extract(pages)
+        self.assertEqual(sorted(pages_in(map_prompts(llm)[0])), list(range(1, 51)))
+
+    def test_answer_without_part_markers_is_used_whole(self):
+        pages = make_pages(50)
+        llm, output = self.extract(pages, llm=FakeLLM(response="plain notes", keep_parts=False))
+        self.assertIn("[Pages 1-50]\nplain notes", llm.prompts[-1])
+        # Nothing was stored per part, so a revision has nothing to reuse
+        pages[19] += " amended"
+        llm, _ = self.extract(pages, revision_of={"content_hash": "earlier"})
+        self.assertEqual(len(pages_in(map_prompts(llm)[0])), 50)
+
+
+class SplitTest(unittest.TestCase):
+    def test_parts_end_at_anchor_pages_and_respect_the_budget(self):
+        document = FakeDocument(make_pages(40))
+        parts = map_reduce.split_parts(document.page_texts, 5000, document.page_fingerprints)
+        self.assertEqual([part["first_page"] for part in parts][0], 1)
+        for previous, part in zip(parts, parts[1:]):
+            self.assertEqual(part["first_page"], previous["last_page"] + 1)
+        self.assertTrue(all(len(part["text"]) <= 5000 for part in parts))
+        for part in parts[:-1]:
+            at_anchor = map_reduce.is_anchor(document.page_fingerprints[part["last_page"] - 1])
+            self.assertTrue(at_anchor or len(part["text"]) > 5000 - 1100)
+
+    def test_split_answer_requires_every_part_in_order(self):
+        answer = "=== Part 1 ===\na\n=== Part 2 ===\nb"
+        self.assertEqual(map_reduce.split_answer(answer, 2), ["a", "b"])
+        self.assertIsNone(map_reduce.split_answer(answer, 3))
+        self.assertIsNone(map_reduce.split_answer("=== Part 2 ===\nb\n=== Part 1 ===\na", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest import mock
+
+from llm_clients import prompt_builder
+from llm_clients.prompt_builder import build_prompt, compact_pages, fit_pages, TRUNCATION_MARKER
+
+
+def report_pages(count):
+    """Pages with a running header, a "Page N of M" footer and a body of their own"""
+    return [
+        f"ACME Corp   Annual Report 2023\n\nSection {number}: body text for page {number}.\n"
+        f"Revenue\n{1000 + number}\n\nPage {number} of {count}"
+        for number in range(1, count + 1)
+    ]
+
+
+class CompactPagesTest(unittest.TestCase):
+    def test_removes_running_headers_and_page_numbers(self):
+        compacted = compact_pages(report_pages(6))
+        for number, page in enumerate(compacted, 1):
+            self.assertNotIn("ACME Corp", page)
+            self.assertNotIn("of 6", page)
+            self.assertTrue(page.startswith(f"Section {number}:"))
+            self.assertTrue(page.endswith(str(1000 + number)))
+
+    def test_repeated_label_inside_the_page_is_kept(self):
+        # "Revenue" repeats on every page but sits above each page's own figure
+        self.assertTrue(all("Revenue" in page for page in compact_pages(report_pages(6))))
+
+    def test_repeated_bare_numbers_are_not_treated_as_footers(self):
+        pages = [f"Body of page {number}\nTotal\n2023" for number in range(1, 6)]
+        self.assertTrue(all(page.endswith("2023") for page in compact_pages(pages)))
+
+    def test_short_documents_are_left_alone(self):
+        pages = report_pages(2)
+        self.assertIn("ACME Corp Annual Report 2023", compact_pages(pages)[0])
+
+    def test_whitespace_is_normalized_and_notes_are_appended(self):
+        compacted = compact_pages(["a  \t b\n\n\n\nc"], notes=["| table |"])
+        self.assertEqual(compacted, ["a b\n\nc\n| table |"])
+
+
+class FitPagesTest(unittest.TestCase):
+    def test_everything_fits(self):
+        self.assertEqual(fit_pages(["one", "two"], 1000), "\n--- Page 1 ---\none\n--- Page 2 ---\ntwo")
+
+    def test_cuts_the_first_page_that_does_not_fit_at_a_line_break(self):
+        pages = ["a" * 50, "first line\n" + "b" * 200]
+        # Page 1 (66 chars with its marker), then room for 20 characters of page 2's body
+        budget = 66 + len("\n--- Page 2 ---\n") + 20 + len(TRUNCATION_MARKER)
+        text = fit_pages(pages, budget)
+        self.assertLessEqual(len(text), budget)
+        expected = "\n--- Page 1 ---\n" + "a" * 50 + "\n--- Page 2 ---\nfirst line" + TRUNCATION_MARKER.format(page=2)
+        self.assertEqual(text, expected)
+
+    def test_later_pages_are_dropped_after_the_marker(self):
+        text = fit_pages(["a" * 50, "b" * 50, "c" * 50], 80)
+        self.assertNotIn("c", text.replace(TRUNCATION_MARKER.format(page=2), ""))
+
+    def test_first_page_offsets_the_markers(self):
+        self.assertIn("--- Page 11 ---", fit_pages(["text"], 100, first_page=11))
+
+
+class BuildPromptTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(prompt_builder.BUDGETS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        prompt_builder.register_budget("test-model", context_tokens=300, output_tokens=100, chars_per_token=4)
+
+    def test_prompt_fits_the_model_budget(self):
+        pages = [f"Page body {number} " + "word " * 100 for number in range(10)]
+        prompt = build_prompt("Summarize:\n{text}", pages, "test-model")
+        self.assertLessEqual(prompt_builder.estimate_tokens(prompt, "test-model"), 200 + 1)
+        self.assertIn("[Truncated", prompt)
+        self.assertTrue(prompt.startswith("Summarize:\n\n--- Page 1 ---\nPage body 0"))
+
+    def test_small_documents_are_not_truncated(self):
+        prompt = build_prompt("Summarize:\n{text}", ["short page"], "test-model")
+        self.assertEqual(prompt, "Summarize:\n\n--- Page 1 ---\nshort page")
+
+
+if __name__ == "__main__":
+    unittest.main()
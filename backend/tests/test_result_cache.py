@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+try:
+    from services import result_cache as result_cache_module
+    from services.result_cache import ResultCache
+except ImportError as e:  # python-dotenv is only installed with the backend requirements
+    raise unittest.SkipTest(f"result cache dependencies missing: {e}")
+
+
+class Clock:
+    """Stands in for the `time` module so eviction order does not depend on real timing"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds=1.0):
+        self.now += seconds
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.db")
+        self.clock = Clock()
+        patcher = mock.patch.object(result_cache_module, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cache(self, max_entries=100, max_bytes=1 << 20, max_age=3600):
+        return ResultCache(self.path, max_entries, max_bytes, max_age)
+
+    def put(self, cache, key, result):
+        cache.put(key, result)
+        self.clock.advance()
+
+    def test_evicts_least_recently_used_beyond_max_entries(self):
+        cache = self.cache(max_entries=2)
+        self.put(cache, "a", {"data": "a"})
+        self.put(cache, "b", {"data": "b"})
+        self.assertEqual(cache.get("a"), {"data": "a"})  # "b" is now the least recently used
+        self.clock.advance()
+        self.put(cache, "c", {"data": "c"})
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_evicts_down_to_max_bytes(self):
+        cache = self.cache(max_bytes=100)
+        for key in "abc":
+            self.put(cache, key, {"data": key * 30})
+        stats = cache.stats()
+        self.assertLessEqual(stats["bytes"], 100)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_expired_results_are_misses(self):
+        cache = self.cache(max_age=10)
+        self.put(cache, "a", {"data": "a"})
+        self.clock.advance(20)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_uncounted_lookup_then_record_hit_counts_once(self):
+        cache = self.cache()
+        self.put(cache, "a", {"data": "a"})
+        self.assertIsNotNone(cache.get("a", count=False))
+        cache.record_hit()
+        self.assertIsNone(cache.get("missing", count=False))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 0))
+
+    def test_routes_are_trimmed_by_count_and_age(self):
+        cache = self.cache(max_entries=2, max_age=10)
+        for content_hash in ("a", "b"):
+            cache.put_route(content_hash, "small")
+            self.clock.advance()
+        self.assertEqual(cache.get_route("a"), "small")  # refreshes "a"
+        self.clock.advance()
+        cache.put_route("c", "large")
+        self.assertIsNone(cache.get_route("b"))
+        self.assertEqual(cache.get_route("a"), "small")
+        self.clock.advance(20)
+        self.assertIsNone(cache.get_route("c"))
+
+    def test_page_fingerprints_are_kept_for_the_newest_documents(self):
+        cache = self.cache(max_entries=2)
+        for content_hash in ("old", "middle", "new"):
+            cache.put_fingerprints(content_hash, [f"{content_hash}-1", "shared"])
+            self.clock.advance()
+        self.assertIsNone(cache.find_revision("other", ["old-1"]))
+        match, similarity = cache.find_revision("other", ["middle-1", "shared"])
+        self.assertEqual((match, similarity), ("middle", 1.0))
+
+    def test_old_caches_gain_updated_at_columns(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE routes (content_hash TEXT PRIMARY KEY, branch TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE pages (content_hash TEXT NOT NULL, page INTEGER NOT NULL, "
+            "fingerprint TEXT NOT NULL, PRIMARY KEY (content_hash, page))"
+        )
+        conn.execute("INSERT INTO routes VALUES ('legacy', 'small')")
+        conn.commit()
+        conn.close()
+        cache = self.cache()
+        cache.put_route("fresh", "large")
+        self.assertEqual(cache.get_route("fresh"), "large")
+        # Rows from before the migration count as oldest and have aged out
+        self.assertIsNone(cache.get_route("legacy"))
+
+
+if __name__ == "__main__":
+    unittest.main()
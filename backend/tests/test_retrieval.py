@@ -0,0 +1,104 @@
+import tempfile
+import unittest
+from unittest import mock
+
+from llm_clients.fakes import FakeDocument
+
+try:
+    from services import retrieval
+    from services.retrieval import ChunkIndex, chunk_pages, format_chunks, tokenize
+except ImportError as e:  # python-dotenv is only installed with the backend requirements
+    raise unittest.SkipTest(f"retrieval dependencies missing: {e}")
+
+PAGES = [
+    "Annual report\n\nThe company grew steadily this year.",
+    "Revenue\n\nTotal revenue was 4,200 million, up from 3,900 million.\n\nMargins were stable.",
+    "Legal\n\nThe contract may be terminated with ninety days notice by either party.",
+    "Outlook\n\nManagement expects revenue growth to continue next year."
+]
+
+
+class ChunkingTest(unittest.TestCase):
+    def test_chunks_never_cross_pages_or_exceed_the_limit(self):
+        pages = ["short paragraph\n\n" + "x" * 250, "another page"]
+        chunks = chunk_pages(pages, max_chars=100)
+        self.assertEqual([chunk["page"] for chunk in chunks], [1, 1, 1, 1, 2])
+        self.assertTrue(all(len(chunk["text"]) <= 100 for chunk in chunks))
+        self.assertEqual(chunks[0]["text"], "short paragraph")
+
+    def test_tokenize_keeps_numbers_and_drops_stop_words(self):
+        self.assertEqual(tokenize("What is the Revenue of 4,200.5?"), ["revenue", "4,200.5"])
+
+
+class ChunkIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = ChunkIndex.build("hash", PAGES)
+
+    def test_ranks_chunks_containing_the_query_terms(self):
+        top = self.index.search("contract termination notice", k=1)
+        self.assertEqual([chunk["page"] for chunk in top], [3])
+
+    def test_rarer_terms_outweigh_common_ones(self):
+        # "revenue" appears on two pages, "million" only on one
+        top = self.index.search("revenue million", k=1)
+        self.assertIn("4,200 million", top[0]["text"])
+
+    def test_results_are_in_document_order(self):
+        pages = [chunk["page"] for chunk in self.index.search("revenue growth year", k=3)]
+        self.assertEqual(pages, sorted(pages))
+
+    def test_no_overlap_falls_back_to_the_start(self):
+        top = self.index.search("zebra", k=2)
+        self.assertEqual(top, self.index.chunks[:2])
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/index.json"
+            self.index.save(path)
+            loaded = ChunkIndex.load(path)
+        self.assertEqual(loaded.search("ninety days notice"), self.index.search("ninety days notice"))
+
+    def test_format_chunks_labels_pages(self):
+        text = format_chunks(self.index.search("contract", k=1))
+        self.assertTrue(text.startswith("[Page 3]\n"))
+
+
+class IndexCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patchers = [
+            mock.patch.object(retrieval, "INDEX_DIR", directory.name),
+            mock.patch.object(retrieval, "RETRIEVAL_MAX_INDEXES", 2),
+            mock.patch.dict(retrieval._indexes, clear=True)
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def build(self, document_id):
+        return retrieval.build_index(document_id, FakeDocument([f"{document_id} text"]))
+
+    def test_keeps_the_most_recently_used_indexes(self):
+        first = self.build("a")
+        self.build("b")
+        self.assertIs(retrieval.get_index("a"), first)  # "b" is now the least recently used
+        self.build("c")
+        self.assertEqual(list(retrieval._indexes), ["a", "c"])
+
+    def test_evicted_indexes_are_reloaded_from_disk(self):
+        first = self.build("a")
+        self.build("b")
+        self.build("c")
+        self.assertNotIn("a", retrieval._indexes)
+        reloaded = retrieval.get_index("a")
+        self.assertIsNot(reloaded, first)
+        self.assertEqual(reloaded.chunks, first.chunks)
+        self.assertEqual(len(retrieval._indexes), 2)
+
+    def test_unknown_document_has_no_index(self):
+        self.assertIsNone(retrieval.get_index("missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,285 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from llm_clients.fakes import FakeLLM
+from llm_clients.batcher import MicroBatcher
+from llm_clients.scheduler import InvocationScheduler
+
+try:
+    from llm_clients import ollama
+    from services import metrics, token_stream
+except ImportError:  # needs the backend requirements (python-dotenv, ...)
+    ollama = None
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        time.sleep(0.005)
+
+
+class GatedLLM:
+    """Records prompts in the order they start and blocks each call until `release`"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = []
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self._lock:
+            self.started.append(prompt)
+        self.gate.wait(5)
+        if prompt.startswith("fail"):
+            raise RuntimeError(prompt)
+        return prompt.upper()
+
+    def release(self):
+        self.gate.set()
+
+
+class Caller(threading.Thread):
+    def __init__(self, scheduler, prompt, **callbacks):
+        super().__init__(daemon=True)
+        self.scheduler = scheduler
+        self.prompt = prompt
+        self.callbacks = callbacks
+        self.result = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.result = self.scheduler.submit(self.prompt, **self.callbacks)
+        except BaseException as e:
+            self.error = e
+
+
+class InvocationSchedulerTest(unittest.TestCase):
+    def test_runs_queued_prompts_in_fifo_order(self):
+        llm = GatedLLM()
+        scheduler = InvocationScheduler(llm.invoke, max_concurrency=1)
+        callers = [Caller(scheduler, "first")]
+        wait_for(lambda: llm.started == ["first"])
+        for number, prompt in enumerate(["second", "third", "fourth"], 1):
+            callers.append(Caller(scheduler, prompt))
+            wait_for(lambda: scheduler.stats()["queue_depth"] == number)
+        llm.release()
+        for caller in callers:
+            caller.join(5)
+
+        self.assertEqual(llm.started, ["first", "second", "third", "fourth"])
+        self.assertEqual([caller.result for caller in callers], ["FIRST", "SECOND", "THIRD", "FOURTH"])
+        self.assertEqual(scheduler.stats()["completed"], 4)
+
+    def test_respects_the_concurrency_cap(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def invoke(prompt):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return prompt
+
+        scheduler = InvocationScheduler(invoke, max_concurrency=2)
+        callers = [Caller(scheduler, f"prompt {i}") for i in range(8)]
+        for caller in callers:
+            caller.join(5)
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(sorted(caller.result for caller in callers), sorted(f"prompt {i}" for i in range(8)))
+
+    def test_coalesces_identical_prompts(self):
+        llm = GatedLLM()
+        scheduler = InvocationScheduler(llm.invoke, max_concurrency=1)
+        callers = [Caller(scheduler, "same")]
+        wait_for(lambda: llm.started == ["same"])
+        callers += [Caller(scheduler, "same") for _ in range(3)]
+        wait_for(lambda: scheduler.stats()["coalesced"] == 3)
+        llm.release()
+        for caller in callers:
+            caller.join(5)
+
+        self.assertEqual(llm.started, ["same"])
+        self.assertEqual([caller.result for caller in callers], ["SAME"] * 4)
+        # Once finished, the same prompt runs again rather than reusing the old result
+        self.assertEqual(scheduler.submit("same"), "SAME")
+        self.assertEqual(llm.started, ["same", "same"])
+
+    def test_coalesced_callers_share_the_error(self):
+        llm = GatedLLM()
+        scheduler = InvocationScheduler(llm.invoke, max_concurrency=1)
+        callers = [Caller(scheduler, "fail once")]
+        wait_for(lambda: llm.started == ["fail once"])
+        callers.append(Caller(scheduler, "fail once"))
+        wait_for(lambda: scheduler.stats()["coalesced"] == 1)
+        llm.release()
+        for caller in callers:
+            caller.join(5)
+
+        self.assertEqual(len(llm.started), 1)
+        for caller in callers:
+            self.assertIsInstance(caller.error, RuntimeError)
+
+    def test_reports_queue_positions_and_start(self):
+        llm = GatedLLM()
+        scheduler = InvocationScheduler(llm.invoke, max_concurrency=1)
+        events = []
+        blocker = Caller(scheduler, "blocker")
+        wait_for(lambda: llm.started == ["blocker"])
+        first = Caller(scheduler, "a", on_wait=lambda p: events.append(("a", p)), on_start=lambda: events.append(("a", "start")))
+        wait_for(lambda: ("a", 0) in events)
+        second = Caller(scheduler, "b", on_wait=lambda p: events.append(("b", p)), on_start=lambda: events.append(("b", "start")))
+        wait_for(lambda: ("b", 1) in events)
+        llm.release()
+        for caller in (blocker, first, second):
+            caller.join(5)
+
+        self.assertEqual([e for e in events if e[0] == "a"], [("a", 0), ("a", "start")])
+        # "b" may be admitted straight from position 1 if "a" finishes before it wakes up
+        b_events = [e for e in events if e[0] == "b"]
+        self.assertEqual((b_events[0], b_events[-1]), (("b", 1), ("b", "start")))
+        self.assertLess(events.index(("a", "start")), events.index(("b", "start")))
+
+    def test_failing_wait_callback_leaves_the_queue(self):
+        llm = GatedLLM()
+        scheduler = InvocationScheduler(llm.invoke, max_concurrency=1)
+        blocker = Caller(scheduler, "blocker")
+        wait_for(lambda: llm.started == ["blocker"])
+
+        def cancel(position):
+            raise KeyboardInterrupt
+
+        cancelled = Caller(scheduler, "cancelled", on_wait=cancel)
+        cancelled.join(5)
+        after = Caller(scheduler, "after")
+        wait_for(lambda: scheduler.stats()["queue_depth"] == 1)
+        llm.release()
+        for caller in (blocker, after):
+            caller.join(5)
+
+        self.assertIsInstance(cancelled.error, KeyboardInterrupt)
+        self.assertEqual(after.result, "AFTER")
+        self.assertEqual(llm.started, ["blocker", "after"])
+        self.assertEqual(scheduler.stats()["queue_depth"], 0)
+
+    def test_works_with_fake_llm(self):
+        llm = FakeLLM(response="{chars} chars")
+        scheduler = InvocationScheduler(llm.invoke, max_concurrency=2)
+        self.assertEqual(scheduler.submit("hello"), "5 chars")
+        self.assertEqual("".join(llm.stream("hello")), "5 chars")
+        self.assertEqual(llm.calls, 2)
+
+
+class MicroBatcherTest(unittest.TestCase):
+    def submit_together(self, batcher, items):
+        callers = [Caller(batcher, item) for item in items]
+        for caller in callers:
+            caller.join(5)
+        return callers
+
+    def test_concurrent_items_share_a_batch(self):
+        batches = []
+
+        def run_batch(items):
+            batches.append(list(items))
+            return [item.upper() for item in items]
+
+        batcher = MicroBatcher(run_batch, max_batch_size=3, max_wait=0.2)
+        callers = self.submit_together(batcher, ["a", "b", "c"])
+        self.assertEqual(sorted(caller.result for caller in callers), ["A", "B", "C"])
+        self.assertEqual([sorted(batch) for batch in batches], [["a", "b", "c"]])
+
+    def test_short_result_list_fails_every_caller(self):
+        batcher = MicroBatcher(lambda items: items[:1], max_batch_size=3, max_wait=0.2)
+        callers = self.submit_together(batcher, ["a", "b", "c"])
+        for caller in callers:
+            self.assertFalse(caller.is_alive())
+            self.assertIsInstance(caller.error, RuntimeError)
+
+
+@unittest.skipIf(ollama is None, "backend requirements not installed")
+class JobQueueStateTest(unittest.TestCase):
+    def setUp(self):
+        self.state = ollama.JobQueueState()
+        status = mock.patch.object(ollama, "update_status")
+        details = mock.patch.object(ollama, "update_status_details")
+        self.update_status = status.start()
+        self.update_details = details.start()
+        self.addCleanup(status.stop)
+        self.addCleanup(details.stop)
+
+    def test_job_status_changes_once_for_many_waiting_calls(self):
+        calls = [object() for _ in range(3)]
+        for position, call in enumerate(calls, 2):
+            self.state.waiting("job", call, position)
+        self.update_status.assert_called_once_with("job", "Queued")
+        self.assertEqual(self.update_details.call_args_list[-1], mock.call("job", queue_position=2))
+
+        self.state.started("job", calls[0])
+        self.update_status.assert_called_with("job", "Processing")
+        self.assertEqual(self.update_status.call_count, 2)
+
+        # Other calls waiting while one is running do not re-queue the job
+        self.state.waiting("job", calls[1], 0)
+        self.assertEqual(self.update_status.call_count, 2)
+
+    def test_call_leaving_the_queue_unqueues_the_job(self):
+        first, second = object(), object()
+        self.state.waiting("job", first, 3)
+        self.state.waiting("job", second, 1)
+        # One waiting call is cancelled; the job is still queued behind the other
+        self.state.finished("job", second, started=False)
+        self.assertEqual(self.update_details.call_args_list[-1], mock.call("job", queue_position=3))
+        self.update_status.assert_called_once_with("job", "Queued")
+
+        self.state.finished("job", first, started=False)
+        self.update_status.assert_called_with("job", "Processing")
+        self.assertEqual(self.update_details.call_args_list[-1], mock.call("job", queue_position=None))
+        self.assertEqual(self.state._jobs, {})
+
+    def test_finished_job_is_forgotten(self):
+        call = object()
+        self.state.waiting("job", call, 0)
+        self.state.started("job", call)
+        self.state.finished("job", call, started=True)
+        self.assertEqual(self.state._jobs, {})
+
+
+@unittest.skipIf(ollama is None, "backend requirements not installed")
+class OllamaStreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.llm = FakeLLM(response="streamed {chars} chars")
+        ollama.ollama_backend.set_client(self.llm)
+        self.addCleanup(ollama.ollama_backend.set_client, None)
+
+    def test_forwards_tokens_to_subscribers(self):
+        async def run():
+            queue = token_stream.subscribe("job")
+            token = metrics.current_job.set("job")
+            try:
+                result = ollama._invoke("hello")
+            finally:
+                metrics.current_job.reset(token)
+                token_stream.finish("job")
+            pieces = []
+            while (piece := await queue.get()) is not token_stream.DONE:
+                pieces.append(piece)
+            token_stream.unsubscribe("job", queue)
+            return result, pieces
+
+        result, pieces = asyncio.run(run())
+        self.assertEqual(result, "streamed 5 chars")
+        self.assertEqual(pieces, ["streamed ", "5 ", "chars"])
+
+    def test_unwatched_jobs_use_invoke(self):
+        self.llm.stream = None
+        self.assertEqual(ollama._invoke("hello"), "streamed 5 chars")
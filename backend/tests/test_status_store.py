@@ -0,0 +1,52 @@
+import os
+import tempfile
+import time
+import unittest
+
+try:
+    from services.status_store import MemoryStatusStore, SQLiteStatusStore
+except ImportError as e:  # python-dotenv is only installed with the backend requirements
+    raise unittest.SkipTest(f"status store dependencies missing: {e}")
+
+
+class RecordTest(unittest.TestCase):
+    def test_sqlite_records_are_shared_between_stores(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "status.db")
+            writer, reader = SQLiteStatusStore(path, ttl=3600), SQLiteStatusStore(path, ttl=3600)
+            writer.put_record("job", "a", {"state": "queued"})
+            self.assertEqual(reader.get_record("job", "a"), {"state": "queued"})
+            writer.put_record("job", "a", {"state": "completed", "result": {"pages": 3}})
+            self.assertEqual(reader.get_record("job", "a"), {"state": "completed", "result": {"pages": 3}})
+            self.assertIsNone(reader.get_record("batch", "a"))
+
+    def test_memory_records_are_copies_and_bounded(self):
+        store = MemoryStatusStore(max_jobs=2, ttl=3600)
+        record = {"state": "queued"}
+        store.put_record("job", "a", record)
+        record["state"] = "changed"
+        self.assertEqual(store.get_record("job", "a"), {"state": "queued"})
+        store.put_record("job", "b", {})
+        store.put_record("job", "c", {})
+        self.assertIsNone(store.get_record("job", "a"))
+        self.assertEqual(store.get_record("job", "c"), {})
+
+    def test_sqlite_history_leaves_out_expired_statuses(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SQLiteStatusStore(os.path.join(directory, "status.db"), ttl=0.2)
+            store.set_status("a", "Uploading")
+            time.sleep(0.3)
+            store.set_status("a", "Completed")
+            self.assertEqual([entry["status"] for entry in store.history("a")], ["Completed"])
+            time.sleep(0.3)
+            self.assertEqual(store.history("a"), [])
+            self.assertIsNone(store.get_status("a"))
+
+    def test_expired_records_are_not_returned(self):
+        store = MemoryStatusStore(max_jobs=10, ttl=-1)
+        store.put_record("job", "a", {})
+        self.assertIsNone(store.get_record("job", "a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
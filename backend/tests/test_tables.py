@@ -0,0 +1,166 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from llm_clients.fakes import FakeDocument, FakeLLM
+
+try:
+    from services import tables
+    from services.tables import TableLayout, TABLE_DIGEST_HEADER, clean_rows, to_markdown
+    from llm_clients import prompt_builder, text_extraction
+except ImportError as e:  # python-dotenv is only installed with the backend requirements
+    raise unittest.SkipTest(f"backend requirements missing: {e}")
+
+try:
+    import fitz
+    from services.document import ParsedDocument
+except ImportError:  # PyMuPDF, pdfplumber and Pillow
+    fitz = None
+
+REVENUE = [["Segment", "2023", "2022"], ["Cloud", "120", "100"], ["Devices", "80", "90"], ["Total", "200", "190"]]
+COSTS = [["Cost", "Amount"], ["Staff", "50"], ["Rent", "10"]]
+
+
+class TableDocument(FakeDocument):
+    """FakeDocument whose pages carry pdfplumber-style table regions and ruling lines"""
+
+    def __init__(self, page_texts, regions, rulings=(10, 10)):
+        super().__init__(page_texts)
+        self.regions = regions  # page index -> [(bbox, rows)]
+        self.rulings = rulings
+        self.searched = []
+
+    def ruling_counts(self, page_index):
+        return self.rulings if page_index in self.regions else (0, 0)
+
+    def table_regions(self, page_index):
+        self.searched.append(page_index)
+        return self.regions.get(page_index, [])
+
+    def text_outside(self, page_index, bboxes):
+        return f"prose of page {page_index + 1}"
+
+
+class CleanRowsTest(unittest.TestCase):
+    def test_drops_empty_rows_and_columns_and_escapes_pipes(self):
+        rows = [["Name", None, "Value"], [None, None, None], ["a|b", "", " 1\n 2 "]]
+        self.assertEqual(clean_rows(rows), [["Name", "Value"], ["a\\|b", "1 2"]])
+
+    def test_markdown_names_empty_headers(self):
+        self.assertEqual(to_markdown([["", "x"], ["1", "2"]]), "| Column 1 | x |\n|---|---|\n| 1 | 2 |")
+
+
+class TableLayoutTest(unittest.TestCase):
+    def setUp(self):
+        self.layout = TableLayout(
+            [{"page": 1, "rows": REVENUE}, {"page": 1, "rows": COSTS}, {"page": 3, "rows": COSTS}],
+            ["p1", "p2", "p3"]
+        )
+
+    def test_markdown_sections_number_tables_per_page(self):
+        sections = self.layout.markdown_sections()
+        self.assertEqual(len(sections), 2)
+        self.assertTrue(sections[0].startswith("### Page 1\n\n**Table 1**\n| Segment | 2023 | 2022 |"))
+        self.assertIn("**Table 2**\n| Cost | Amount |", sections[0])
+        self.assertTrue(sections[1].startswith("### Page 3\n\n**Table 1**"))
+
+    def test_digests_describe_size_columns_labels_and_totals(self):
+        digest = self.layout.page_digests()[0]
+        self.assertEqual(digest.split("\n")[:4], [
+            TABLE_DIGEST_HEADER,
+            "Table 1: 3 rows x 3 columns; columns: Segment, 2023, 2022",
+            "  rows: Cloud, Devices, Total",
+            "  Total: 200 | 190"
+        ])
+
+    def test_digests_only_depend_on_their_own_page(self):
+        digests = self.layout.page_digests()
+        self.assertEqual(digests[1], "")
+        edited = TableLayout(
+            [{"page": 1, "rows": REVENUE[:-1] + [["Total", "201", "190"]]}, {"page": 1, "rows": COSTS},
+             {"page": 3, "rows": COSTS}],
+            ["p1", "p2", "p3"]
+        )
+        self.assertNotEqual(edited.page_digests()[0], digests[0])
+        self.assertEqual(edited.page_digests()[2], digests[2])
+
+    def test_long_row_label_lists_are_cut(self):
+        rows = [["Item", "Value"]] + [[f"item {i}", str(i)] for i in range(12)]
+        digest = TableLayout([{"page": 1, "rows": rows}], ["p1"]).page_digests()[0]
+        self.assertIn(f"item {tables.DIGEST_ROW_LABELS - 1} (+4 more)", digest)
+
+
+class ExtractLayoutTest(unittest.TestCase):
+    def test_only_pages_with_ruling_lines_are_searched(self):
+        document = TableDocument(["intro", "figures", "outro"], {1: [((0, 0, 1, 1), REVENUE)]})
+        layout = tables.extract_layout(document)
+        self.assertEqual(document.searched, [1])
+        self.assertEqual(layout.tables, [{"page": 2, "rows": REVENUE}])
+        self.assertEqual(layout.page_texts, ["intro", "prose of page 2", "outro"])
+
+    def test_too_few_rules_skip_the_search(self):
+        document = TableDocument(["intro", "figures"], {1: [((0, 0, 1, 1), REVENUE)]}, rulings=(2, 10))
+        self.assertIsNone(tables.extract_layout(document))
+        self.assertEqual(document.searched, [])
+
+    def test_single_row_or_column_detections_are_left_in_the_text(self):
+        document = TableDocument(["boxed note"], {0: [((0, 0, 1, 1), [["Note"], ["see page 4"]])]})
+        self.assertIsNone(tables.extract_layout(document))
+
+
+class TableFastPathTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(prompt_builder.BUDGETS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        prompt_builder.register_budget("test-model", context_tokens=8000, output_tokens=500, chars_per_token=4)
+
+    def extract(self, document):
+        llm = FakeLLM(response="# Summary")
+        with mock.patch.object(text_extraction, "TABLE_FAST_PATH", True):
+            output = text_extraction.extract_text(
+                document, "Extract everything:\n{text}", llm.invoke, 60000, "test-model", table_fast_path=True
+            )
+        return llm, output
+
+    def test_tables_are_rendered_locally_and_only_digested_in_the_prompt(self):
+        document = TableDocument(["intro", "figures"], {1: [((0, 0, 1, 1), REVENUE)]})
+        llm, output = self.extract(document)
+        prompt = llm.prompts[0]
+        self.assertIn("do not reproduce them", prompt)
+        self.assertIn("Table 1: 3 rows x 3 columns", prompt)
+        self.assertNotIn("| Segment |", prompt)
+        self.assertEqual(llm.calls, 1)
+        self.assertTrue(output.startswith("# Summary\n\n## Tables\n\n### Page 2\n\n**Table 1**\n| Segment | 2023 | 2022 |"))
+
+    def test_documents_without_tables_use_the_branch_prompt(self):
+        llm, output = self.extract(TableDocument(["intro", "outro"], {}))
+        self.assertTrue(llm.prompts[0].startswith("Extract everything:"))
+        self.assertEqual(output, "# Summary")
+
+
+@unittest.skipIf(fitz is None, "PyMuPDF/pdfplumber not installed")
+class RulingCountsTest(unittest.TestCase):
+    def test_counts_the_rules_of_a_drawn_grid(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "grid.pdf")
+            pdf = fitz.open()
+            plain = pdf.new_page()
+            plain.insert_text((72, 72), "Just prose on this page.")
+            grid = pdf.new_page()
+            for row in range(4):
+                grid.draw_line((72, 100 + row * 20), (372, 100 + row * 20))
+            for column in range(4):
+                grid.draw_line((72 + column * 100, 100), (72 + column * 100, 160))
+            pdf.save(path)
+            pdf.close()
+            with ParsedDocument(path) as document:
+                self.assertEqual(document.ruling_counts(0), (0, 0))
+                self.assertEqual(document.ruling_counts(1), (4, 4))
+                self.assertFalse(tables.may_have_table(document, 0))
+                self.assertTrue(tables.may_have_table(document, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
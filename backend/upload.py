@@ -1,85 +1,138 @@
+import zipfile
+from typing import List
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from services.status_manager import update_status, get_status
-from services.extraction import extract_pdf_metadata, is_scanned_pdf, contains_financial_tables, is_legal_document
-from llm_clients.langchain_router import LangChainRouter
-import os
-import asyncio
+from fastapi.concurrency import run_in_threadpool
+from services.status_manager import update_status, get_status, get_status_details
+from services.pipeline import process_pdf, report_pending
+from services.job_queue import job_queue, QueueFullError
+from services.batches import batch_processor, BATCH_MAX_FILES
+from services.storage import save_stream, UploadTooLargeError
+from services import metrics
+import time
 
 
 router = APIRouter()
 
+async def save_upload(file: UploadFile):
+    """Stream an uploaded PDF to uploads/ and return (file_id, file_path).
+
+    The file id is the SHA-256 of the content, so identical uploads share one id and
+    different files with the same name never collide.
+    """
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        file_id, file_path, _ = await run_in_threadpool(save_stream, file.file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # The id is only known once the content is hashed, so the save stage is recorded afterwards
+    metrics.start_timeline(file_id)
+    metrics.record_stage("save", file_id, started_at, time.perf_counter() - start)
+    report_pending(file_id, "Uploading")
+    return file_id, file_path
+
 @router.post("/upload/")
 async def upload_pdf(file: UploadFile = File(...)):
     if not file.filename.endswith(".pdf"):
         return {"error": "Only PDF files are supported."}
 
-    # Use filename as file_id
-    file_id = file.filename
-    update_status(file_id, "Uploading")
-    await asyncio.sleep(1)  # Give time for the status to be sent
+    file_id, file_path = await save_upload(file)
 
     try:
-        # Save the uploaded file
-        file_path = os.path.join("uploads", file.filename)
-        with open(file_path, "wb") as f:
-            f.write(file.file.read())
-
-        # Extract metadata
-        update_status(file_id, "Extracting")
-        await asyncio.sleep(1)
-        metadata = extract_pdf_metadata(file_path)
-        metadata["is_scanned"] = is_scanned_pdf(file_path)
-
-        # Route to appropriate LLM using LangChainRouter
-        update_status(file_id, "Processing")
-        await asyncio.sleep(1)
-
-        router = LangChainRouter()
-        helpers = {
-            "contains_financial_tables": contains_financial_tables,
-            "is_legal_document": is_legal_document
-        }
-        result, processing_type = router.route(file_path, metadata, helpers)
-
-        # Handle None result
-        if result is None:
-            update_status(file_id, "Failed: No result received from processing")
-            await asyncio.sleep(1)
-            raise HTTPException(
-                status_code=500,
-                detail="No result received from processing"
-            )
-
-        # Ensure data is a string
-        if result.get("data") is None:
-            result["data"] = "No data extracted from document"
-
-        if not result.get("success", False):
-            update_status(file_id, "Failed: Processing error")
-            await asyncio.sleep(1)
-            error_message = result.get("error", "Unknown error")
-            data_message = result.get("data", "No additional information")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Processing failed: {error_message}. {data_message}"
-            )
-
-        update_status(file_id, "Extracted")
-        await asyncio.sleep(1)
-        update_status(file_id, "Completed")
-        await asyncio.sleep(1)
-
-        return {
-            "message": "File uploaded and processed successfully",
-            "file_id": file_id,
-            "file_path": file_path,
-            "metadata": metadata,
-            "processing_type": processing_type,
-            "model": result.get("model", "Unknown"),
-            "results": str(result.get("data", ""))
-        }
-
+        # The pipeline blocks on PDF parsing and LLM calls, so keep it off the event loop
+        response = await run_in_threadpool(process_pdf, file_id, file_path, file_id)
     except Exception as e:
-        update_status(file_id, f"Failed: {str(e)}")
-        await asyncio.sleep(1)
         raise HTTPException(status_code=500, detail=str(e))
+    response["filename"] = file.filename
+    return response
+
+@router.post("/jobs/", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    """Save the upload and queue it for processing, returning a job id immediately"""
+    if not file.filename.endswith(".pdf"):
+        return {"error": "Only PDF files are supported."}
+
+    file_id, file_path = await save_upload(file)
+    try:
+        job_id = job_queue.submit(file_id, file_path, file.filename, file_id)
+    except QueueFullError as e:
+        update_status(file_id, f"Failed: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"job_id": job_id, "file_id": file_id, "filename": file.filename, "state": "queued"}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """State of a submitted job, with the processing result once it has finished"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["status"] = get_status(job["file_id"])
+    job["details"] = get_status_details(job["file_id"])
+    # A job run by another worker only has the timeline saved in its finished record
+    job["timeline"] = metrics.get_timeline(job["file_id"]) or job.get("timeline", [])
+    return job
+
+def save_batch_member(filename, stream):
+    """Save one PDF of a batch; returns its batch entry (with an error instead if it failed)"""
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        file_id, file_path, _ = save_stream(stream)
+    except Exception as e:
+        return {"filename": filename, "file_id": None, "error": str(e)}
+    metrics.start_timeline(file_id)
+    metrics.record_stage("save", file_id, started_at, time.perf_counter() - start)
+    report_pending(file_id, "Uploading")
+    return {"filename": filename, "file_id": file_id, "file_path": file_path}
+
+def save_batch(files: List[UploadFile]):
+    """Stream every PDF, and every PDF inside ZIP archives, to uploads/ one at a time"""
+    saved = []
+    for file in files:
+        name = file.filename or ""
+        if name.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                saved.append({"filename": name, "file_id": None, "error": "Not a valid ZIP archive"})
+                continue
+            with archive:
+                for member in archive.infolist():
+                    member_name = member.filename
+                    if member.is_dir() or not member_name.lower().endswith(".pdf") or member_name.startswith("__MACOSX/"):
+                        continue
+                    if len(saved) >= BATCH_MAX_FILES:
+                        break
+                    with archive.open(member) as stream:
+                        saved.append(save_batch_member(f"{name}/{member_name}", stream))
+        elif name.lower().endswith(".pdf"):
+            saved.append(save_batch_member(name, file.file))
+        else:
+            saved.append({"filename": name, "file_id": None, "error": "Only PDF and ZIP files are supported."})
+        if len(saved) >= BATCH_MAX_FILES:
+            break
+    return saved
+
+@router.post("/batches/", status_code=202)
+async def submit_batch(files: List[UploadFile] = File(...)):
+    """Save many PDFs (or ZIP archives of PDFs) and process them as one batch.
+
+    Returns a batch id immediately; progress is at GET /api/batches/{batch_id} and is
+    pushed over /ws/batch/{batch_id}.
+    """
+    saved = await run_in_threadpool(save_batch, files)
+    if not saved:
+        raise HTTPException(status_code=400, detail="No PDF files found in the upload")
+    batch_id = batch_processor.submit(saved)
+    return batch_processor.get(batch_id, include_results=False)
+
+@router.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Aggregate progress of a batch with each file's state and result"""
+    batch = batch_processor.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
@@ -10,14 +10,23 @@ import './FollowupQA.css';
 
 const API_BASE_URL = 'http://localhost:8000';
 const UPLOAD_URL = `${API_BASE_URL}/api/upload/`;
+const BATCH_URL = `${API_BASE_URL}/api/batches/`;
 const WS_BASE_URL = 'ws://localhost:8000';
+const STREAM_URL = `${API_BASE_URL}/api/stream/`;
+
+// The backend identifies uploads by the SHA-256 of their content
+const sha256Hex = async (file) => {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+};
 
 const FileUpload = () => {
-    const [files, setFiles] = useState([]); // [{ file, name, size, status, progress, result, error, ws }]
+    const [files, setFiles] = useState([]); // [{ file, name, size, status, progress, result, error, ws, stream, liveText }]
     const [selectedIdx, setSelectedIdx] = useState(null);
     const [question, setQuestion] = useState('');
     const [answer, setAnswer] = useState('');
     const [isAsking, setIsAsking] = useState(false);
+    const [batchId, setBatchId] = useState(null);
 
     // Handle file selection (drag-and-drop or click)
     const onDrop = useCallback((acceptedFiles) => {
@@ -31,6 +40,8 @@ const FileUpload = () => {
                 result: null,
                 error: null,
                 ws: null,
+                stream: null,
+                liveText: '',
                 isProcessing: false
             }));
             setFiles(prev => [...prev, ...newFiles]);
@@ -69,6 +80,22 @@ const FileUpload = () => {
     });
 
     // Upload all files that are not yet started
+    // Send every pending file in one request; the dashboard follows the batch over one socket
+    const handleUploadBatch = async () => {
+        const pending = files.filter(f => f.status !== 'Completed');
+        if (pending.length === 0) return;
+        const formData = new FormData();
+        pending.forEach(f => formData.append('files', f.file));
+        try {
+            const response = await fetch(BATCH_URL, { method: 'POST', body: formData });
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.detail || 'Batch upload failed');
+            setBatchId(data.batch_id);
+        } catch (err) {
+            console.error('Batch upload error:', err);
+        }
+    };
+
     const handleUploadAll = () => {
         console.log('Upload All clicked. Files:', files);
         files.forEach((f, idx) => {
@@ -76,10 +103,13 @@ const FileUpload = () => {
             // Only upload files that haven't completed
             if (f.status !== 'Completed') {
                 console.log(`Starting upload for file ${idx}:`, f.name);
-                // Close any existing WebSocket connection
+                // Close any existing WebSocket connection and extraction stream
                 if (f.ws) {
                     f.ws.close();
                 }
+                if (f.stream) {
+                    f.stream.close();
+                }
                 // Reset the file status and start fresh
                 updateFile(idx, { 
                     status: null, 
@@ -95,12 +125,35 @@ const FileUpload = () => {
         });
     };
 
+    // Show the extraction text as the model writes it; the final result still comes from the upload response
+    const openExtractionStream = (fileId, idx) => {
+        const stream = new EventSource(`${STREAM_URL}${fileId}`);
+        let text = '';
+        stream.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.token) {
+                text += data.token;
+                updateFile(idx, { liveText: text });
+            } else if (data.done) {
+                stream.close();
+            }
+        };
+        // Stop instead of letting EventSource reconnect, e.g. after the job has finished
+        stream.onerror = () => stream.close();
+        updateFile(idx, { stream, liveText: '' });
+        return stream;
+    };
+
     // Upload a single file
     const uploadFile = async (fileObj, idx) => {
-        updateFile(idx, { status: 'Started', progress: 0, error: null, isProcessing: true });
-        
-        // First establish WebSocket connection using filename
-        const wsConnection = new WebSocket(`${WS_BASE_URL}/ws/status/${fileObj.name}`);
+        updateFile(idx, { status: 'Started', progress: 0, error: null, isProcessing: true, liveText: '' });
+
+        // First establish WebSocket connection using the content id the backend will assign;
+        // `follow` skips a final status left by an earlier upload of the same file
+        const fileId = await sha256Hex(fileObj.file);
+        updateFile(idx, { fileId });
+        const wsConnection = new WebSocket(`${WS_BASE_URL}/ws/status/${fileId}?follow=true`);
+        let extractionStream = null;
         wsConnection.onopen = () => {
             console.log('WebSocket connected for file:', fileObj.name);
             // Only start upload after WebSocket is connected
@@ -112,6 +165,7 @@ const FileUpload = () => {
             let progress = 10;
             switch(status) {
                 case 'Uploading': progress = 20; break;
+                case 'Queued': progress = 30; break;
                 case 'Extracting': progress = 40; break;
                 case 'Processing': progress = 60; break;
                 case 'Extracted': progress = 80; break;
@@ -122,6 +176,11 @@ const FileUpload = () => {
             let isProcessing = !(status === 'Completed' || status === 'Failed' || status === 'Stopped');
             updateFile(idx, { status, progress, isProcessing });
 
+            // The stream endpoint only knows the job once it has a status
+            if (isProcessing && status !== 'Unknown' && !extractionStream) {
+                extractionStream = openExtractionStream(fileId, idx);
+            }
+
             // Close WebSocket connection if processing is complete
             if (status === 'Completed' || status === 'Failed' || status === 'Stopped') {
                 console.log('Closing WebSocket connection for file:', fileObj.name);
@@ -147,6 +206,7 @@ const FileUpload = () => {
     // Remove a file
     const handleRemove = (idx) => {
         if (files[idx].ws) files[idx].ws.close();
+        if (files[idx].stream) files[idx].stream.close();
         setFiles(prev => prev.filter((_, i) => i !== idx));
         if (selectedIdx === idx) setSelectedIdx(null);
     };
@@ -154,6 +214,7 @@ const FileUpload = () => {
     // Cancel upload/processing for a file
     const handleCancel = (idx) => {
         if (files[idx].ws) files[idx].ws.close();
+        if (files[idx].stream) files[idx].stream.close();
         updateFile(idx, { status: 'Stopped', progress: 0, isProcessing: false });
     };
 
@@ -162,7 +223,10 @@ const FileUpload = () => {
     // Cleanup all websockets on unmount
     useEffect(() => {
         return () => {
-            files.forEach(f => { if (f.ws) f.ws.close(); });
+            files.forEach(f => {
+                if (f.ws) f.ws.close();
+                if (f.stream) f.stream.close();
+            });
         };
         // eslint-disable-next-line
     }, []);
@@ -180,20 +244,43 @@ const FileUpload = () => {
     }, [selectedIdx, files]);
 
     const handleAskQuestion = async () => {
-        if (!question || selectedIdx === null || !files[selectedIdx]?.name) return;
+        const documentId = files[selectedIdx]?.result?.file_id || files[selectedIdx]?.fileId;
+        if (!question || selectedIdx === null || !documentId) return;
         setIsAsking(true);
         setAnswer('');
         try {
-            const res = await fetch('http://localhost:8000/api/ask', {
+            const res = await fetch('http://localhost:8000/api/ask/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
-                    document_id: files[selectedIdx].name,
+                    document_id: documentId,
                     question: question
                 })
             });
-            const data = await res.json();
-            setAnswer(data.answer || data.error || 'No answer received.');
+            // Server-sent events: show the answer as it is generated
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const event of events) {
+                    if (!event.startsWith('data:')) continue;
+                    const data = JSON.parse(event.slice(5));
+                    if (data.token) {
+                        text += data.token;
+                        setAnswer(text);
+                    } else if (data.error) {
+                        text = data.error;
+                        setAnswer(text);
+                    }
+                }
+            }
+            if (!text) setAnswer('No answer received.');
         } catch (err) {
             setAnswer('Error contacting server.');
         }
@@ -228,6 +315,9 @@ const FileUpload = () => {
                     <button onClick={handleUploadAll} disabled={files.length === 0} className="upload-button" style={{ marginTop: 16 }}>
                         Upload All
                     </button>
+                    <button onClick={handleUploadBatch} disabled={files.length === 0} className="upload-button" style={{ marginTop: 16, marginLeft: 8 }}>
+                        Upload as Batch
+                    </button>
                     <ul className="file-upload-list">
                         {files.map((f, idx) => (
                             <li key={f.name + idx} className="file-upload-card">
@@ -281,13 +371,18 @@ const FileUpload = () => {
                                         View
                                     </button>
                                 </div>
+                                {f.isProcessing && f.liveText && (
+                                    <div className="live-output">
+                                        <ReactMarkdown remarkPlugins={[remarkGfm]}>{f.liveText}</ReactMarkdown>
+                                    </div>
+                                )}
                                 {f.error && <div className="error-message">Error: {f.error}</div>}
                             </li>
                         ))}
                     </ul>
                 </div>
                 <div className="dashboard-card">
-                    <StatusDashboard files={files} />
+                    <StatusDashboard files={files} batchId={batchId} />
                 </div>
             </div>
             {selectedIdx !== null && files[selectedIdx] && files[selectedIdx].result && (
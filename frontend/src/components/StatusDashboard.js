@@ -1,13 +1,44 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import { Table, TableBody, TableCell, TableContainer, TableHead, TableRow, LinearProgress } from '@mui/material';
 import './StatusDashboard.css';
 
-const StatusDashboard = ({ files }) => {
+const WS_BASE_URL = 'ws://localhost:8000';
+
+// Rows for a batch snapshot from /ws/batch/{batchId}
+const batchRows = (batch) => batch.files.map(f => ({
+    name: f.filename,
+    status: f.state === 'completed' ? 'Completed' : f.state === 'failed' ? 'Failed' : (f.status === 'Unknown' ? 'Queued' : f.status),
+    progress: f.state === 'completed' ? 100 : f.state === 'extracting' ? 60 : f.state === 'waiting' ? 40 : f.state === 'preparing' ? 20 : 0,
+    result: f.result
+}));
+
+const StatusDashboard = ({ files, batchId }) => {
+    const [batch, setBatch] = useState(null);
+
+    // Subscribe to the whole batch when one is given, instead of one socket per file
+    useEffect(() => {
+        if (!batchId) return undefined;
+        const ws = new WebSocket(`${WS_BASE_URL}/ws/batch/${batchId}`);
+        ws.onmessage = (event) => {
+            const snapshot = JSON.parse(event.data);
+            if (!snapshot.error) setBatch(snapshot);
+            if (snapshot.done || snapshot.error) ws.close();
+        };
+        return () => ws.close();
+    }, [batchId]);
+
+    const rows = batchId && batch ? batchRows(batch) : files;
+
     return (
         <div className="status-dashboard">
             <div className="dashboard-heading">
                 Status Dashboard
             </div>
+            {batchId && batch && (
+                <div className="batch-summary">
+                    Batch: {batch.counts.completed} completed, {batch.counts.failed} failed of {batch.total} ({batch.progress}%)
+                </div>
+            )}
 
             <TableContainer style={{ borderRadius: 16, overflow: 'hidden' }}>
                 <Table aria-label="document status table" size="small">
@@ -21,7 +52,7 @@ const StatusDashboard = ({ files }) => {
                         </TableRow>
                     </TableHead>
                     <TableBody>
-                        {files.map((f, idx) => (
+                        {rows.map((f, idx) => (
                             <TableRow key={f.name + idx}>
                                 <TableCell style={{ fontSize: '0.85rem', color: '#222', fontWeight: 600 }}>{f.name}</TableCell>
                                 <TableCell style={{ fontSize: '0.85rem', color: '#6c757d' }}>{f.type || (f.result?.metadata?.is_scanned !== undefined ? (f.result.metadata.is_scanned ? 'Scanned PDF' : 'Digital') : '--')}</TableCell>
@@ -29,7 +60,7 @@ const StatusDashboard = ({ files }) => {
                                 <TableCell style={{ fontSize: '0.85rem' }}>
                                     {f.status === 'Completed' && <span style={{color: '#388e3c', fontWeight: 500}}>✅ Completed</span>}
                                     {f.status === 'Failed' && <span style={{color: '#d32f2f', fontWeight: 500}}>❌ Failed</span>}
-                                    {(f.status === 'Processing' || f.status === 'Started' || f.status === 'Uploading' || f.status === 'Extracting' || f.status === 'Extracted') && <span style={{color: '#856404', fontWeight: 500}}>🟡 In-Progress</span>}
+                                    {(f.status === 'Processing' || f.status === 'Started' || f.status === 'Queued' || f.status === 'Uploading' || f.status === 'Extracting' || f.status === 'Extracted') && <span style={{color: '#856404', fontWeight: 500}}>🟡 In-Progress</span>}
                                 </TableCell>
                                 <TableCell style={{ fontSize: '0.85rem' }}>
                                     {f.status === 'Completed' ? '100%' : f.status === 'Failed' ? '❌' : `${f.progress}%`}